@@ -0,0 +1,125 @@
+# benchmarks/api.py
+"""
+Validation API: request throughput and latency before/after typed models
+and orjson.
+
+"before" is the previous endpoint (payload: List[dict], nested dicts
+serialized by FastAPI's default encoder, BaseHTTPMiddleware latency
+middleware); "after" is invoice_qc.api's /validate-json, once without and
+once with gzip negotiated. Requests go through the ASGI app in-process
+(httpx.ASGITransport), one at a time, so the numbers are server-side
+cost without network noise.
+
+    python -m benchmarks.api --sizes 1,100,10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import List
+
+import httpx
+from fastapi import FastAPI, Request
+
+from benchmarks.validation import make_records
+
+# same conditions for both apps: no metrics middleware work, no dup index
+os.environ["INVOICE_QC_METRICS"] = "0"
+os.environ.pop("INVOICE_QC_DUP_INDEX", None)
+
+from invoice_qc import api, metrics, validator  # noqa: E402
+
+
+def legacy_app():
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def record_latency(request: Request, call_next):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            metrics.observe(
+                "http_request_duration_seconds", time.perf_counter() - start,
+                method=request.method, route=getattr(route, "path", "unmatched"), status=status,
+            )
+
+    @app.post("/validate-json")
+    def validate_json(payload: List[dict]):
+        return validator.validate_invoices(payload)
+
+    return app
+
+
+def _requests_for(size):
+    # roughly the same amount of work per size
+    return max(10, min(500, 200_000 // max(size, 1) // 10))
+
+
+async def _run(app, body, count, accept_encoding):
+    transport = httpx.ASGITransport(app=app)
+    headers = {"content-type": "application/json", "accept-encoding": accept_encoding}
+    latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # warm-up (route setup, parser memos)
+        await client.post("/validate-json", content=body, headers=headers)
+        for _ in range(count):
+            start = time.perf_counter()
+            response = await client.post("/validate-json", content=body, headers=headers)
+            await response.aread()
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise SystemExit(f"HTTP {response.status_code}: {response.text[:200]}")
+    return latencies
+
+
+def _p99(latencies):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the validation API before/after")
+    parser.add_argument("--sizes", default="1,100,10000", help="Invoices per request, comma separated")
+    parser.add_argument("--requests", type=int, help="Requests per run (default: scaled by size)")
+    parser.add_argument("--results", help="Also write the numbers to this JSON file")
+    args = parser.parse_args()
+
+    variants = [
+        ("before", legacy_app(), "identity"),
+        ("after", api.app, "identity"),
+        ("after+gzip", api.app, "gzip"),
+    ]
+    rows = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        body = json.dumps(make_records(size, seed=size)).encode()
+        count = args.requests or _requests_for(size)
+        for name, app, encoding in variants:
+            latencies = asyncio.run(_run(app, body, count, encoding))
+            row = {
+                "invoices": size,
+                "variant": name,
+                "requests": count,
+                "req_per_sec": count / sum(latencies),
+                "p50_ms": statistics.median(latencies) * 1000,
+                "p99_ms": _p99(latencies) * 1000,
+            }
+            rows.append(row)
+            print(f"{size:>6} invoices  {name:11s} {row['req_per_sec']:9.1f} req/s  "
+                  f"p50 {row['p50_ms']:9.2f} ms  p99 {row['p99_ms']:9.2f} ms")
+
+    if args.results:
+        with open(args.results, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+# benchmarks/dupindex.py
+"""
+Duplicate index lookup + insert cost per batch as the index grows.
+
+Feeds random 64 bit keys into an invoice_qc.dupindex file in batches
+(each batch re-sends a few keys from earlier ones) and prints the time
+of the bulk lookup and insert every few batches, so a slowdown with
+size shows up directly.
+
+    python -m benchmarks.dupindex --keys 20000000 --batch-size 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from invoice_qc.dupindex import DuplicateIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the persistent duplicate index")
+    parser.add_argument("--keys", type=int, default=10_000_000)
+    parser.add_argument("--batch-size", type=int, default=100_000)
+    parser.add_argument("--resent", type=float, default=0.01,
+                        help="Share of each batch copied from earlier batches")
+    parser.add_argument("--path", help="Index file (default: a temp file, removed afterwards)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    tmp = None
+    path = args.path
+    if path is None:
+        tmp = tempfile.mkdtemp()
+        path = os.path.join(tmp, "dupindex.sqlite")
+
+    batches = max(1, args.keys // args.batch_size)
+    report_every = max(1, batches // 10)
+    earlier = []
+    index = DuplicateIndex(path)
+    try:
+        for n in range(batches):
+            keys = [rnd.getrandbits(64) - (1 << 63) for _ in range(args.batch_size)]
+            resent = min(len(earlier), int(args.batch_size * args.resent))
+            keys[:resent] = rnd.sample(earlier, resent)
+            earlier = keys[resent:resent + 1000]
+
+            start = time.perf_counter()
+            found = index.seen_elsewhere(keys, f"batch-{n}")
+            looked_up = time.perf_counter()
+            index.add(keys, f"batch-{n}")
+            done = time.perf_counter()
+
+            if n % report_every == 0 or n == batches - 1:
+                print(f"{(n + 1) * args.batch_size:>12,} keys  "
+                      f"lookup {looked_up - start:6.2f}s  insert {done - looked_up:6.2f}s  "
+                      f"found {len(found):>6}/{resent}")
+        size = os.path.getsize(path)
+        print(f"index file: {size / 2**20:.0f} MB ({size / index.stats()['keys']:.1f} bytes/key)")
+    finally:
+        index.close()
+        if tmp is not None:
+            for name in os.listdir(tmp):
+                os.remove(os.path.join(tmp, name))
+            os.rmdir(tmp)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
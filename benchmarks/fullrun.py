@@ -0,0 +1,100 @@
+# benchmarks/fullrun.py
+"""
+full-run end to end: two steps vs the fused pipeline.
+
+Runs, in fresh processes, on one corpus (generated with benchmarks.synth
+unless --pdf-dir is given):
+
+  two-step     `extract --output` then `validate --input` (what full-run
+               did before pipeline.py: output JSON written, read back)
+  fused+json   `full-run --output-json` (records written on the way)
+  fused        `full-run` without --output-json (nothing but the report)
+
+and reports the best wall time of --runs runs and the bytes each writes.
+The reports must be identical. --cache runs every variant on a warm
+extraction cache, where extraction is nearly free and the JSON round
+trip is most of the work.
+
+    python -m benchmarks.fullrun --count 300 --workers 2
+"""
+import argparse
+import filecmp
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import synth
+
+
+def _run(argv):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-m", "invoice_qc.cli"] + argv, capture_output=True,
+                          text=True, env=dict(os.environ, PYTHONPATH="."))
+    if proc.returncode not in (0, 4):
+        raise SystemExit(f"{' '.join(argv[:1])} failed ({proc.returncode}):\n{proc.stdout[-2000:]}{proc.stderr[-2000:]}")
+    return time.perf_counter() - start
+
+
+def _size(*paths):
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark full-run, two steps vs fused")
+    parser.add_argument("--pdf-dir", help="Existing corpus (default: generate one)")
+    parser.add_argument("--count", type=int, default=300)
+    parser.add_argument("--pages", default="1-3")
+    parser.add_argument("--items", default="1-20")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--cache", action="store_true", help="Run on a warm extraction cache")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--results", help="Also write the numbers to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="invoice-fullrun-") as tmp:
+        pdf_dir = args.pdf_dir
+        if not pdf_dir:
+            pdf_dir = os.path.join(tmp, "pdfs")
+            synth.generate(pdf_dir, args.count, args.pages, args.items, error_rate=0.1)
+        extract = ["--workers", str(args.workers)]
+        if args.cache:
+            extract += ["--cache", os.path.join(tmp, "cache.sqlite")]
+            _run(["extract", "--pdf-dir", pdf_dir, "--output", os.path.join(tmp, "warm.json")] + extract)
+
+        output = os.path.join(tmp, "output.json")
+        variants = {
+            "two-step": [["extract", "--pdf-dir", pdf_dir, "--output", output] + extract,
+                         ["validate", "--input", output, "--report", os.path.join(tmp, "two-step.json")]],
+            "fused+json": [["full-run", "--pdf-dir", pdf_dir, "--output-json", output,
+                            "--report", os.path.join(tmp, "fused+json.json")] + extract],
+            "fused": [["full-run", "--pdf-dir", pdf_dir, "--report", os.path.join(tmp, "fused.json")] + extract],
+        }
+        numbers = {}
+        for name, commands in variants.items():
+            best = min(sum(_run(argv) for argv in commands) for _ in range(args.runs))
+            report = os.path.join(tmp, name + ".json")
+            written = _size(report) + (_size(output) if name != "fused" else 0)
+            numbers[name] = {"wall_seconds": round(best, 3), "bytes_written": written}
+            if os.path.exists(output):
+                os.remove(output)
+        same = all(filecmp.cmp(os.path.join(tmp, "two-step.json"), os.path.join(tmp, n + ".json"),
+                               shallow=False) for n in ("fused+json", "fused"))
+
+    base = numbers["two-step"]["wall_seconds"]
+    for name, n in numbers.items():
+        print(f"{name:<11} {n['wall_seconds']:7.2f} s  {base / n['wall_seconds']:5.2f}x  "
+              f"{n['bytes_written'] / 1e6:7.2f} MB written")
+    print("reports identical" if same else "REPORTS DIFFER")
+
+    if args.results:
+        with open(args.results, "w", encoding="utf-8") as f:
+            json.dump({"workers": args.workers, "cache": args.cache, "variants": numbers,
+                       "identical": same}, f, indent=2)
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
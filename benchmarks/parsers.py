@@ -0,0 +1,114 @@
+# benchmarks/parsers.py
+"""
+Micro-benchmark: invoice_qc.utils parse_amount / parse_date against the
+previous implementations (strptime loop, regex strip + replace(",", "")).
+
+Two workloads per parser:
+  repetitive  values drawn from a small pool, like a real batch
+  unique      (almost) every value distinct, so the memo never hits
+
+    python -m benchmarks.parsers --count 200000
+"""
+from datetime import datetime
+import argparse
+import random
+import re
+import sys
+import time
+
+from invoice_qc import utils
+
+
+# ---------------- previous implementations ----------------
+
+def legacy_parse_date(value):
+    if not value:
+        return None
+    value = str(value).strip()
+    for fmt in utils.DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+def legacy_parse_amount(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    s = re.sub(r"[^\d.\-,]", "", str(value)).replace(",", "").strip()
+    if s == "":
+        return None
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+# ---------------- workloads ----------------
+
+def _amount(rnd):
+    cents = rnd.randint(0, 10_000_000)
+    euros, rest = divmod(cents, 100)
+    kind = rnd.randrange(4)
+    if kind == 0:
+        return f"{euros:,}.{rest:02d}"                                    # 1,234.56
+    if kind == 1:
+        return f"{euros:,}".replace(",", ".") + f",{rest:02d}"           # 1.234,56
+    if kind == 2:
+        return f"{euros}.{rest:02d}"                                      # 1234.56
+    return f"{euros},{rest:02d} EUR"                                      # 1234,56 EUR
+
+
+def _date(rnd):
+    day = datetime(2020, 1, 1).toordinal() + rnd.randrange(2000)
+    fmt = rnd.choice(utils.DATE_FORMATS)
+    return datetime.fromordinal(day).strftime(fmt)
+
+
+def workloads(count, seed=0):
+    rnd = random.Random(seed)
+    amount_pool = [_amount(rnd) for _ in range(500)]
+    date_pool = [_date(rnd) for _ in range(300)]
+    return {
+        "amount/repetitive": [rnd.choice(amount_pool) for _ in range(count)],
+        "amount/unique": [_amount(rnd) for _ in range(count)],
+        "date/repetitive": [rnd.choice(date_pool) for _ in range(count)],
+        "date/unique": [_date(rnd) for _ in range(count)],
+    }
+
+
+def _time(func, values):
+    start = time.perf_counter()
+    for v in values:
+        func(v)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark amount/date parsers against the previous versions")
+    parser.add_argument("--count", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    pairs = {
+        "amount": (legacy_parse_amount, utils.parse_amount),
+        "date": (legacy_parse_date, utils.parse_date),
+    }
+    slower = False
+    for name, values in workloads(args.count, args.seed).items():
+        old, new = pairs[name.split("/")[0]]
+        utils._amount_memo.clear()
+        utils._parse_date_str.cache_clear()
+        t_old = _time(old, values)
+        t_new = _time(new, values)
+        slower |= t_new >= t_old
+        print(f"{name:18s} old {t_old / len(values) * 1e9:8.0f} ns/call  "
+              f"new {t_new / len(values) * 1e9:8.0f} ns/call  {t_old / t_new:5.1f}x")
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+# benchmarks/resultcache.py
+"""
+Validation result cache: the same batch validated without the cache, on
+a cold cache (every invoice a miss, results written to SQLite), from
+SQLite only (as another worker process would see it: empty memory
+layer) and from memory. Connection setup is not timed.
+
+    python -m benchmarks.resultcache --sizes 1,20,500
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.validation import make_records
+from invoice_qc import validator
+from invoice_qc.resultcache import ValidationCache
+
+
+def _time(fn, repeats, setup=None):
+    best = float("inf")
+    for _ in range(repeats):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the validation result cache")
+    parser.add_argument("--sizes", default="1,20,500", help="Invoices per batch, comma separated")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--results", help="Also write the numbers to this JSON file")
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(s) for s in args.sizes.split(",")):
+            invoices = make_records(size, seed=size)
+            path = os.path.join(tmp, f"cache-{size}.sqlite")
+
+            fresh = iter(range(10 ** 9))
+            cache = ValidationCache(path)
+            validator.validate_invoices(invoices, result_cache=cache)
+
+            def new_file(_=None):
+                return ValidationCache(os.path.join(tmp, f"cold-{size}-{next(fresh)}.sqlite"))
+
+            def memory_cleared(_=None):
+                cache._memory.clear()
+                return cache
+
+            timings = {
+                "no_cache": _time(lambda _: validator.validate_invoices(invoices), args.repeats),
+                "cold": _time(lambda c: validator.validate_invoices(invoices, result_cache=c),
+                              args.repeats, new_file),
+                "sqlite_hit": _time(lambda c: validator.validate_invoices(invoices, result_cache=c),
+                                    args.repeats, memory_cleared),
+                "memory_hit": _time(lambda _: validator.validate_invoices(invoices, result_cache=cache),
+                                    args.repeats),
+            }
+            cache.close()
+            row = {"invoices": size}
+            row.update({k: v * 1000 for k, v in timings.items()})
+            rows.append(row)
+            print(f"{size:>6} invoices  " + "  ".join(
+                f"{k} {v * 1e3:8.3f} ms" for k, v in timings.items()))
+
+    if args.results:
+        with open(args.results, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+# benchmarks/startup.py
+"""
+Cold start of `invoice-qc validate`, with a budget.
+
+Runs `python -X importtime -m invoice_qc.cli validate ...` on a small
+input several times in fresh interpreters and reports, for the fastest
+run:
+
+  imports   time spent importing modules after interpreter start-up
+            (everything -X importtime lists after `site`)
+  wall      whole process time, minus a bare `python -c pass`
+
+and the modules that cost the most. Exits 1 when imports go over
+--budget-ms or when validate imports something it never needs (the
+extractor, PDF engines, multiprocessing, SQLite, FastAPI), so a stray
+module-level import shows up in CI instead of in every cron run.
+
+    python -m benchmarks.startup --budget-ms 15
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.validation import make_records
+
+# validate never needs these; importing one is a regression whatever the time
+FORBIDDEN = ("invoiceextractor", "pdfplumber", "pdfminer", "pypdfium2", "multiprocessing",
+             "concurrent.futures", "sqlite3", "fastapi", "uvicorn", "pydantic")
+
+
+def parse_importtime(stderr):
+    """[(module, self µs)] for the modules imported after `site`, in import order."""
+    modules = []
+    after_site = False
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # the header line
+        name = name.strip()
+        if after_site:
+            modules.append((name, int(self_us)))
+        elif name == "site":
+            after_site = True
+    return modules
+
+
+def _run(argv):
+    start = time.perf_counter()
+    proc = subprocess.run(argv, capture_output=True, text=True, env=dict(os.environ, PYTHONPATH="."))
+    return time.perf_counter() - start, proc
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the validate cold start")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--budget-ms", type=float, default=15.0,
+                        help="Fail when module imports take longer than this")
+    parser.add_argument("--results", help="Also write the numbers to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "invoices.json")
+        with open(input_path, "w", encoding="utf-8") as f:
+            json.dump(make_records(20, seed=1), f)
+        command = [sys.executable, "-X", "importtime", "-m", "invoice_qc.cli", "validate",
+                   "--input", input_path, "--report", os.path.join(tmp, "report.json")]
+
+        bare = min(_run([sys.executable, "-c", "pass"])[0] for _ in range(args.runs))
+        best = None
+        for _ in range(args.runs):
+            wall, proc = _run(command)
+            if proc.returncode not in (0, 4):
+                raise SystemExit(f"validate failed ({proc.returncode}):\n{proc.stderr[-2000:]}")
+            modules = parse_importtime(proc.stderr)
+            imports = sum(us for _, us in modules) / 1000
+            if best is None or imports < best[0]:
+                best = (imports, wall, modules)
+
+    imports, wall, modules = best
+    names = {name for name, _ in modules}
+    forbidden = sorted(n for n in names if n.split(".")[0] in FORBIDDEN or n in FORBIDDEN)
+    print(f"validate cold start: imports {imports:.1f} ms (budget {args.budget_ms:g} ms), "
+          f"wall {wall * 1000:.1f} ms ({(wall - bare) * 1000:.1f} ms over a bare interpreter), "
+          f"{len(modules)} modules")
+    for name, us in sorted(modules, key=lambda m: -m[1])[:10]:
+        print(f"  {us / 1000:7.2f} ms  {name}")
+
+    if args.results:
+        with open(args.results, "w", encoding="utf-8") as f:
+            json.dump({"imports_ms": imports, "wall_ms": wall * 1000, "bare_ms": bare * 1000,
+                       "budget_ms": args.budget_ms, "modules": len(modules),
+                       "forbidden": forbidden}, f, indent=2)
+
+    failed = False
+    if forbidden:
+        print(f"FAIL: validate imports {', '.join(forbidden)}")
+        failed = True
+    if imports > args.budget_ms:
+        print(f"FAIL: imports take {imports:.1f} ms, over the {args.budget_ms:g} ms budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
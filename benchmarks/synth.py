@@ -0,0 +1,277 @@
+# benchmarks/synth.py
+"""
+Synthetic invoice corpus generator.
+
+Writes German purchase-order PDFs in the same layout as samplespdf/
+(AUFNR order number, Kundenanschrift box, line-item table, Gesamtwert EUR
+totals) without any PDF library: pages use the built-in Helvetica font,
+so every backend can read them.
+
+    python -m benchmarks.synth --out /tmp/corpus --count 10000 --pages 1-5 --items 2-40 --error-rate 0.1
+
+Besides the PDFs a truth.json is written with the fields each invoice was
+generated with and the error (if any) that was injected.
+
+--combined NAME writes every invoice into the one PDF NAME instead, one
+order after the other (what suppliers send for bulk orders); truth.json
+then has each invoice's page range.
+"""
+from datetime import date, timedelta
+from pathlib import Path
+import argparse
+import json
+import random
+
+PAGE_WIDTH = 595.275
+PAGE_HEIGHT = 841.889
+FONT_SIZE = 9
+LINE_HEIGHT = 12
+TOP = 40
+BOTTOM = 800
+
+VENDORS = ["ABC Corporation", "ERT Corporation", "Nordlicht Handel GmbH", "Rheinwerk AG", "Alpen Logistik KG"]
+BUYERS = ["Beispielname Unternehmen", "Beispiel Bergbauunternehmen", "Musterklinik Süd", "Stadtwerke Beispielstadt"]
+STREETS = ["Albertus-Magnus-Str. 8", "Cranachstr. 958", "Industriestraße 3", "Hauptstraße 12", "Am Markt 1"]
+CITIES = ["Matternfeld, SL 44624", "Alt Eileendorf, ST 27780", "12345 Köln", "80000 München", "20095 Hamburg"]
+ARTICLES = ["Sterilisationsmittel", "Bohrmaschine", "Bergmannshelm mit Fackeln", "Schaufeln",
+            "Einweghandschuhe", "Kabeltrommel 50m", "Sicherheitsschuhe Gr. 43", "Desinfektionstücher"]
+UNITS = [("VE", "1 VE=20 Stück"), ("VE", "1 VE=600 Stück"), ("ST", "1 ST=1 Stück"), ("KAR", "1 KAR=12 Stück")]
+
+ERROR_KINDS = ["missing_number", "bad_date", "totals_mismatch", "duplicate"]
+
+# x positions (points) of the line-item columns
+COL_POS, COL_DESC, COL_QTY, COL_UNIT, COL_CONV, COL_VALUE = 28, 60, 300, 338, 375, 500
+
+
+def fmt_eur(value):
+    """1080.0 -> '1.080,00'"""
+    return f"{value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+class _Page:
+    def __init__(self):
+        self.ops = []
+        self.y = TOP
+
+    def text(self, x, y, s):
+        raw = _escape(s).encode("cp1252", "replace").decode("latin-1")
+        # PDF origin is bottom left
+        self.ops.append(f"BT /F1 {FONT_SIZE} Tf {x:.2f} {PAGE_HEIGHT - y:.2f} Td ({raw}) Tj ET")
+
+    def row(self, *cells):
+        for x, s in cells:
+            self.text(x, self.y, s)
+        self.y += LINE_HEIGHT
+
+
+def write_pdf(path, pages):
+    """Serialise _Page objects into a minimal PDF file."""
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font = add("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    pages_id = len(objects) + 2 * len(pages) + 1
+    kids = []
+    for page in pages:
+        stream = "\n".join(page.ops).encode("latin-1")
+        content = add(f"<< /Length {len(stream)} >>\nstream\n".encode("latin-1") + stream + b"\nendstream")
+        kids.append(add(
+            f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}]"
+            f" /Resources << /Font << /F1 {font} 0 R >> >> /Contents {content} 0 R >>"
+        ))
+    add(f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>")
+    catalog = add(f"<< /Type /Catalog /Pages {pages_id} 0 R >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        if isinstance(body, str):
+            body = body.encode("latin-1")
+        out += f"{i} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for off in offsets:
+        out += f"{off:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root {catalog} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    Path(path).write_bytes(bytes(out))
+
+
+def make_invoice(rng, number, min_items, max_items):
+    """Random invoice fields (amounts as floats, German strings built later)."""
+    items = []
+    for pos in range(1, rng.randint(min_items, max_items) + 1):
+        qty = rng.randint(1, 20)
+        unit_price = round(rng.uniform(2, 400), 2)
+        unit, conv = rng.choice(UNITS)
+        items.append({
+            "pos": pos,
+            "description": rng.choice(ARTICLES),
+            "quantity": qty,
+            "unit": unit,
+            "conversion": conv,
+            "unit_price": unit_price,
+            "line_total": round(qty * unit_price, 2),
+        })
+    subtotal = round(sum(li["line_total"] for li in items), 2)
+    tax = round(subtotal * 0.19, 2)
+    return {
+        "invoice_number": f"AUFNR{number}",
+        "invoice_date": (date(2024, 1, 1) + timedelta(days=rng.randint(0, 700))).strftime("%d.%m.%Y"),
+        "seller_name": rng.choice(VENDORS),
+        "buyer_name": rng.choice(BUYERS),
+        "buyer_street": rng.choice(STREETS),
+        "buyer_city": rng.choice(CITIES),
+        "line_items": items,
+        "subtotal": subtotal,
+        "tax_amount": tax,
+        "total_amount": round(subtotal + tax, 2),
+    }
+
+
+def inject_error(rng, inv, kind, previous):
+    if kind == "missing_number":
+        inv["invoice_number"] = ""
+    elif kind == "bad_date":
+        inv["invoice_date"] = f"{rng.randint(32, 39)}.{rng.randint(13, 19)}.2024"
+    elif kind == "totals_mismatch":
+        inv["total_amount"] = round(inv["total_amount"] + rng.uniform(5, 500), 2)
+    elif kind == "duplicate" and previous is not None:
+        inv["invoice_number"] = previous["invoice_number"]
+        inv["invoice_date"] = previous["invoice_date"]
+        inv["seller_name"] = previous["seller_name"]
+
+
+def render(inv, min_pages):
+    """Lay the invoice out on as many pages as the items need (at least min_pages)."""
+    pages = [_Page()]
+    p = pages[0]
+    p.y = TOP + LINE_HEIGHT
+    number = inv["invoice_number"] or "ohne Nummer"
+    p.row((28, f"{inv['seller_name']} Bestellung {number} im Auftrag von 3498578433"))
+    p.row((28, inv["buyer_name"]))
+    p.row((28, f"{inv['buyer_name']} · {inv['buyer_street']}, {inv['buyer_city']}"), (432, "Kundenanschrift"))
+    p.row((28, inv["buyer_name"]))
+    p.row((28, inv["buyer_street"]))
+    p.row((28, inv["buyer_city"]))
+    p.row((28, "Deutschland"))
+    p.y += LINE_HEIGHT
+    p.row((28, "Ihre Faxnummer: 0800-12646711"))
+    p.row((96, f"Bestellung {number} vom {inv['invoice_date']}"))
+    p.row((28, "Unsere Kundennummer"), (150, "Unser(e) Einkäufer(in)"), (300, "Telefon für Rückfragen"))
+    p.row((28, "11223344"), (150, "Beispielname"), (300, "060/1212121"))
+    p.row((28, "Zahlungsbedingungen"))
+    p.row((28, "0 Tage 2,0% Skonto"))
+    p.y += LINE_HEIGHT
+
+    def table_header(page):
+        page.row((COL_POS, "Pos."), (COL_DESC, "Artikelbeschreibung"), (240, "Preis in"),
+                 (COL_QTY, "Menge"), (COL_UNIT, "Einheit"), (COL_CONV, "Umrechnung"), (COL_VALUE, "Bestellwert"))
+        page.row((240, "EUR"), (COL_VALUE, "in EUR"))
+
+    table_header(p)
+    items = inv["line_items"]
+    per_page = max(1, -(-len(items) // min_pages)) if min_pages > 1 else len(items) or 1
+    on_page = 0
+    for li in items:
+        if p.y + 4 * LINE_HEIGHT > BOTTOM or (min_pages > 1 and on_page >= per_page and len(pages) < min_pages):
+            p = _Page()
+            pages.append(p)
+            p.y = TOP + LINE_HEIGHT
+            table_header(p)
+            on_page = 0
+        p.row((COL_POS, str(li["pos"])), (COL_DESC, li["description"]), (COL_QTY, str(li["quantity"])),
+              (COL_UNIT, li["unit"]), (COL_CONV, li["conversion"]), (COL_VALUE, fmt_eur(li["line_total"])))
+        p.row((COL_DESC, f"Lief.Art.Nr: 000{li['pos']:06d}M"))
+        price = f"{li['unit_price']:.4f}".replace(".", ",")
+        p.row((COL_DESC, f"Interne Mat.Nr: 4{li['pos']:04d} {price} pro 1 {li['unit']}"))
+        on_page += 1
+
+    while len(pages) < min_pages:
+        pages.append(_Page())
+        pages[-1].y = TOP + LINE_HEIGHT
+    p = pages[-1]
+    if p.y + 4 * LINE_HEIGHT > BOTTOM:
+        p = _Page()
+        p.y = TOP + LINE_HEIGHT
+        pages.append(p)
+    p.y += LINE_HEIGHT
+    p.row((217, "Gesamtwert EUR"), (COL_VALUE, fmt_eur(inv["subtotal"])))
+    p.row((217, "MwSt. 19,00% EUR"), (COL_VALUE, fmt_eur(inv["tax_amount"])))
+    p.row((217, "Gesamtwert inkl. MwSt. EUR"), (COL_VALUE, fmt_eur(inv["total_amount"])))
+
+    for i, page in enumerate(pages, start=1):
+        page.text(495, TOP - 20 + LINE_HEIGHT, f"Seite {i} von {len(pages)}")
+    return pages
+
+
+def _range(value):
+    lo, _, hi = str(value).partition("-")
+    return int(lo), int(hi or lo)
+
+
+def generate(out_dir, count, pages="1", items="1-10", error_rate=0.0, seed=0, combined=None):
+    """
+    Write `count` invoices to out_dir and return the truth records.
+    pages / items are "N" or "MIN-MAX" ranges; combined names a single
+    PDF to write them all into.
+    """
+    rng = random.Random(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    min_pages, max_pages = _range(pages)
+    min_items, max_items = _range(items)
+
+    truth = []
+    previous = None
+    width = len(str(count))
+    all_pages = []
+    for n in range(count):
+        inv = make_invoice(rng, 10000 + n, min_items, max_items)
+        error = None
+        if rng.random() < error_rate:
+            error = rng.choice(ERROR_KINDS)
+            inject_error(rng, inv, error, previous)
+        pages_out = render(inv, rng.randint(min_pages, max_pages))
+        if combined:
+            record = {"filename": combined, "pages": [len(all_pages) + 1, len(all_pages) + len(pages_out)]}
+            all_pages.extend(pages_out)
+        else:
+            record = {"filename": f"synthetic_{n:0{width}d}.pdf"}
+            write_pdf(out_dir / record["filename"], pages_out)
+        truth.append({**record, "injected_error": error, **inv})
+        previous = inv
+    if combined:
+        write_pdf(out_dir / combined, all_pages)
+
+    with open(out_dir / "truth.json", "w", encoding="utf-8") as f:
+        json.dump(truth, f, indent=2, ensure_ascii=False)
+    return truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic German invoice PDFs")
+    parser.add_argument("--out", required=True, help="Output folder")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--pages", default="1", help="Pages per invoice, N or MIN-MAX")
+    parser.add_argument("--items", default="1-10", help="Line items per invoice, N or MIN-MAX")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of invoices with an injected error")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--combined", metavar="NAME", help="Write all invoices into this one PDF")
+    args = parser.parse_args()
+
+    truth = generate(args.out, args.count, args.pages, args.items, args.error_rate, args.seed,
+                     args.combined)
+    errors = sum(1 for t in truth if t["injected_error"])
+    print(f"Wrote {len(truth)} invoices ({errors} with injected errors) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# benchmarks/throughput.py
+"""
+Pipeline throughput benchmark.
+
+Measures the three stages separately on a corpus of PDFs (generated with
+benchmarks.synth unless --pdf-dir is given):
+
+  extract_text     per document
+  extract_fields   per document
+  validate         validate_single_invoice per document, plus one
+                   validator.validate_invoices call over the whole batch
+
+For every stage it reports docs/sec, p50/p95/p99 latency and the peak RSS
+of the process after the stage, and writes them to a JSON file so runs can
+be compared.
+
+    python -m benchmarks.throughput --count 1000 --pages 1-4 --items 2-40 --results bench_results.json
+"""
+from pathlib import Path
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+
+from benchmarks import synth
+from invoice_qc import validator
+from invoiceextractor.backends import DEFAULT_BACKEND
+from invoiceextractor.extractor import extract_fields, extract_text
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def stage_stats(latencies, wall):
+    lat = sorted(latencies)
+    return {
+        "docs": len(lat),
+        "wall_seconds": round(wall, 4),
+        "docs_per_sec": round(len(lat) / wall, 2) if wall > 0 else None,
+        "p50_ms": round(percentile(lat, 50) * 1000, 3),
+        "p95_ms": round(percentile(lat, 95) * 1000, 3),
+        "p99_ms": round(percentile(lat, 99) * 1000, 3),
+        "max_ms": round(lat[-1] * 1000, 3) if lat else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _timed(func, items):
+    out, latencies = [], []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        out.append(func(item))
+        latencies.append(time.perf_counter() - t0)
+    return out, stage_stats(latencies, time.perf_counter() - start)
+
+
+def run(pdf_files, backend=None, targeted=False):
+    results = {}
+
+    texts, results["extract_text"] = _timed(
+        lambda p: extract_text(str(p), targeted=targeted, backend=backend), pdf_files
+    )
+    records, results["extract_fields"] = _timed(extract_fields, texts)
+    del texts
+
+    _, results["validate"] = _timed(validator.validate_single_invoice, records)
+    start = time.perf_counter()
+    validator.validate_invoices(records)
+    wall = time.perf_counter() - start
+    results["validate_batch"] = {
+        "docs": len(records),
+        "wall_seconds": round(wall, 4),
+        "docs_per_sec": round(len(records) / wall, 2) if wall > 0 else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark extract_text / extract_fields / validation")
+    parser.add_argument("--pdf-dir", help="Existing corpus (default: generate one)")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--pages", default="1-3")
+    parser.add_argument("--items", default="1-20")
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", help=f"PDF backend (default: {DEFAULT_BACKEND})")
+    parser.add_argument("--targeted", action="store_true")
+    parser.add_argument("--results", default="bench_results.json", help="Machine-readable output")
+    args = parser.parse_args()
+
+    config = {k: v for k, v in vars(args).items() if k != "results"}
+    config["backend"] = args.backend or DEFAULT_BACKEND
+
+    with tempfile.TemporaryDirectory(prefix="invoice-bench-") as tmp:
+        pdf_dir = args.pdf_dir
+        if not pdf_dir:
+            start = time.perf_counter()
+            synth.generate(tmp, args.count, args.pages, args.items, args.error_rate, args.seed)
+            print(f"Generated {args.count} PDFs in {time.perf_counter() - start:.1f}s")
+            pdf_dir = tmp
+        pdf_files = sorted(Path(pdf_dir).glob("*.pdf"))
+        stages = run(pdf_files, backend=args.backend, targeted=args.targeted)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "stages": stages,
+    }
+    with open(args.results, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    for name, st in stages.items():
+        line = f"{name:15s} {st['docs_per_sec'] or 0:10.1f} docs/s"
+        if "p50_ms" in st:
+            line += f"  p50 {st['p50_ms']:.2f} ms  p95 {st['p95_ms']:.2f} ms  p99 {st['p99_ms']:.2f} ms"
+        print(line + f"  peak RSS {st['peak_rss_mb']} MB")
+    print("Results written to", args.results)
+
+
+if __name__ == "__main__":
+    main()
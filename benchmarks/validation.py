@@ -0,0 +1,102 @@
+# benchmarks/validation.py
+"""
+Row-wise vs columnar batch validation.
+
+Builds N extractor-style records (no PDFs involved), validates them with
+the row-wise path (validate_single_invoice + detect_duplicates) and with
+invoice_qc.columnar, checks that both reports are identical and prints
+the time of each.
+
+    python -m benchmarks.validation --count 1000000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from invoice_qc import columnar, validator
+
+
+def make_records(count, error_rate=0.1, seed=0):
+    rnd = random.Random(seed)
+    sellers = [f"Lieferant {i} GmbH" for i in range(200)]
+    buyers = [f"Kunde {i} AG" for i in range(2000)]
+    dates = [f"{d:02d}.{m:02d}.{y}" for y in (2023, 2024) for m in range(1, 13) for d in range(1, 29)]
+
+    records = []
+    for i in range(count):
+        subtotal = rnd.randint(1000, 5_000_000) / 100
+        tax = round(subtotal * 0.19, 2)
+        items = []
+        left = subtotal
+        for _ in range(rnd.randint(1, 5) - 1):
+            part = round(left * rnd.random() / 2, 2)
+            items.append({"line_total": f"{part:.2f}"})
+            left = round(left - part, 2)
+        items.append({"line_total": f"{left:.2f}"})
+
+        rec = {
+            "invoice_number": f"AUFNR{i:08d}",
+            "invoice_date": rnd.choice(dates),
+            "seller_name": rnd.choice(sellers),
+            "buyer_name": rnd.choice(buyers),
+            "currency": "EUR",
+            "subtotal": f"{subtotal:.2f}",
+            "tax_amount": f"{tax:.2f}",
+            "total_amount": f"{subtotal + tax:.2f}",
+            "line_items": items,
+        }
+        if rnd.random() < error_rate:
+            kind = rnd.randrange(4)
+            if kind == 0:
+                rec["invoice_number"] = ""
+            elif kind == 1:
+                rec["invoice_date"] = "2024-13-45"
+            elif kind == 2:
+                rec["total_amount"] = f"{subtotal:.2f}"
+            else:
+                rec["invoice_number"] = records[-1]["invoice_number"] if records else ""
+                rec["seller_name"] = records[-1]["seller_name"] if records else ""
+                rec["invoice_date"] = records[-1]["invoice_date"] if records else ""
+        records.append(rec)
+    return records
+
+
+def row_wise(invoices):
+    # validator.validate_invoices without the columnar switch
+    saved = validator.COLUMNAR_MIN_ROWS
+    validator.COLUMNAR_MIN_ROWS = float("inf")
+    try:
+        return validator.validate_invoices(invoices)
+    finally:
+        validator.COLUMNAR_MIN_ROWS = saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare row-wise and columnar validation")
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    records = make_records(args.count, args.error_rate, args.seed)
+
+    start = time.perf_counter()
+    expected = row_wise(records)
+    row_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    got = columnar.validate_invoices(records)
+    col_seconds = time.perf_counter() - start
+
+    same = json.dumps(got, default=str) == json.dumps(expected, default=str)
+    print(f"records:   {args.count}")
+    print(f"row-wise:  {row_seconds:.2f}s ({args.count / row_seconds:,.0f} invoices/sec)")
+    print(f"columnar:  {col_seconds:.2f}s ({args.count / col_seconds:,.0f} invoices/sec)")
+    print(f"speedup:   {row_seconds / col_seconds:.1f}x, reports identical: {same}")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
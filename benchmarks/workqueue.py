@@ -0,0 +1,143 @@
+# benchmarks/workqueue.py
+"""
+Shared work queue with several local worker processes, one of them killed.
+
+Queues a corpus (generated with benchmarks.synth unless --pdf-dir is
+given) in a fresh store, starts --processes `invoice-qc queue-work
+--drain` processes, SIGKILLs one of them while it holds a lease and lets
+the others finish. Then checks that:
+
+  - every PDF is done exactly once, the killed worker's PDFs after a
+    second claim once its lease ran out
+  - queue-export writes the same records and report as extract + validate
+  - a worker that lost its lease cannot store a result (fencing)
+
+and reports the wall time of one and of --processes worker processes
+(without the kill) next to a plain `extract` of the same corpus.
+
+    python -m benchmarks.workqueue --count 200 --processes 4
+"""
+import argparse
+import filecmp
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import synth
+from invoice_qc.workqueue import WorkQueue
+
+LEASE = 3.0
+
+
+def _cli(*argv, wait=True):
+    command = [sys.executable, "-m", "invoice_qc.cli"] + [str(a) for a in argv]
+    env = dict(os.environ, PYTHONPATH=".")
+    if not wait:
+        return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    proc = subprocess.run(command, env=env, capture_output=True, text=True)
+    if proc.returncode not in (0, 4):
+        raise SystemExit(f"{argv[0]} failed ({proc.returncode}):\n{proc.stdout[-2000:]}{proc.stderr[-2000:]}")
+    return proc
+
+
+def _leased_by(store, pid):
+    conn = sqlite3.connect(store, timeout=60)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM items WHERE status = 'leased' AND worker LIKE ?",
+                            (f"%:{pid}",)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _work(store, processes, kill=False):
+    """Wall seconds to drain the store with `processes` worker processes."""
+    start = time.perf_counter()
+    procs = [_cli("queue-work", "--store", store, "--drain", "--lease", LEASE, wait=False)
+             for _ in range(processes)]
+    killed = None
+    if kill:
+        victim = procs[0]
+        while victim.poll() is None and not _leased_by(store, victim.pid):
+            time.sleep(0.01)
+        if victim.poll() is None:
+            victim.send_signal(signal.SIGKILL)
+            killed = victim.pid
+    for proc in procs:
+        proc.wait()
+    return time.perf_counter() - start, killed
+
+
+def _fencing(tmp):
+    queue = WorkQueue(os.path.join(tmp, "fencing.sqlite"))
+    try:
+        queue.add([os.path.join(tmp, "x.pdf")])
+        (slow, _), = queue.claim("slow", lease_seconds=0.05)
+        time.sleep(0.1)
+        (fast, _), = queue.claim("fast")
+        return not queue.complete(slow, [], []) and queue.complete(fast, [], [])
+    finally:
+        queue.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Work queue with several worker processes")
+    parser.add_argument("--pdf-dir", help="Existing corpus (default: generate one)")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--pages", default="1-3")
+    parser.add_argument("--items", default="1-20")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--results", help="Also write the numbers to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="invoice-queue-") as tmp:
+        pdf_dir = args.pdf_dir
+        if not pdf_dir:
+            pdf_dir = os.path.join(tmp, "pdfs")
+            synth.generate(pdf_dir, args.count, args.pages, args.items, error_rate=0.1)
+        pdf_dir = os.path.abspath(pdf_dir)
+
+        walls = {}
+        start = time.perf_counter()
+        _cli("extract", "--pdf-dir", pdf_dir, "--output", os.path.join(tmp, "expected.json"))
+        walls["extract"] = time.perf_counter() - start
+        _cli("validate", "--input", os.path.join(tmp, "expected.json"),
+             "--report", os.path.join(tmp, "expected-report.json"))
+
+        for name, processes, kill in (("1", 1, False), (str(args.processes), args.processes, False),
+                                      ("killed", args.processes, True)):
+            store = os.path.join(tmp, f"queue-{name}.sqlite")
+            _cli("queue-add", "--store", store, "--pdf-dir", pdf_dir)
+            walls[name], killed = _work(store, processes, kill)
+
+            conn = sqlite3.connect(store)
+            statuses = dict(conn.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall())
+            retried = conn.execute("SELECT COUNT(*) FROM items WHERE attempts > 1").fetchone()[0]
+            conn.close()
+            out = os.path.join(tmp, f"out-{name}.json")
+            report = os.path.join(tmp, f"report-{name}.json")
+            _cli("queue-export", "--store", store, "--output-json", out, "--report", report)
+            same = (filecmp.cmp(out, os.path.join(tmp, "expected.json"), shallow=False)
+                    and filecmp.cmp(report, os.path.join(tmp, "expected-report.json"), shallow=False))
+            print(f"{processes} process(es){' (one killed)' if killed else ''}: {walls[name]:.2f} s, "
+                  f"{statuses}, {retried} claimed again, output {'identical' if same else 'DIFFERS'}")
+            if not same or set(statuses) != {"done"} or (killed and not retried):
+                raise SystemExit("FAIL")
+
+        fenced = _fencing(tmp)
+        print("fencing:", "ok" if fenced else "FAIL")
+
+    print(f"plain extract: {walls['extract']:.2f} s; speed-up with {args.processes} processes: {walls['1'] / walls[str(args.processes)]:.2f}x; "
+          f"with one killed the rest wait up to {LEASE:g} s for its lease to run out")
+    if args.results:
+        with open(args.results, "w", encoding="utf-8") as f:
+            json.dump({"processes": args.processes, "wall_seconds": walls, "fencing": fenced}, f, indent=2)
+    return 0 if fenced else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,37 +1,395 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Any
-import uvicorn
+from fastapi import FastAPI, File, HTTPException, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+from starlette.datastructures import UploadFile as FormFile
+from contextlib import asynccontextmanager
+from typing import List, Optional
+import asyncio
+import json
+import os
+import shutil
+import time
 
-from invoice_qc import validator
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-app = FastAPI(title="Invoice QC API", version="0.1")
+from invoice_qc import metrics, models, validator
+from invoice_qc.jobs import JobRunner, JobStore, iter_result_lines
+from invoice_qc.workpool import BoundedPool, PoolFull
 
-class Invoice(BaseModel):
-   
-    __root__: Any
+
+class FastJSONResponse(Response):
+    """JSON response rendered with orjson when it is installed."""
+    media_type = "application/json"
+
+    def render(self, content):
+        if orjson is not None:
+            try:
+                return orjson.dumps(content, default=str)
+            except TypeError:
+                pass  # e.g. ints beyond 64 bits; the stdlib copes
+        return json.dumps(content, default=str, ensure_ascii=False,
+                          separators=(",", ":")).encode("utf-8")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # start_jobs / stop_workers are defined below, next to the job settings
+    start_jobs()
+    try:
+        yield
+    finally:
+        stop_workers()
+
+
+app = FastAPI(title="Invoice QC API", version="0.1", default_response_class=FastJSONResponse,
+              lifespan=lifespan)
+
+# big reports compress ~10x; small responses are not worth the CPU
+app.add_middleware(GZipMiddleware, minimum_size=16 * 1024, compresslevel=5)
+
+# the API always collects metrics unless INVOICE_QC_METRICS=0
+if os.environ.get("INVOICE_QC_METRICS") != "0":
+    metrics.enable()
+
+# cross-batch duplicate index, the same file the CLI takes as --dup-index
+dup_index = None
+if os.environ.get("INVOICE_QC_DUP_INDEX"):
+    from invoice_qc.dupindex import DuplicateIndex
+    dup_index = DuplicateIndex(os.environ["INVOICE_QC_DUP_INDEX"])
+
+# per-invoice validation results, reused when the same invoice comes again;
+# one SQLite file shared by all API worker processes
+result_cache = None
+if os.environ.get("INVOICE_QC_RESULT_CACHE"):
+    from invoice_qc.resultcache import ValidationCache, DEFAULT_MAX_ENTRIES, DEFAULT_TTL
+    result_cache = ValidationCache(
+        os.environ["INVOICE_QC_RESULT_CACHE"],
+        max_entries=int(os.environ.get("INVOICE_QC_RESULT_CACHE_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        ttl=float(os.environ.get("INVOICE_QC_RESULT_CACHE_TTL", DEFAULT_TTL)),
+    )
+
+# PDF uploads are extracted in worker processes; at most workers + queue
+# documents are accepted at once, beyond that requests get 429.
+# MAX_UPLOAD_BYTES caps a whole multipart request (UploadLimitMiddleware)
+MAX_UPLOAD_BYTES = int(float(os.environ.get("INVOICE_QC_MAX_UPLOAD_MB", "50")) * 1024 * 1024)
+extract_pool = BoundedPool(
+    workers=int(os.environ.get("INVOICE_QC_EXTRACT_WORKERS", "0")) or None,
+    max_queue=int(os.environ["INVOICE_QC_EXTRACT_QUEUE"]) if os.environ.get("INVOICE_QC_EXTRACT_QUEUE") else None,
+)
+
+# batch jobs (jobs.py): state and results on disk, so they survive restarts
+JOBS_DIR = os.environ.get("INVOICE_QC_JOBS_DIR", ".invoice-qc-jobs")
+# {"pdf_dir": ...} jobs may only read folders under this one (off when unset)
+JOBS_PDF_ROOT = os.environ.get("INVOICE_QC_JOBS_PDF_ROOT")
+job_store = None
+job_runner = None
+
+
+class LatencyMiddleware:
+    """
+    http_request_duration_seconds per method, route template and status.
+    Plain ASGI (BaseHTTPMiddleware costs ~0.3 ms per request) and a
+    pass-through when metrics are off.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not metrics.ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            # label by route template, not raw path, to keep label sets small
+            route = scope.get("route")
+            metrics.observe(
+                "http_request_duration_seconds", time.perf_counter() - start,
+                method=scope["method"], route=getattr(route, "path", "unmatched"), status=status,
+            )
+
+
+class UploadLimitMiddleware:
+    """
+    413 for multipart requests over max_bytes: up front when the
+    Content-Length says so, otherwise as soon as the body streamed in so
+    far passes it, so nothing beyond the limit is ever read or spooled.
+    """
+
+    def __init__(self, app, max_bytes):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/"):
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Upload is larger than {self.max_bytes} bytes."
+        length = headers.get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # raised inside the form parser; the exception middleware answers 413
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+app.add_middleware(UploadLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES)
+app.add_middleware(LatencyMiddleware)
+
+def start_jobs():
+    # also resumes jobs a previous run left unfinished
+    global job_store, job_runner
+    job_store = JobStore(JOBS_DIR)
+    job_runner = JobRunner(job_store, workers=int(os.environ.get("INVOICE_QC_JOB_WORKERS", "0")),
+                           dup_index=dup_index, max_archive_bytes=MAX_UPLOAD_BYTES)
+    job_runner.start()
+
+def stop_workers():
+    extract_pool.shutdown()
+    if job_runner is not None:
+        job_runner.stop()
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    status = {"status": "ok", "extract_queue": extract_pool.stats()}
+    if result_cache is not None:
+        status["result_cache"] = result_cache.stats()
+    return status
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus text format."""
+    return PlainTextResponse(metrics.render_prometheus(),
+                             media_type="text/plain; version=0.0.4")
+
+_openapi = app.openapi
+
+def openapi():
+    # the invoice bodies are parsed by hand (models.parse_invoices), so
+    # their schemas have to be added to the generated document
+    if app.openapi_schema is None:
+        schema = _openapi()
+        schema.setdefault("components", {}).setdefault("schemas", {}).update(models.schema_components())
+    return app.openapi_schema
+
+app.openapi = openapi
+
+
+def _parse_request(body, content_type, single_ok=False):
+    try:
+        return models.parse_invoices(body, content_type, single_ok)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False, include_input=False))
+
 
-@app.post("/validate-json")
-def validate_json(payload: List[dict]):
- 
+def _report(invoices, batch):
     try:
-        results = validator.validate_invoices(payload)
+        report = validator.validate_invoices(invoices, dup_index=dup_index, batch=batch,
+                                             result_cache=result_cache)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Validation error: {e}")
-    return results
+    return FastJSONResponse(report)
+
+
+def _validate_request(body, content_type, batch, single_ok=False):
+    # runs in the thread pool: parsing + validating a big batch takes a while
+    return _report(_parse_request(body, content_type, single_ok), batch)
+
+
+# bodies up to this size are validated on the event loop (well under a
+# millisecond); bigger ones go to the thread pool
+INLINE_BODY_BYTES = 16 * 1024
+
+
+async def _validate_async(request, batch, single_ok=False):
+    body = await request.body()
+    content_type = _content_type(request)
+    if len(body) > INLINE_BODY_BYTES or dup_index is not None:
+        return await run_in_threadpool(_validate_request, body, content_type, batch, single_ok)
+    invoices = _parse_request(body, content_type, single_ok)
+    if result_cache is not None and not result_cache.in_memory(invoices):
+        # SQLite lookups and writes stay off the event loop
+        return await run_in_threadpool(_report, invoices, batch)
+    return _report(invoices, batch)
+
+
+def _content_type(request):
+    return request.headers.get("content-type", "application/json").split(";")[0].strip()
+
+
+@app.post("/validate-json", openapi_extra=models.request_body(),
+          responses={200: {"model": models.Report}})
+async def validate_json(request: Request, batch: Optional[str] = None):
+    """Validate a list of invoices (JSON array, or NDJSON with Content-Type application/x-ndjson)."""
+    return await _validate_async(request, batch)
+
+
+@app.post("/validate", openapi_extra=models.request_body(single_ok=True),
+          responses={200: {"model": models.Report}})
+async def validate_body(request: Request, batch: Optional[str] = None):
+    """Like /validate-json, but a single invoice object is accepted too."""
+    return await _validate_async(request, batch, single_ok=True)
+
+
+async def _extract_uploads(files, targeted):
+    try:
+        from invoiceextractor.extractor import extract_bytes
+    except ImportError:
+        raise HTTPException(status_code=503, detail="Extractor is not installed.")
+
+    # counted before any upload is read into memory
+    if len(files) > extract_pool.capacity:
+        raise HTTPException(status_code=413, detail=f"At most {extract_pool.capacity} PDFs per request.")
+    uploads = []
+    for f in files:
+        # the request as a whole is within MAX_UPLOAD_BYTES (UploadLimitMiddleware);
+        # the form parser keeps parts over 1 MB in temp files until here
+        data = await f.read()
+        uploads.append((data, f.filename, {"targeted": True} if targeted else None))
+
+    try:
+        results = extract_pool.submit_many(extract_bytes, uploads)
+    except PoolFull as e:
+        raise HTTPException(status_code=429, detail="Extraction queue is full, retry later.",
+                            headers={"Retry-After": str(e.retry_after)})
+    try:
+        return await asyncio.gather(*results)
+    except Exception as e:
+        # a worker process died; the pool starts fresh ones on the next request
+        raise HTTPException(status_code=503, detail=f"Extraction worker failed: {e}")
+
+
+@app.post("/extract", responses={200: {"model": List[models.Invoice]}})
+async def extract(files: List[UploadFile] = File(...), targeted: bool = False):
+    """Extract fields from uploaded PDFs (spooled by the form parser, parsed in worker processes)."""
+    return FastJSONResponse(await _extract_uploads(files, targeted))
+
+
+@app.post("/extract-and-validate", responses={200: {"model": models.ExtractionReport}})
+async def extract_and_validate(files: List[UploadFile] = File(...), targeted: bool = False,
+                               batch: Optional[str] = None):
+    invoices = await _extract_uploads(files, targeted)
+    # validation runs in the thread pool so the event loop stays free
+    report = await run_in_threadpool(validator.validate_invoices, invoices,
+                                     dup_index=dup_index, batch=batch, result_cache=result_cache)
+    return FastJSONResponse({"invoices": invoices, "report": report})
+
+
+def _job_pdf_dir(body):
+    """The folder of a {"pdf_dir": ...} job, resolved; it must lie under JOBS_PDF_ROOT."""
+    try:
+        spec = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed JSON: {e}")
+    pdf_dir = spec.get("pdf_dir") if isinstance(spec, dict) else None
+    if not isinstance(pdf_dir, str) or not pdf_dir:
+        raise HTTPException(status_code=400, detail="Expecting a list of invoices or {\"pdf_dir\": ...}.")
+    if not JOBS_PDF_ROOT:
+        raise HTTPException(status_code=403, detail="pdf_dir jobs are disabled on this server.")
+    root = os.path.realpath(JOBS_PDF_ROOT)
+    # relative to the root; symlinks and ".." are resolved before the check
+    path = os.path.realpath(os.path.join(root, pdf_dir))
+    if os.path.commonpath([root, path]) != root:
+        raise HTTPException(status_code=403, detail="pdf_dir is outside the folders this server may read.")
+    if not os.path.isdir(path):
+        raise HTTPException(status_code=400, detail="pdf_dir does not exist.")
+    return path
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: Request):
+    """
+    Submit a batch job:
+      application/json     a list of invoices, or {"pdf_dir": "..."} (a folder under
+                           INVOICE_QC_JOBS_PDF_ROOT on this host)
+      application/x-ndjson one invoice per line
+      multipart/form-data  a zip of PDFs in the "archive" field
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+
+    if content_type == "multipart/form-data":
+        # one archive; its size is capped by UploadLimitMiddleware
+        form = await request.form(max_files=1, max_fields=10)
+        archive = form.get("archive")
+        if not isinstance(archive, FormFile):
+            raise HTTPException(status_code=400, detail="Expecting a zip file in the 'archive' field.")
+
+        def write_archive(job_dir):
+            with open(job_dir / "archive.zip", "wb") as f:
+                shutil.copyfileobj(archive.file, f)
+        job_id = await run_in_threadpool(job_store.create, "pdfs", archive.filename, write_archive)
+
+    elif content_type in ("application/json", "application/x-ndjson"):
+        body = await request.body()
+        if content_type == "application/json" and body.lstrip()[:1] == b"{":
+            job_id = await run_in_threadpool(job_store.create, "pdfs", _job_pdf_dir(body))
+        else:
+            # checked with the models like /validate-json: bad input gets 422, not a job
+            invoices = await run_in_threadpool(_parse_request, body, content_type)
+            data = json.dumps(invoices, ensure_ascii=False).encode("utf-8")
+            job_id = await run_in_threadpool(
+                job_store.create, "invoices", None,
+                lambda job_dir: (job_dir / "input.json").write_bytes(data))
+
+    else:
+        raise HTTPException(status_code=415, detail="Use application/json, application/x-ndjson or multipart/form-data.")
+
+    job_runner.notify()
+    return {"id": job_id, "status": "queued"}
+
+
+def _job_or_404(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job.")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status and progress (done of total) of a job; summary once it is done."""
+    return _job_or_404(job_id)
 
 
-@app.post("/validate")
-def validate_body(payload: Any):
-    if isinstance(payload, dict):
-        payload = [payload]
-    if not isinstance(payload, list):
-        raise HTTPException(status_code=400, detail="Expecting a list of invoices or a single invoice dict.")
-    return validator.validate_invoices(payload)
+@app.get("/jobs/{job_id}/results")
+def job_results(job_id: str):
+    """Per-invoice results as NDJSON, streamed while the job is still running."""
+    _job_or_404(job_id)
+    return StreamingResponse(iter_result_lines(job_store, job_id), media_type="application/x-ndjson")
 
 if __name__ == "__main__":
+    # only needed to serve from here; `uvicorn invoice_qc.api:app` imports it itself
+    import uvicorn
     uvicorn.run("invoice_qc.api:app", host="127.0.0.1", port=8000, reload=True)
@@ -143,29 +143,46 @@ Commands:
   short-extract  - extract using default paths
   short-validate - validate using default paths
   short-full     - extract + validate using default paths
+
+  queue-add / queue-work / queue-status / queue-export
+                 - shared work queue for many workers (workqueue.py)
 """
 
 import argparse
+from functools import lru_cache
 import json
 import os
 import sys
 
-from invoice_qc import validator
+# Keep module-level imports light: cron jobs and pipelines start this CLI
+# thousands of times a day. The extractor (multiprocessing, PDF engines),
+# streaming, the duplicate index etc. are imported by the commands that
+# use them. benchmarks/startup.py checks the validate cold start.
+from invoice_qc import metrics, validator
+from invoice_qc.utils import load_invoices
 
-# Try to import extractor
-EXTRACTOR_AVAILABLE = False
-extractor_module = None
-for mod_name in ("invoiceextractor.extractor", "invoice_qc.extractor", "extractor"):
-    try:
-        extractor_module = __import__(mod_name, fromlist=["*"])
-        EXTRACTOR_AVAILABLE = True
-        break
-    except Exception:
-        extractor_module = None
+# tried in order by find_extractor
+EXTRACTOR_MODULES = ("invoiceextractor.extractor", "invoice_qc.extractor", "extractor")
 
 
-def run_extract(pdf_dir: str, output: str):
-    if not EXTRACTOR_AVAILABLE or extractor_module is None:
+@lru_cache(maxsize=None)
+def find_extractor():
+    """The first extractor module that imports (None if none does); looked up once, on first use."""
+    for mod_name in EXTRACTOR_MODULES:
+        try:
+            return __import__(mod_name, fromlist=["*"])
+        except Exception:
+            continue
+    return None
+
+
+def run_extract(pdf_dir: str, output: str, **options):
+    """
+    options (e.g. workers=4) are forwarded to the extractor; only pass
+    the ones the user actually set, so older extractors keep working.
+    """
+    extractor_module = find_extractor()
+    if extractor_module is None:
         print("No extractor module found.")
         return False
 
@@ -174,7 +191,7 @@ def run_extract(pdf_dir: str, output: str):
             func = getattr(extractor_module, fn)
             print(f"Running extractor.{fn}('{pdf_dir}', '{output}')")
             try:
-                func(pdf_dir, output)
+                func(pdf_dir, output, **options)
                 return True
             except Exception as e:
                 print("Extractor error:", e)
@@ -192,80 +209,387 @@ def run_extract(pdf_dir: str, output: str):
     return False
 
 
-def run_validate(input_json: str, report_out: str):
+def run_validate(input_json: str, report_out: str, stream: bool = False,
+                 dup_index: str = None, batch: str = None, rules: str = None):
     if not os.path.exists(input_json):
         print("Input JSON does not exist:", input_json)
         return 2
 
-    with open(input_json, "r", encoding="utf-8") as f:
+    if not _load_rules(rules):
+        return 3
+
+    index = _open_dup_index(dup_index)
+    try:
+        return _validate_into(input_json, report_out, stream, index, batch)
+    finally:
+        if index is not None:
+            index.close()
+
+
+def _load_rules(rules):
+    if rules:
         try:
-            invoices = json.load(f)
-        except Exception as e:
+            validator.use_rules(rules)
+        except (OSError, ValueError) as e:
+            print("Failed to load rules:", e)
+            return False
+    return True
+
+
+def _open_dup_index(dup_index):
+    dup_index = dup_index or os.environ.get("INVOICE_QC_DUP_INDEX")
+    if not dup_index:
+        return None
+    from invoice_qc.dupindex import DuplicateIndex
+    return DuplicateIndex(dup_index)
+
+
+def _validate_into(input_json, report_out, stream, index, batch):
+    if stream:
+        from invoice_qc import streaming
+        try:
+            s = streaming.validate_file(input_json, report_out, dup_index=index, batch=batch)
+        except ValueError as e:
             print("Failed to parse JSON:", e)
             return 3
+        print(f"Total: {s['total_invoices']}, Valid: {s['valid_invoices']}, Invalid: {s['invalid_invoices']}")
+        print_metrics()
+        return 0 if s["invalid_invoices"] == 0 else 4
+
+    try:
+        invoices = load_invoices(input_json)
+    except Exception as e:
+        print("Failed to parse JSON:", e)
+        return 3
 
-    results = validator.validate_invoices(invoices)
+    results = validator.validate_invoices(invoices, dup_index=index, batch=batch)
 
-    with open(report_out, "w", encoding="utf-8") as f:
+    with metrics.timer("serialize_seconds"), open(report_out, "w", encoding="utf-8") as f:
         json.dump(results, f, indent=2, default=str)
 
     
     s = results["summary"]
     print(f"Total: {s['total_invoices']}, Valid: {s['valid_invoices']}, Invalid: {s['invalid_invoices']}")
+    print_metrics()
+    return 0 if s["invalid_invoices"] == 0 else 4
+
+
+def run_full(pdf_dir: str, output: str, report_out: str, stream: bool = False,
+             dup_index: str = None, batch: str = None, rules: str = None, **options):
+    """
+    Extract then validate. Records go from extraction straight into
+    validation (see pipeline.py) and output, if given, is written on the
+    way. --stream and --incremental work on the output file, so they run
+    the extract and validate steps one after the other.
+    """
+    extractor_module = find_extractor()
+    if stream or options.get("incremental") or not hasattr(extractor_module, "iter_extract"):
+        if not output:
+            print("--output-json is needed to extract and validate in two steps.")
+            return 2
+        if not run_extract(pdf_dir, output, **options):
+            print("Extractor step failed.")
+            return 2
+        return run_validate(output, report_out, stream=stream,
+                            dup_index=dup_index, batch=batch, rules=rules)
+
+    if not _load_rules(rules):
+        return 3
+    from invoice_qc import pipeline
+
+    index = _open_dup_index(dup_index)
+    try:
+        results = pipeline.run_full(pdf_dir, report_out, output=output,
+                                    dup_index=index, batch=batch, **options)
+    except pipeline.ExtractionFailed as e:
+        print("Extractor error:", e)
+        print("Extractor step failed.")
+        return 2
+    except Exception as e:
+        print(f"Validation or report step failed: {type(e).__name__}: {e}")
+        return 3
+    finally:
+        if index is not None:
+            index.close()
+
+    s = results["summary"]
+    print(f"Total: {s['total_invoices']}, Valid: {s['valid_invoices']}, Invalid: {s['invalid_invoices']}")
+    print_metrics()
+    return 0 if s["invalid_invoices"] == 0 else 4
+
+
+def print_metrics():
+    """Stage timings collected during this run (only with --metrics)."""
+    if not metrics.ENABLED:
+        return
+    print("Metrics:")
+    for line in metrics.summary_lines():
+        print(line)
+
+
+def add_validate_arguments(p):
+    """Validation options shared by validate and full-run."""
+    p.add_argument("--stream", action="store_true",
+                   help="Validate record by record with flat memory (for huge inputs)")
+    p.add_argument("--dup-index",
+                   help="SQLite duplicate index shared across batches "
+                        "(default: $INVOICE_QC_DUP_INDEX)")
+    p.add_argument("--batch",
+                   help="Batch name recorded in the duplicate index (default: content hash)")
+    p.add_argument("--rules",
+                   help="JSON rule set: required fields, currencies, tolerance, "
+                        "per-seller/currency overrides (default: $INVOICE_QC_RULES)")
+    p.add_argument("--no-near-duplicates", action="store_true",
+                   help="Skip the possible_duplicate check (default: $INVOICE_QC_NEAR_DUPLICATES)")
+
+
+def add_extract_arguments(p):
+    """Extractor tuning options shared by every command that extracts."""
+    p.add_argument("--workers", type=int, default=1,
+                   help="Extraction processes (0 = all cores)")
+    p.add_argument("--format", choices=["json", "ndjson"],
+                   help="Output format (default: from file extension)")
+    p.add_argument("--incremental", action="store_true",
+                   help="Only extract new/modified PDFs and merge into the existing output")
+    p.add_argument("--manifest", help="Incremental manifest path (default: <output>.manifest.json)")
+    add_document_arguments(p)
+    p.add_argument("--quarantine",
+                   help="Quarantine list with --timeout/--max-memory-mb (default: <output>.quarantine.json)")
+
+
+def add_document_arguments(p):
+    """How each PDF is read: the extractor options that also apply to queue workers."""
+    p.add_argument("--cache", help="SQLite extraction cache file (reuses unchanged PDFs)")
+    p.add_argument("--cache-max-mb", type=float, help="Extraction cache size cap in MB")
+    p.add_argument("--targeted", action="store_true",
+                   help="Only lay out the first-page header and the last page of each PDF")
+    p.add_argument("--backend", choices=["pdfplumber", "pypdfium2", "pdfminer"],
+                   help="PDF text engine (default: pypdfium2)")
+    p.add_argument("--split", action="store_true",
+                   help="One record per order for PDFs holding many (page by page, bounded memory)")
+    p.add_argument("--timeout", type=float,
+                   help="Seconds per PDF; slower ones are killed and quarantined")
+    p.add_argument("--max-memory-mb", type=float,
+                   help="Memory per extraction worker; PDFs that need more are killed and quarantined")
+
+
+def extract_options(args):
+    """Collect extractor options from parsed args, skipping defaults."""
+    options = document_options(args)
+    if args.workers != 1:
+        options["workers"] = args.workers
+    if args.format:
+        options["output_format"] = args.format
+    if args.quarantine:
+        options["quarantine_path"] = args.quarantine
+    if args.incremental:
+        options["incremental"] = True
+        if args.manifest:
+            options["manifest_path"] = args.manifest
+    return options
+
+
+def document_options(args):
+    """The add_document_arguments options from parsed args, skipping defaults."""
+    options = {}
+    if args.cache:
+        options["cache_path"] = args.cache
+        if args.cache_max_mb:
+            options["cache_max_mb"] = args.cache_max_mb
+    if args.targeted:
+        options["targeted"] = True
+    if args.backend:
+        options["backend"] = args.backend
+    if args.split:
+        options["split"] = True
+    if args.timeout:
+        options["timeout"] = args.timeout
+    if args.max_memory_mb:
+        options["max_memory_mb"] = args.max_memory_mb
+    return options
+
+
+def run_watch(pdf_dir: str, output: str, interval: float, **options):
+    extractor_module = find_extractor()
+    if extractor_module is None or not hasattr(extractor_module, "watch_folder"):
+        print("Extractor does not support --watch.")
+        return 1
+    options.pop("incremental", None)
+    extractor_module.watch_folder(pdf_dir, output, interval=interval, **options)
+    return 0
+
+
+def run_queue(args):
+    """queue-add / queue-work / queue-status / queue-export (see workqueue.py)."""
+    from invoice_qc import workqueue
+
+    if args.cmd == "queue-add":
+        if not os.path.isdir(args.pdf_dir):
+            print("PDF dir does not exist:", args.pdf_dir)
+            return 2
+        queue = workqueue.WorkQueue(args.store, shared=args.shared)
+        try:
+            added = queue.add_folder(args.pdf_dir)
+            counts = queue.counts()
+        finally:
+            queue.close()
+        print(f"Queued {added} new PDFs ({counts['queued']} queued in {args.store})")
+        return 0
+
+    if not os.path.exists(args.store):
+        print("Queue store does not exist:", args.store)
+        return 2
+
+    if args.cmd == "queue-work":
+        options = {"batch": args.batch, "lease_seconds": args.lease, "max_attempts": args.max_attempts,
+                   "inbox": args.inbox, "drain": args.drain, "rules": args.rules}
+        options.update(document_options(args))
+        failed = workqueue.run_workers(args.store, processes=args.processes, **options)
+        print_metrics()
+        return 1 if failed else 0
+
+    if args.cmd == "queue-status":
+        queue = workqueue.WorkQueue(args.store)
+        try:
+            counts = queue.counts()
+            workers = queue.workers()
+            failed = queue.failed()
+        finally:
+            queue.close()
+        print(", ".join(f"{status}: {counts[status]}" for status in workqueue.STATUSES)
+              + (f" ({counts['expired']} leases expired)" if counts["expired"] else ""))
+        for worker, n in sorted(workers.items()):
+            print(f"  {worker}: {n} leased")
+        for entry in failed:
+            lines = (entry["error"] or "").strip().splitlines()
+            print(f"  failed after {entry['attempts']} attempts: {entry['path']}: {lines[-1] if lines else ''}")
+        return 0
+
+    # queue-export
+    index = _open_dup_index(args.dup_index)
+    try:
+        results = workqueue.export(args.store, args.report, output=args.output_json,
+                                   dup_index=index, batch=args.batch_name)
+    finally:
+        if index is not None:
+            index.close()
+    s = results["summary"]
+    print(f"Total: {s['total_invoices']}, Valid: {s['valid_invoices']}, Invalid: {s['invalid_invoices']}")
+    print_metrics()
     return 0 if s["invalid_invoices"] == 0 else 4
 
 
 def main():
     parser = argparse.ArgumentParser(prog="invoice-qc", description="Invoice QC CLI")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Print per-stage timings after the run")
     sub = parser.add_subparsers(dest="cmd", required=True)
 
     p_extract = sub.add_parser("extract", help="Run PDF extractor")
     p_extract.add_argument("--pdf-dir", required=True)
     p_extract.add_argument("--output", required=True)
+    add_extract_arguments(p_extract)
+    p_extract.add_argument("--watch", action="store_true",
+                           help="Keep running and extract PDFs as they land in --pdf-dir")
+    p_extract.add_argument("--interval", type=float, default=5.0,
+                           help="Seconds between inbox scans in --watch mode")
 
     p_validate = sub.add_parser("validate", help="Validate extracted JSON")
     p_validate.add_argument("--input", required=True)
     p_validate.add_argument("--report", required=True)
+    add_validate_arguments(p_validate)
 
     p_full = sub.add_parser("full-run", help="Extract then validate")
     p_full.add_argument("--pdf-dir", required=True)
-    p_full.add_argument("--output-json", required=True)
+    p_full.add_argument("--output-json",
+                        help="Also write the extracted records here (needed with --stream / --incremental)")
     p_full.add_argument("--report", required=True)
-
-    sub.add_parser("short-extract", help="Extract using default paths")
+    add_validate_arguments(p_full)
+    add_extract_arguments(p_full)
+
+    p_queue_add = sub.add_parser("queue-add", help="Queue a folder of PDFs in a shared work queue")
+    p_queue_add.add_argument("--store", required=True, help="SQLite work queue file")
+    p_queue_add.add_argument("--pdf-dir", required=True)
+    p_queue_add.add_argument("--shared", action="store_true",
+                             help="New store on a network filesystem (no WAL; workers on several machines)")
+
+    p_queue_work = sub.add_parser("queue-work", help="Extract + validate PDFs claimed from a work queue")
+    p_queue_work.add_argument("--store", required=True)
+    p_queue_work.add_argument("--processes", type=int, default=1, help="Worker processes on this machine")
+    p_queue_work.add_argument("--inbox", help="Also queue new PDFs from this folder when the queue runs dry")
+    p_queue_work.add_argument("--drain", action="store_true",
+                              help="Exit once nothing is queued or leased (default: keep waiting)")
+    p_queue_work.add_argument("--batch", type=int, default=1, help="PDFs claimed at a time")
+    p_queue_work.add_argument("--lease", type=float, default=60.0,
+                              help="Lease seconds; a worker silent for that long loses its PDFs")
+    p_queue_work.add_argument("--max-attempts", type=int, default=3,
+                              help="Claims per PDF before it is marked failed")
+    p_queue_work.add_argument("--rules", help="JSON rule set (default: $INVOICE_QC_RULES)")
+    add_document_arguments(p_queue_work)
+
+    p_queue_status = sub.add_parser("queue-status", help="Counts, live workers and failed PDFs of a work queue")
+    p_queue_status.add_argument("--store", required=True)
+
+    p_queue_export = sub.add_parser("queue-export", help="Report (and records) of everything a work queue finished")
+    p_queue_export.add_argument("--store", required=True)
+    p_queue_export.add_argument("--output-json", help="Also write the extracted records here")
+    p_queue_export.add_argument("--report", required=True)
+    p_queue_export.add_argument("--dup-index",
+                                help="SQLite duplicate index shared across batches "
+                                     "(default: $INVOICE_QC_DUP_INDEX)")
+    p_queue_export.add_argument("--batch", dest="batch_name",
+                                help="Batch name recorded in the duplicate index (default: content hash)")
+    p_queue_export.add_argument("--no-near-duplicates", action="store_true",
+                                help="Skip the possible_duplicate check (default: $INVOICE_QC_NEAR_DUPLICATES)")
+
+    p_short_extract = sub.add_parser("short-extract", help="Extract using default paths")
+    add_extract_arguments(p_short_extract)
     sub.add_parser("short-validate", help="Validate using default paths")
-    sub.add_parser("short-full", help="Extract + validate using default paths")
+    p_short_full = sub.add_parser("short-full", help="Extract + validate using default paths")
+    add_extract_arguments(p_short_full)
 
     args = parser.parse_args()
 
+    if args.metrics:
+        metrics.enable()
+        # extraction worker processes read it on import
+        os.environ["INVOICE_QC_METRICS"] = "1"
+    if getattr(args, "no_near_duplicates", False):
+        validator.NEAR_DUPLICATES = False
+
   
+    if args.cmd.startswith("queue-"):
+        return sys.exit(run_queue(args))
+
     if args.cmd == "short-extract":
-        return sys.exit(0 if run_extract("samplespdf", "output.json") else 1)
+        ok = run_extract("samplespdf", "output.json", **extract_options(args))
+        print_metrics()
+        return sys.exit(0 if ok else 1)
 
     if args.cmd == "short-validate":
         return sys.exit(run_validate("output.json", "report.json"))
 
     if args.cmd == "short-full":
-        ok = run_extract("samplespdf", "output.json")
-        if not ok:
-            print("Extractor failed.")
-            return sys.exit(2)
-        return sys.exit(run_validate("output.json", "report.json"))
+        return sys.exit(run_full("samplespdf", "output.json", "report.json", **extract_options(args)))
 
 
+    if args.cmd == "extract" and args.watch:
+        return sys.exit(run_watch(args.pdf_dir, args.output, args.interval,
+                                  **extract_options(args)))
+
     if args.cmd == "extract":
-        ok = run_extract(args.pdf_dir, args.output)
+        ok = run_extract(args.pdf_dir, args.output, **extract_options(args))
+        print_metrics()
         return sys.exit(0 if ok else 1)
 
     if args.cmd == "validate":
-        return sys.exit(run_validate(args.input, args.report))
+        return sys.exit(run_validate(args.input, args.report, stream=args.stream,
+                                     dup_index=args.dup_index, batch=args.batch, rules=args.rules))
 
     if args.cmd == "full-run":
-        ok = run_extract(args.pdf_dir, args.output_json)
-        if not ok:
-            print("Extractor step failed.")
-            return sys.exit(2)
-        return sys.exit(run_validate(args.output_json, args.report))
+        return sys.exit(run_full(args.pdf_dir, args.output_json, args.report, stream=args.stream,
+                                 dup_index=args.dup_index, batch=args.batch, rules=args.rules,
+                                 **extract_options(args)))
 
 
 if __name__ == "__main__":
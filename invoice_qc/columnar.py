@@ -0,0 +1,331 @@
+# invoice_qc/columnar.py
+"""
+Columnar batch validation.
+
+validate_invoices(invoices) returns exactly the report
+validator.validate_invoices builds (same per_invoice entries, same error
+order, same error_counts order), but works a column at a time instead of
+an invoice at a time:
+
+  - every field is pulled out of the dicts once,
+  - date and name columns are factorized, so parse_date / normalize_text
+    run once per distinct value instead of once per invoice,
+  - amount columns (mostly distinct values) are checked with one regex
+    pass over the whole column; plain numbers go straight to float(),
+    anything else through parse_amount's memoized parser,
+  - each invoice ends up with a tuple of rule flags, and invoices with the
+    same flags share one error template, so error lists and error_counts
+    are built per distinct outcome rather than per error.
+
+Pure standard library. validator.validate_invoices switches to it for
+batches of COLUMNAR_MIN_ROWS invoices or more.
+"""
+from collections import Counter
+from itertools import repeat
+import re
+
+from invoice_qc import metrics, validator
+from invoice_qc.rules import currency_code
+from invoice_qc.utils import _parse_amount_str, normalize_text, parse_date
+
+# value types a parser can be keyed on directly: hash-equal values of
+# these types (1, 1.0, True) always parse to the same result
+_NUMERIC_KEYS = {str, type(None), int, float, bool}
+# normalize_text("1") != normalize_text(1.0), so only strings and None here
+_TEXT_KEYS = {str, type(None)}
+
+# a whole column of 1234 / 1234.56 amounts, joined by _SEP
+_SEP = "\x00"
+_PLAIN_AMOUNTS = re.compile(r"\d+(?:\.\d+)?(?:" + _SEP + r"\d+(?:\.\d+)?)*")
+
+_DUPLICATE_KEY = ("invoice_number", "seller_name", "invoice_date")
+
+
+def _column(invoices, field):
+    return [inv.get(field) for inv in invoices]
+
+
+def _types(values):
+    return {type(v) for v in values}
+
+
+def _apply(values, parse_many, key_types):
+    """parse_many over the distinct values of a column, mapped back per row."""
+    if not _types(values) <= key_types:
+        # every parser here treats other objects as str(obj)
+        values = [v if type(v) in key_types else str(v) for v in values]
+    uniques = list(dict.fromkeys(values))
+    table = dict(zip(uniques, parse_many(uniques)))
+    return [table[v] for v in values]
+
+
+def _parse_amount_strings(strings):
+    """parse_amount for a list of str."""
+    joined = _SEP.join(strings)
+    if joined.count(_SEP) == len(strings) - 1 and _PLAIN_AMOUNTS.fullmatch(joined):
+        # parse_amount takes these shapes to float() as they are
+        return [float(s) for s in joined.split(_SEP)]
+    return [_parse_amount_str(s) for s in strings]
+
+
+def _parse_amounts(uniques):
+    out = [None] * len(uniques)
+    slots = []
+    for k, v in enumerate(uniques):
+        if type(v) is str:
+            slots.append(k)
+        elif v is not None:
+            out[k] = float(v)
+    for k, value in zip(slots, _parse_amount_strings([uniques[k] for k in slots])):
+        out[k] = value
+    return out
+
+
+def _amounts(values):
+    """parse_amount over a column."""
+    if _types(values) == {str}:
+        # amounts rarely repeat; factorizing them would only cost time
+        return _parse_amount_strings(values)
+    return _apply(values, _parse_amounts, _NUMERIC_KEYS)
+
+
+def _parse_dates(uniques):
+    return [parse_date(v) for v in uniques]
+
+
+def _normalize(uniques):
+    return [normalize_text(v) for v in uniques]
+
+
+def _currency_codes(values):
+    """currency_code over a column."""
+    if _types(values) <= _TEXT_KEYS:
+        return _apply(values, lambda uniques: [currency_code(v) for v in uniques], _TEXT_KEYS)
+    # 0 / False are "not given", str(0) would not be
+    return [currency_code(v) for v in values]
+
+
+def _normalized(values):
+    """normalize_text over a column."""
+    if _types(values) == {str}:
+        # what normalize_text does to a str (split() drops the ends too)
+        return [" ".join(v.lower().split()) for v in values]
+    return _apply(values, _normalize, _TEXT_KEYS)
+
+
+def _line_item_checks(items_col, subtotal, tolerance):
+    """
+    (mismatch flags, warnings) for the invoices that have line items;
+    sums run in item order from 0, like validate_single_invoice.
+    tolerance is one number, or one per invoice.
+    """
+    n = len(items_col)
+    mismatch = [False] * n
+    warnings = [None] * n
+    rows = [i for i, items in enumerate(items_col) if items]
+    if not rows:
+        return mismatch, warnings
+
+    # all line totals parsed as one column, then summed invoice by invoice
+    line_totals = iter(_amounts([item.get("line_total") for i in rows for item in items_col[i]]))
+    per_row = isinstance(tolerance, list)
+    for i in rows:
+        # not sum(): it rounds differently from the row-wise += on 3.12+
+        sum_line = 0
+        bad = 0
+        for _ in items_col[i]:
+            lt = next(line_totals)
+            if lt is None:
+                bad += 1
+            else:
+                sum_line += lt
+        if bad:
+            warnings[i] = ["line_item_unparseable"] * bad
+        sub = subtotal[i]
+        mismatch[i] = sub is not None and abs(sum_line - sub) > (tolerance[i] if per_row else tolerance)
+    return mismatch, warnings
+
+
+def _duplicate_counts(columns):
+    """
+    How many "duplicate_invoice" errors detect_duplicates leads to per
+    invoice: 1 for every repeat, (repeats) for the first occurrence.
+    """
+    keys = zip(*(_normalized(columns[f]) for f in _DUPLICATE_KEY))
+    seen = {}
+    counts = []
+    for i, key in enumerate(keys):
+        first = seen.setdefault(key, i)
+        if first == i:
+            counts.append(0)
+        else:
+            counts.append(1)
+            counts[first] += 1
+    return counts
+
+
+def _plans(ruleset, invoices):
+    """The rules.Plan of every invoice, or None when they all use the base plan."""
+    if not ruleset.match_fields:
+        return None
+    keys = list(zip(*(_normalized(_column(invoices, f)) for f in ruleset.match_fields)))
+    table = {key: ruleset.plan_for_key(key) for key in dict.fromkeys(keys)}
+    if len(set(table.values())) == 1 and ruleset.base_plan in table.values():
+        return None
+    return [table[key] for key in keys]
+
+
+def _per_row(plans, distinct, value):
+    """value(plan) for every invoice; one value when it is the same for all of them."""
+    table = {plan: value(plan) for plan in distinct}
+    if plans is None or len(set(table.values())) == 1:
+        return table[distinct[0]]
+    return [table[plan] for plan in plans]
+
+
+def _masked(flags, mask):
+    # mask: True (check runs for all), False (for none) or a flag per invoice
+    if mask is True:
+        return flags
+    if mask is False:
+        return [False] * len(flags)
+    return [flag and on for flag, on in zip(flags, mask)]
+
+
+def _hits(name, *flag_columns):
+    # invoices a check found something on (validation_rule_hits, like row-wise)
+    if metrics.ENABLED and flag_columns:
+        metrics.inc("validation_rule_hits", sum(any(row) for row in zip(*flag_columns)), rule=name)
+
+
+def validate_invoices(invoices):
+    """Same report as validator.validate_invoices, computed per column."""
+    n = len(invoices)
+    ruleset = validator.RULES
+    plans = _plans(ruleset, invoices)
+    distinct = [ruleset.base_plan] if plans is None else list(dict.fromkeys(plans))
+    columns = {}
+
+    def column(field):
+        if field not in columns:
+            columns[field] = _column(invoices, field)
+        return columns[field]
+
+    def enabled(check):
+        return _per_row(plans, distinct, lambda p: p.enabled[check])
+
+    # flag columns and their error names, in the order row-wise reports them
+    flags = []
+    names = []
+
+    with metrics.timer("validation_rule_seconds", rule="required_fields"):
+        start = len(flags)
+        for f in ruleset.field_order:
+            mask = _per_row(plans, distinct,
+                            lambda p: p.enabled["required_fields"] and f in p.required_fields)
+            if mask is not False:
+                flags.append(_masked([not v for v in column(f)], mask))
+                names.append(f"missing_field: {f}")
+        _hits("required_fields", *flags[start:])
+
+    mask = enabled("currency")
+    if mask is not False:
+        with metrics.timer("validation_rule_seconds", rule="currency"):
+            allowed = _per_row(plans, distinct, lambda p: p.currencies)
+            codes = _currency_codes(column("currency"))
+            if isinstance(allowed, list):
+                unsupported = [c is not None and c not in a for c, a in zip(codes, allowed)]
+            else:
+                unsupported = [c is not None and c not in allowed for c in codes]
+            flags.append(_masked(unsupported, mask))
+            names.append("unsupported_currency")
+            _hits("currency", flags[-1])
+
+    mask = enabled("date_format")
+    if mask is not False:
+        with metrics.timer("validation_rule_seconds", rule="date_format"):
+            dates = _apply(column("invoice_date"), _parse_dates, _NUMERIC_KEYS)
+            flags.append(_masked([d is None for d in dates], mask))
+            names.append("invalid_date_format")
+            _hits("date_format", flags[-1])
+
+    tolerance = _per_row(plans, distinct, lambda p: p.tolerance)
+    per_row = isinstance(tolerance, list)
+    # parsed once, shared by the amounts and line item checks
+    subtotal = None
+
+    mask = enabled("amounts")
+    if mask is not False:
+        with metrics.timer("validation_rule_seconds", rule="amounts"):
+            subtotal = _amounts(column("subtotal"))
+            tax = _amounts(column("tax_amount"))
+            total = _amounts(column("total_amount"))
+            unparseable = [s is None or t is None or g is None
+                           for s, t, g in zip(subtotal, tax, total)]
+            tolerances = tolerance if per_row else repeat(tolerance)
+            mismatch = [not bad and abs((s + t) - g) > tol
+                        for bad, s, t, g, tol in zip(unparseable, subtotal, tax, total, tolerances)]
+            flags.append(_masked(unparseable, mask))
+            flags.append(_masked(mismatch, mask))
+            names += ["unparseable_amount", "totals_mismatch"]
+            _hits("amounts", flags[-2], flags[-1])
+
+    warnings = [None] * n
+    mask = enabled("line_items")
+    if mask is not False:
+        with metrics.timer("validation_rule_seconds", rule="line_items"):
+            items = column("line_items")
+            if mask is not True:
+                items = [li if on else None for li, on in zip(items, mask)]
+            if subtotal is None:
+                subtotal = _amounts(column("subtotal"))
+            li_mismatch, warnings = _line_item_checks(items, subtotal, tolerance)
+            flags.append(li_mismatch)
+            names.append("line_items_total_mismatch")
+            _hits("line_items", li_mismatch, [bool(w) for w in warnings])
+
+    metrics.inc("invoices_validated", n)
+
+    with metrics.timer("duplicate_detection_seconds"):
+        for f in _DUPLICATE_KEY:
+            column(f)
+        flags.append(_duplicate_counts(columns))
+
+    # one error template per distinct outcome, in order of first appearance;
+    # each invoice keeps the template's number rather than its outcome tuple
+    numbers = {}
+    rows = [numbers.setdefault(outcome, len(numbers)) for outcome in zip(*flags)]
+    templates = []
+    for outcome in numbers:
+        errors = [name for name, hit in zip(names, outcome) if hit]
+        templates.append(errors + ["duplicate_invoice"] * outcome[-1])
+
+    results = []
+    for inv_id, row, warn in zip(column("invoice_number"), rows, warnings):
+        errors = templates[row]
+        results.append({
+            "invoice_id": inv_id,
+            "is_valid": not errors,
+            "errors": list(errors),
+            "warnings": [] if warn is None else warn,
+        })
+
+    # templates are numbered in order of first appearance, so error_counts
+    # gets the same key order as counting row by row
+    multiplicity = Counter(rows)
+    error_counter = Counter()
+    valid = 0
+    for row, errors in enumerate(templates):
+        if not errors:
+            valid += multiplicity[row]
+        for e in errors:
+            error_counter[e] += multiplicity[row]
+
+    summary = {
+        "total_invoices": n,
+        "valid_invoices": valid,
+        "invalid_invoices": n - valid,
+        "error_counts": dict(error_counter)
+    }
+
+    return {"per_invoice": results, "summary": summary}
@@ -0,0 +1,137 @@
+# invoice_qc/dupindex.py
+"""
+Persistent duplicate index shared across batches.
+
+detect_duplicates only sees one batch. The index remembers the duplicate
+key (validator.duplicate_digest, a stable 64 bit hash of number, seller
+and date) of every invoice validated so far, together with the batch it
+first arrived in. An invoice whose key is already there from another
+batch gets a duplicate_previous_batch error.
+
+Storage is one SQLite file with a single INTEGER PRIMARY KEY table: the
+key is the rowid, so the B-tree is the index and a row is ~15 bytes
+(tens of millions of keys stay well under a GB). Lookups and inserts are
+done once per batch, keys sorted, in chunks. WAL mode lets the CLI and
+the API use the same file at the same time.
+
+A batch is identified by a caller-given name or, by default, a hash of
+its keys, so validating the same batch again does not flag it against
+itself.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+
+from invoice_qc import validator
+
+DUPLICATE_ERROR = "duplicate_previous_batch"
+
+# bound parameters per IN (...) query
+CHUNK_SIZE = 500
+
+
+def batch_digest(keys):
+    """Default batch id: sha256 over the duplicate digests, in order."""
+    h = hashlib.sha256()
+    for key in keys:
+        h.update(key.to_bytes(8, "little", signed=True))
+    return h.hexdigest()
+
+
+class DuplicateIndex:
+    def __init__(self, path, cache_mb=64):
+        self.path = str(path)
+        # FastAPI runs sync endpoints in a thread pool
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(f"PRAGMA cache_size=-{int(cache_mb * 1024)}")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS batches ("
+            " id INTEGER PRIMARY KEY,"
+            " name TEXT NOT NULL UNIQUE,"
+            " created REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS invoice_keys ("
+            " key INTEGER PRIMARY KEY,"
+            " batch INTEGER NOT NULL)"
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _batch_id(self, name):
+        row = self.conn.execute(
+            "SELECT id FROM batches WHERE name = ?", (name,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def seen_elsewhere(self, keys, batch):
+        """Return the subset of keys already indexed under another batch."""
+        found = set()
+        keys = sorted(set(keys))
+        with self.lock:
+            own = self._batch_id(batch)
+            for i in range(0, len(keys), CHUNK_SIZE):
+                chunk = keys[i:i + CHUNK_SIZE]
+                marks = ",".join("?" * len(chunk))
+                found.update(
+                    row[0] for row in self.conn.execute(
+                        f"SELECT key FROM invoice_keys WHERE key IN ({marks})"
+                        " AND batch IS NOT ?", chunk + [own]
+                    )
+                )
+        return found
+
+    def add(self, keys, batch):
+        """Record keys as seen in batch; keys already indexed keep their batch."""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO batches (name, created) VALUES (?, ?)",
+                (batch, time.time()),
+            )
+            own = self._batch_id(batch)
+            # sorted inserts touch each B-tree page once
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO invoice_keys (key, batch) VALUES (?, ?)",
+                ((key, own) for key in sorted(set(keys))),
+            )
+            self.conn.commit()
+
+    def apply(self, report, invoices, batch=None):
+        """
+        Flag invoices of a validate_invoices report that an earlier batch
+        already had, then record the batch. Returns the batch id used.
+        """
+        keys = [validator.duplicate_digest(inv) for inv in invoices]
+        batch = batch or batch_digest(keys)
+
+        earlier = self.seen_elsewhere(keys, batch)
+        if earlier:
+            results = report["per_invoice"]
+            for result, key in zip(results, keys):
+                if key in earlier:
+                    result["errors"].append(DUPLICATE_ERROR)
+                    result["is_valid"] = False
+            report["summary"] = validator.summarize(results)
+
+        self.add(keys, batch)
+        return batch
+
+    def stats(self):
+        with self.lock:
+            keys = self.conn.execute("SELECT COUNT(*) FROM invoice_keys").fetchone()[0]
+            batches = self.conn.execute("SELECT COUNT(*) FROM batches").fetchone()[0]
+        return {"keys": keys, "batches": batches}
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
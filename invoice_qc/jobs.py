@@ -0,0 +1,340 @@
+# invoice_qc/jobs.py
+"""
+Batch jobs for the API.
+
+A job validates a batch of invoices (JSON array or NDJSON) or extracts a
+folder / zip archive of PDFs and then validates the result. Everything
+lives under one directory, so jobs survive an API restart:
+
+  jobs.sqlite           one row per job: kind, status, progress, summary
+  <id>/input.json       the submitted invoices (array or NDJSON, as sent)
+  <id>/pdfs/            PDFs unpacked from a submitted archive
+  <id>/files.json       the PDF list of the job, in extraction order
+  <id>/extracted.ndjson extractor records, one per line, appended as
+                        they come out
+  <id>/results.ndjson   per-invoice validation results, one per line,
+                        appended and flushed as they come out
+
+A single JobRunner thread works through the jobs in submission order.
+Output files only ever grow by whole lines, so a job interrupted by a
+restart is picked up again where it stopped: extraction skips the PDFs
+already in extracted.ndjson; validation runs again (duplicate checks
+need the whole batch) but only appends the results not yet written.
+Readers can tail results.ndjson while the job is still running.
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+from pathlib import Path
+import shutil
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+import zipfile
+
+from invoice_qc import metrics, streaming
+
+QUEUED, EXTRACTING, VALIDATING, DONE, FAILED = (
+    "queued", "extracting", "validating", "done", "failed")
+FINISHED = (DONE, FAILED)
+
+# write progress to the store at most this often (seconds)
+PROGRESS_INTERVAL = 0.5
+
+# PDFs per zip archive, unless JobRunner is given another limit
+MAX_ARCHIVE_FILES = 10000
+
+_CHUNK = 1024 * 1024
+
+
+def _complete_lines(path):
+    """Number of whole lines in path; a torn last line is cut off."""
+    if not os.path.exists(path):
+        return 0
+    count = 0
+    good = 0
+    with open(path, "rb+") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            count += 1
+            good += len(line)
+        f.truncate(good)
+    return count
+
+
+class JobStore:
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.root / "jobs.sqlite"), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " kind TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " total INTEGER,"
+            " done INTEGER NOT NULL DEFAULT 0,"
+            " created REAL NOT NULL,"
+            " updated REAL NOT NULL,"
+            " source TEXT,"
+            " summary TEXT,"
+            " error TEXT)"
+        )
+        self.conn.commit()
+
+    def path(self, job_id, name=""):
+        return self.root / job_id / name
+
+    def create(self, kind, source=None, write_input=None):
+        """
+        New queued job; returns its id. write_input(job_dir) stores the
+        input first, so the runner never sees a job without one.
+        """
+        job_id = uuid.uuid4().hex
+        self.path(job_id).mkdir()
+        if write_input is not None:
+            write_input(self.path(job_id))
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO jobs (id, kind, status, created, updated, source)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, now, now, source),
+            )
+            self.conn.commit()
+        metrics.inc("jobs_submitted", kind=kind)
+        return job_id
+
+    def update(self, job_id, **fields):
+        fields["updated"] = time.time()
+        columns = ", ".join(f"{k} = ?" for k in fields)
+        with self.lock:
+            self.conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?",
+                              list(fields.values()) + [job_id])
+            self.conn.commit()
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["summary"] = json.loads(job["summary"]) if job["summary"] else None
+        return job
+
+    def unfinished(self):
+        """Ids of jobs not done or failed, oldest first."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id FROM jobs WHERE status NOT IN (?, ?) ORDER BY created",
+                FINISHED,
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        self.conn.close()
+
+
+class JobRunner(threading.Thread):
+    """Background thread running the store's jobs one after the other."""
+
+    def __init__(self, store, workers=0, dup_index=None, max_archive_bytes=None,
+                 max_archive_files=MAX_ARCHIVE_FILES):
+        super().__init__(name="invoice-qc-jobs", daemon=True)
+        self.store = store
+        self.workers = workers
+        self.dup_index = dup_index
+        # caps on what a zip may unpack to (uncompressed bytes, PDFs)
+        self.max_archive_bytes = max_archive_bytes
+        self.max_archive_files = max_archive_files
+        self.wake = threading.Event()
+        self.stopping = False
+        self._last_progress = 0.0
+
+    def notify(self):
+        self.wake.set()
+
+    def stop(self):
+        self.stopping = True
+        self.wake.set()
+
+    def run(self):
+        while not self.stopping:
+            pending = self.store.unfinished()
+            metrics.set_gauge("jobs_pending", len(pending))
+            if not pending:
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            self.run_job(pending[0])
+
+    def run_job(self, job_id):
+        job = self.store.get(job_id)
+        try:
+            if job["kind"] == "pdfs":
+                input_path = self._extract(job)
+            else:
+                input_path = self.store.path(job_id, "input.json")
+            summary = self._validate(job_id, input_path)
+        except Exception:
+            self.store.update(job_id, status=FAILED, error=traceback.format_exc())
+            metrics.inc("jobs_failed")
+            return
+        self.store.update(job_id, status=DONE, summary=json.dumps(summary))
+        metrics.inc("jobs_completed")
+
+    def _progress(self, job_id, **fields):
+        # throttled: one store write per PROGRESS_INTERVAL at most
+        now = time.monotonic()
+        if now - self._last_progress >= PROGRESS_INTERVAL:
+            self._last_progress = now
+            self.store.update(job_id, **fields)
+
+    def _extract(self, job):
+        from invoiceextractor.extractor import iter_extract
+
+        job_id = job["id"]
+        files_path = self.store.path(job_id, "files.json")
+        if files_path.exists():
+            files = json.loads(files_path.read_text(encoding="utf-8"))
+        else:
+            files = [str(p) for p in _pdf_files(self.store.path(job_id), job["source"],
+                                                self.max_archive_bytes, self.max_archive_files)]
+            files_path.write_text(json.dumps(files), encoding="utf-8")
+
+        out_path = self.store.path(job_id, "extracted.ndjson")
+        done = _complete_lines(out_path)
+        self.store.update(job_id, status=EXTRACTING, total=len(files), done=done)
+        with open(out_path, "a", encoding="utf-8") as out:
+            # this runs in a thread of the API process: spawn the workers, never fork
+            for rec in iter_extract(files[done:], workers=self.workers,
+                                    mp_context=multiprocessing.get_context("spawn")):
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                out.flush()
+                done += 1
+                self._progress(job_id, done=done)
+        return out_path
+
+    def _validate(self, job_id, input_path):
+        results_path = self.store.path(job_id, "results.ndjson")
+        written = _complete_lines(results_path)
+        self.store.update(job_id, status=VALIDATING, total=None, done=written)
+
+        def on_count(n):
+            self.store.update(job_id, total=n)
+
+        total = valid = 0
+        error_counts = {}
+        # the job id names the batch, so a resumed job is not flagged
+        # as a duplicate of its own first attempt
+        results = streaming.iter_file_results(input_path, self.dup_index, job_id, on_count)
+        with open(results_path, "a", encoding="utf-8") as out:
+            for result in results:
+                if total >= written:
+                    out.write(json.dumps(result, default=str) + "\n")
+                    out.flush()
+                total += 1
+                valid += result["is_valid"]
+                for e in result["errors"]:
+                    error_counts[e] = error_counts.get(e, 0) + 1
+                self._progress(job_id, done=total)
+        self.store.update(job_id, done=total)
+        metrics.inc("invoices_validated", total)
+        return {
+            "total_invoices": total,
+            "valid_invoices": valid,
+            "invalid_invoices": total - valid,
+            "error_counts": error_counts,
+        }
+
+
+def _unpack(archive, target, max_bytes=None, max_files=None):
+    """
+    The archive's PDFs into target. Raises ValueError past max_files PDFs
+    or max_bytes uncompressed, counted while reading (the sizes in the
+    zip directory are whatever the sender wrote there).
+    """
+    total = 0
+    with zipfile.ZipFile(archive) as zf:
+        members = [m for m in zf.infolist()
+                   if not m.is_dir() and m.filename.lower().endswith(".pdf")]
+        if max_files is not None and len(members) > max_files:
+            raise ValueError(f"Archive holds {len(members)} PDFs, the limit is {max_files}.")
+        for n, member in enumerate(members):
+            # flat, numbered names: no paths from the archive touch the disk
+            name = f"{n:06d}_{Path(member.filename).name}"
+            with zf.open(member) as src, open(target / name, "wb") as dst:
+                while True:
+                    chunk = src.read(_CHUNK)
+                    if not chunk:
+                        break
+                    total += len(chunk)
+                    if max_bytes is not None and total > max_bytes:
+                        raise ValueError(f"Archive unpacks to more than {max_bytes} bytes.")
+                    dst.write(chunk)
+
+
+def _pdf_files(job_dir, source, max_bytes=None, max_files=None):
+    """PDFs of a job: from its unpacked archive, else from the source folder."""
+    archive = job_dir / "archive.zip"
+    if archive.exists():
+        target = job_dir / "pdfs"
+        target.mkdir(exist_ok=True)
+        try:
+            _unpack(archive, target, max_bytes, max_files)
+        except Exception:
+            shutil.rmtree(target)
+            archive.unlink()
+            raise
+        archive.unlink()
+        return sorted(target.glob("*.pdf"))
+    if (job_dir / "pdfs").is_dir():
+        return sorted((job_dir / "pdfs").glob("*.pdf"))
+    return sorted(Path(source).glob("*.pdf"))
+
+
+# results are sent to a client in pieces of at most this size
+RESULT_CHUNK_BYTES = 1024 * 1024
+
+
+def _read_at(path, offset, size):
+    if not path.exists():
+        return b""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+async def iter_result_lines(store, job_id, poll=0.5):
+    """
+    Complete lines of results.ndjson as they are written, in pieces of at
+    most RESULT_CHUNK_BYTES; ends once the job is finished and everything
+    has been read. The job lookup and file reads run in worker threads and
+    the waits are asyncio.sleep, so the event loop never blocks on them.
+    """
+    path = store.path(job_id, "results.ndjson")
+    offset = 0
+    pending = b""
+    while True:
+        finished = (await asyncio.to_thread(store.get, job_id))["status"] in FINISHED
+        chunk = await asyncio.to_thread(_read_at, path, offset, RESULT_CHUNK_BYTES)
+        offset += len(chunk)
+        # a line still being written (or longer than a chunk) waits for the rest
+        data = pending + chunk
+        end = data.rfind(b"\n") + 1
+        pending = data[end:]
+        if end:
+            yield data[:end]
+        elif chunk:
+            continue
+        elif finished:
+            return
+        else:
+            await asyncio.sleep(poll)
@@ -0,0 +1,224 @@
+"""
+Lightweight pipeline metrics (counters, gauges + latency histograms).
+
+Disabled by default. While disabled, timer() hands back one shared no-op
+context manager and inc()/observe() return immediately, so instrumented
+hot paths pay a function call and nothing else. Enable with enable() or
+INVOICE_QC_METRICS=1 (also picked up by extraction worker processes).
+
+Note: with --workers > 1 the extraction stages run in other processes and
+their timings are not merged back; profile with a single worker.
+"""
+from bisect import bisect_left
+from contextlib import nullcontext
+import os
+import threading
+import time
+
+PREFIX = "invoice_qc_"
+
+# seconds; covers per-rule validation (µs) up to pathological PDFs (s)
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+ENABLED = os.environ.get("INVOICE_QC_METRICS", "") not in ("", "0")
+
+_NOOP = nullcontext()
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+
+
+def _after_fork():
+    # a worker forked while another thread held the lock would block on it forever
+    global _lock
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def inc(name, value=1, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Current value of something that goes up and down (e.g. queue depth)."""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def observe(name, seconds, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = Histogram()
+        hist.observe(seconds)
+
+
+def series(name, **labels):
+    """Key of one series, computed once, for observe_series / inc_series in hot loops."""
+    return _key(name, labels)
+
+
+def inc_series(key, value=1):
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe_series(key, seconds):
+    if not ENABLED:
+        return
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = Histogram()
+        hist.observe(seconds)
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+now = time.perf_counter
+
+
+def timer(name, **labels):
+    """`with timer("stage_seconds"):` records the block's duration."""
+    if not ENABLED:
+        return _NOOP
+    return _Timer(name, labels)
+
+
+# ---------------- reporting ----------------
+
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in items
+    )
+    return "{" + body + "}"
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+        histograms = sorted(_histograms.items(), key=lambda kv: kv[0])
+
+    lines = []
+    typed = set()
+    for (name, labels), value in counters:
+        # text format 0.0.4: the TYPE line names the sample, _total included
+        full = PREFIX + name + "_total"
+        if full not in typed:
+            lines.append(f"# TYPE {full} counter")
+            typed.add(full)
+        lines.append(f"{full}{_fmt_labels(labels)} {value}")
+
+    for (name, labels), value in gauges:
+        full = PREFIX + name
+        if full not in typed:
+            lines.append(f"# TYPE {full} gauge")
+            typed.add(full)
+        lines.append(f"{full}{_fmt_labels(labels)} {value}")
+
+    for (name, labels), hist in histograms:
+        full = PREFIX + name
+        if full not in typed:
+            lines.append(f"# TYPE {full} histogram")
+            typed.add(full)
+        cumulative = 0
+        for bound, n in zip(hist.buckets, hist.counts):
+            cumulative += n
+            lines.append(f"{full}_bucket{_fmt_labels(labels, [('le', repr(float(bound)))])} {cumulative}")
+        lines.append(f"{full}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {hist.count}")
+        lines.append(f"{full}_sum{_fmt_labels(labels)} {hist.sum}")
+        lines.append(f"{full}_count{_fmt_labels(labels)} {hist.count}")
+    return "\n".join(lines) + "\n"
+
+
+def summary_lines():
+    """Short human readable lines for the CLI summary."""
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+        histograms = sorted(_histograms.items(), key=lambda kv: kv[0])
+
+    lines = []
+    for (name, labels), value in counters + gauges:
+        lines.append(f"  {name}{_fmt_labels(labels)}: {value}")
+    for (name, labels), hist in histograms:
+        avg = hist.sum / hist.count * 1000 if hist.count else 0.0
+        lines.append(
+            f"  {name}{_fmt_labels(labels)}: n={hist.count} total={hist.sum:.3f}s "
+            f"avg={avg:.3f}ms max={hist.max * 1000:.3f}ms"
+        )
+    return lines
@@ -0,0 +1,138 @@
+# invoice_qc/models.py
+"""
+Typed API models.
+
+Invoices are TypedDicts, not BaseModels: pydantic validates them (in one
+pass straight from the request bytes) and hands back plain dicts, which
+is what validator.validate_invoices works on, so there is no model ->
+dict conversion per request. Unknown keys (filename, text_snippet, ...)
+are kept; numbers in text fields become strings; amounts may be numbers
+or strings ("1.234,56 EUR") and are parsed by the validator.
+
+The report models describe validate_invoices' output for the OpenAPI
+docs; responses are serialized from the plain dicts.
+"""
+from typing import Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError
+from typing_extensions import TypedDict
+
+Text = Optional[str]
+Amount = Optional[Union[str, float]]
+
+
+class LineItem(TypedDict, total=False):
+    __pydantic_config__ = ConfigDict(extra="allow", coerce_numbers_to_str=True)
+
+    description: Text
+    quantity: Amount
+    unit_price: Amount
+    line_total: Amount
+
+
+class Invoice(TypedDict, total=False):
+    __pydantic_config__ = ConfigDict(extra="allow", coerce_numbers_to_str=True)
+
+    invoice_number: Text
+    invoice_date: Text
+    seller_name: Text
+    seller_address: Text
+    buyer_name: Text
+    buyer_address: Text
+    currency: Text
+    subtotal: Amount
+    tax_amount: Amount
+    total_amount: Amount
+    line_items: Optional[List[LineItem]]
+
+
+class InvoiceResult(BaseModel):
+    invoice_id: Any = None
+    is_valid: bool
+    errors: List[str]
+    warnings: List[str]
+
+
+class Summary(BaseModel):
+    total_invoices: int
+    valid_invoices: int
+    invalid_invoices: int
+    error_counts: Dict[str, int]
+
+
+class Report(BaseModel):
+    per_invoice: List[InvoiceResult]
+    summary: Summary
+
+
+class ExtractionReport(BaseModel):
+    invoices: List[Invoice]
+    report: Report
+
+
+INVOICE = TypeAdapter(Invoice)
+INVOICES = TypeAdapter(List[Invoice])
+INVOICE_OR_LIST = TypeAdapter(Union[List[Invoice], Invoice])
+
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+
+
+def parse_invoices(body, content_type, single_ok=False):
+    """
+    Validate a request body into a list of invoice dicts.
+    JSON (a list, or also one invoice with single_ok) or NDJSON, one
+    invoice per line. Raises pydantic.ValidationError; for NDJSON the
+    error locations start with ("line", <line number in the body>).
+    """
+    if content_type in NDJSON_TYPES:
+        return _parse_lines(body)
+    if single_ok:
+        invoices = INVOICE_OR_LIST.validate_json(body)
+        return [invoices] if isinstance(invoices, dict) else invoices
+    return INVOICES.validate_json(body)
+
+
+def _parse_lines(body):
+    # each line is one invoice on its own: '{"a":1},{"b":2}' is an error
+    invoices = []
+    errors = []
+    for number, line in enumerate(body.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            invoices.append(INVOICE.validate_json(line))
+        except ValidationError as e:
+            for error in e.errors():
+                detail = {"type": error["type"], "loc": ("line", number) + error["loc"], "input": error["input"]}
+                if "ctx" in error:
+                    detail["ctx"] = error["ctx"]
+                errors.append(detail)
+    if errors:
+        raise ValidationError.from_exception_data("NDJSON invoices", errors)
+    return invoices
+
+
+def schema_components():
+    """JSON schemas of the request models, for #/components/schemas."""
+    _, defs = TypeAdapter.json_schemas(
+        [("invoices", "validation", INVOICES)],
+        ref_template="#/components/schemas/{model}",
+    )
+    return defs.get("$defs", {})
+
+
+def request_body(single_ok=False):
+    """openapi_extra documenting the JSON / NDJSON invoice bodies."""
+    ref = {"$ref": "#/components/schemas/Invoice"}
+    json_schema = {"type": "array", "items": ref}
+    if single_ok:
+        json_schema = {"anyOf": [json_schema, ref]}
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": json_schema},
+                "application/x-ndjson": {"schema": ref},
+            },
+        }
+    }
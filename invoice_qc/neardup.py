@@ -0,0 +1,198 @@
+# invoice_qc/neardup.py
+"""
+Near-duplicate detection.
+
+detect_duplicates needs the exact (number, seller, date) key, so a
+re-sent invoice with a stray space or a trailing character in the number
+slips through. Comparing every pair fuzzily is O(n^2); here:
+
+  1. blocking   invoices are grouped by (whole units of the total,
+                invoice date); each block is compared with itself and
+                the next amount bucket, so 76.99 and 77.01 still meet.
+                Only blocks with a partner are looked at, and most
+                blocks of a real batch are singletons,
+  2. numbers    inside a block, every invoice is filed under its
+                normalized invoice number and under each variant of it
+                with one character deleted. Only pairs where one side is
+                filed under its full number are candidates: 123456 with a
+                digit dropped meets 12345, while two variants meeting
+                would be a substitution (AUFNR100001 / AUFNR100002, two
+                orders). Other numbers never meet, however many orders
+                of the same seller and buyer a block holds. Buckets over
+                MAX_BUCKET members (a degenerate batch) are skipped,
+  3. scoring    candidates whose numbers really are at most
+                MAX_NUMBER_EDITS inserted/deleted characters apart and
+                whose totals are less than AMOUNT_TOLERANCE apart get
+                the Jaccard similarity of their seller + buyer 3-grams;
+                pairs at or above THRESHOLD are reported with it.
+
+Each invoice lands in len(number) + 1 buckets, so the work grows with the
+batch, not with its square. Exact duplicates (same duplicate_key) are
+left to detect_duplicates. Results only depend on the input, so reports
+are reproducible. validator.NEAR_DUPLICATES switches the pass off.
+"""
+from collections import Counter, defaultdict
+from itertools import combinations
+import math
+
+from invoice_qc.utils import normalize_text, parse_amount, parse_date
+from invoice_qc.validator import duplicate_key
+
+WARNING = "possible_duplicate"
+
+NAME_FIELDS = ("seller_name", "buyer_name")
+FIELDS = NAME_FIELDS + ("invoice_number",)
+SHINGLE_SIZE = 3
+THRESHOLD = 0.8
+# a stray or missing character in the number; substitutions never match
+MAX_NUMBER_EDITS = 1
+# totals of a pair must be closer than this (whole-unit blocks + the next one)
+AMOUNT_TOLERANCE = 1.0
+# number buckets bigger than this are not compared (at most ~2000 pairs each)
+MAX_BUCKET = 64
+
+
+def block_key(inv):
+    """(whole units of the total, date ordinal), or None if either is unreadable."""
+    return _block(parse_amount(inv.get("total_amount")), parse_date(inv.get("invoice_date")))
+
+
+def _block(total, day):
+    if total is None or day is None or not math.isfinite(total):
+        return None
+    return (math.floor(total), day.toordinal())
+
+
+def _next(key):
+    # the neighbouring amount bucket on the same day
+    return (key[0] + 1, key[1])
+
+
+def block_keys(invoices):
+    return [block_key(inv) for inv in invoices]
+
+
+def shared_blocks(counts):
+    """Block keys (from {key: members}) whose invoices have someone to be compared with."""
+    shared = set()
+    for key, n in counts.items():
+        if key is None:
+            continue
+        if n > 1:
+            shared.add(key)
+        if counts.get(_next(key)):
+            shared.update((key, _next(key)))
+    return shared
+
+
+def _squeezed(inv, field):
+    return "".join(normalize_text(inv.get(field)).split())
+
+
+def _grams(text):
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def similarity(a, b):
+    """Jaccard similarity of two shingle sets."""
+    return len(a & b) / len(a | b)
+
+
+def number_keys(number):
+    """The number and every variant of it with one character deleted."""
+    keys = {number}
+    keys.update(number[:i] + number[i + 1:] for i in range(len(number)))
+    return keys
+
+
+def number_edits(a, b):
+    """Characters inserted or deleted to turn a into b (LCS based, no substitutions)."""
+    if len(a) > len(b):
+        a, b = b, a
+    # longest common subsequence, one row at a time
+    row = [0] * (len(b) + 1)
+    for ch in a:
+        prev = 0
+        for j, other in enumerate(b):
+            cur = row[j + 1]
+            row[j + 1] = prev + 1 if ch == other else max(row[j + 1], row[j])
+            prev = cur
+    return len(a) + len(b) - 2 * row[-1]
+
+
+def find_pairs(entries, threshold=THRESHOLD):
+    """
+    entries: (index, block key, invoice) for invoices in shared blocks
+    (see shared_blocks). Returns [(i, j, score)] with i < j, sorted.
+    """
+    buckets = defaultdict(list)
+    members = {}
+    for idx, block, inv in entries:
+        number = _squeezed(inv, "invoice_number")
+        if not number:
+            continue
+        members[idx] = (number, _grams("\x1f".join(_squeezed(inv, f) for f in NAME_FIELDS)),
+                        duplicate_key(inv), parse_amount(inv.get("total_amount")))
+        for key in number_keys(number):
+            buckets[block, key].append((idx, key == number))
+
+    seen = set()
+    pairs = []
+    for (block, key), own in buckets.items():
+        # pairs within the bucket, and with the same bucket one amount up
+        upper = buckets.get((_next(block), key), [])
+        if len(own) + len(upper) > MAX_BUCKET:
+            continue
+        candidates = list(combinations(own, 2))
+        candidates.extend((a, b) for a in own for b in upper)
+        for (i, full_i), (j, full_j) in candidates:
+            pair = (min(i, j), max(i, j))
+            # two one-deletion variants meeting is a substitution
+            if i == j or not (full_i or full_j) or pair in seen:
+                continue
+            seen.add(pair)
+            number_i, names_i, key_i, total_i = members[i]
+            number_j, names_j, key_j, total_j = members[j]
+            if key_i == key_j or abs(total_i - total_j) >= AMOUNT_TOLERANCE:
+                continue
+            if number_edits(number_i, number_j) > MAX_NUMBER_EDITS:
+                continue
+            score = similarity(names_i, names_j)
+            if score >= threshold:
+                pairs.append(pair + (score,))
+    pairs.sort()
+    return pairs
+
+
+def near_duplicates(invoices, threshold=THRESHOLD):
+    """[(i, j, score)] for near-duplicate pairs of invoices, i < j."""
+    keys = block_keys(invoices)
+    shared = shared_blocks(Counter(keys))
+    if not shared:
+        return []
+    return find_pairs([(idx, key, invoices[idx]) for idx, key in enumerate(keys) if key in shared],
+                      threshold)
+
+
+def warnings_for(pairs, invoice_id):
+    """{index: [warning, ...]} for the pairs; invoice_id(index) names the other side."""
+    found = defaultdict(list)
+    for i, j, score in pairs:
+        found[i].append(f"{WARNING}: {invoice_id(j)} ({score:.2f})")
+        found[j].append(f"{WARNING}: {invoice_id(i)} ({score:.2f})")
+    return found
+
+
+def apply(results, invoices):
+    """Add possible_duplicate warnings to validate_invoices' per_invoice results."""
+    pairs = near_duplicates(invoices)
+    if not pairs:
+        return
+
+    def invoice_id(idx):
+        return invoices[idx].get("invoice_number") or f"#{idx}"
+
+    for idx, warnings in warnings_for(pairs, invoice_id).items():
+        results[idx]["warnings"].extend(warnings)
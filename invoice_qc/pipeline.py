@@ -0,0 +1,177 @@
+# invoice_qc/pipeline.py
+"""
+Fused extract -> validate for full-run.
+
+The two-step full-run writes every record to the output JSON (indent=2)
+and then reads and parses that file again to validate it. run_full
+instead hands the records from extraction straight to validation:
+
+  extract thread  iter_extract (worker pool, cache, limits as usual) puts
+                  records on a bounded queue, in file order
+  main thread     takes them off, runs validate_single_invoice on each
+                  while the next PDFs are still being parsed, and writes
+                  the record to the output file if one was asked for
+
+Once the last record is in, the checks that need the whole batch
+(duplicates, near duplicates, the duplicate index) run via
+validator.report_for, so the report is identical to validating the
+output file. The queue bound keeps memory flat when validation falls
+behind; the records themselves are kept for the batch checks, as
+validate_invoices keeps them.
+"""
+import json
+import multiprocessing
+from pathlib import Path
+import queue
+import threading
+import time
+
+from invoice_qc import metrics, validator
+from invoiceextractor import extractor
+
+# records in flight between extraction and validation
+QUEUE_SIZE = 256
+
+_DONE = object()
+
+
+class ExtractionFailed(Exception):
+    """Extraction stopped run_full; the extractor's own exception is __cause__."""
+
+
+def _put(q, item, stop):
+    # False once the consumer has given up
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+class _Extraction(threading.Thread):
+    """iter_extract into the queue, then _DONE; the cache lives in this thread (SQLite)."""
+
+    def __init__(self, pdf_files, q, workers, cache_path, cache_max_mb, text_options, limits):
+        super().__init__(name="extract", daemon=True)
+        self.pdf_files = pdf_files
+        self.q = q
+        self.workers = workers
+        self.cache_path = cache_path
+        self.cache_max_mb = cache_max_mb
+        self.text_options = text_options
+        self.limits = limits
+        self.stop = threading.Event()
+        self.error = None
+        self.cache_stats = None
+
+    def run(self):
+        records = None
+        cache = None
+        try:
+            cache = extractor.open_cache(self.cache_path, self.cache_max_mb)
+            # pools are spawned: this process runs threads (this one)
+            records = extractor.iter_extract(self.pdf_files, workers=self.workers, cache=cache,
+                                             text_options=self.text_options, limits=self.limits,
+                                             mp_context=multiprocessing.get_context("spawn"))
+            for rec in records:
+                if not _put(self.q, rec, self.stop):
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            if records is not None:
+                # shuts the worker pool down
+                records.close()
+            if cache is not None:
+                self.cache_stats = cache.stats()
+                cache.close()
+            _put(self.q, _DONE, self.stop)
+
+
+class RecordWriter:
+    """
+    Writes records as they come, byte for byte what extract_folder writes
+    (json: json.dump(records, f, indent=2, ensure_ascii=False); ndjson:
+    one per line, flushed).
+    """
+
+    def __init__(self, output, output_format=None):
+        self.format = output_format or extractor.output_format_for(output)
+        self.f = open(output, "w", encoding="utf-8")
+        self.count = 0
+
+    def write(self, rec):
+        with metrics.timer("serialize_seconds"):
+            if self.format == "ndjson":
+                self.f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                self.f.flush()
+            else:
+                self.f.write(",\n  " if self.count else "[\n  ")
+                self.f.write(json.dumps(rec, indent=2, ensure_ascii=False).replace("\n", "\n  "))
+        self.count += 1
+
+    def close(self):
+        if self.format != "ndjson":
+            self.f.write("\n]" if self.count else "[]")
+        self.f.close()
+
+
+def run_full(pdf_dir, report_out, output=None, output_format=None, workers=1,
+             cache_path=None, cache_max_mb=None, targeted=False, backend=None,
+             split=False, timeout=None, max_memory_mb=None, quarantine_path=None,
+             dup_index=None, batch=None, queue_size=QUEUE_SIZE):
+    """
+    Extract the PDFs in pdf_dir and validate the records into report_out.
+    The extraction options are extract_folder's; output (optional) gets
+    the records as extract_folder would write them. dup_index / batch as
+    for validate_invoices. Returns the report. Raises ExtractionFailed
+    if extraction does; errors of validation or of writing the files
+    come through as they are.
+    """
+    pdf_dir = Path(pdf_dir)
+    if not pdf_dir.exists():
+        raise ExtractionFailed(f"PDF dir not found: {pdf_dir}")
+    pdf_files = sorted(pdf_dir.glob("*.pdf"))
+
+    text_options = extractor.text_options_for(targeted, backend, split)
+    limits = extractor.open_limits(timeout, max_memory_mb)
+    writer = RecordWriter(output, output_format) if output else None
+    invoices = []
+    results = []
+
+    q = queue.Queue(maxsize=queue_size)
+    extraction = _Extraction(pdf_files, q, workers, cache_path, cache_max_mb, text_options, limits)
+    start = time.perf_counter()
+    extraction.start()
+    try:
+        while True:
+            rec = q.get()
+            if rec is _DONE:
+                break
+            invoices.append(rec)
+            results.append(validator.validate_single_invoice(rec))
+            if writer is not None:
+                writer.write(rec)
+    finally:
+        extraction.stop.set()
+        extraction.join()
+        if writer is not None:
+            writer.close()
+    elapsed = time.perf_counter() - start
+    if extraction.error is not None:
+        raise ExtractionFailed(str(extraction.error)) from extraction.error
+
+    rate = len(invoices) / elapsed if elapsed > 0 else 0.0
+    where = f" to {output}" if output else ""
+    print(f"Extracted and validated {len(invoices)} records{where} ({rate:.1f} files/sec)")
+    if extraction.cache_stats is not None:
+        st = extraction.cache_stats
+        print(f"Cache: {st['hits']} hits, {st['misses']} misses, {st['evictions']} evictions")
+    extractor.report_limits(limits, output or report_out, quarantine_path)
+
+    report = validator.report_for(invoices, results, dup_index=dup_index, batch=batch)
+    with metrics.timer("serialize_seconds"), open(report_out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    return report
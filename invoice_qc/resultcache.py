@@ -0,0 +1,238 @@
+# invoice_qc/resultcache.py
+"""
+Validation result cache.
+
+Upstream systems resubmit the same invoices again and again (retries,
+reconciliation). validate_single_invoice only looks at the invoice
+itself, so its result can be reused: entries are keyed by a hash of the
+canonical JSON of the invoice plus the version of the active rule set
+(rules.RuleSet.version), so changed rules never see old results.
+
+Only the per-invoice part is cached. Duplicate checks (duplicate_invoice,
+possible_duplicate, the cross-batch index) depend on the rest of the
+batch and still run on every request, on fresh copies of the cached
+error lists.
+
+Two layers:
+  memory  a small dict LRU per process, the fast path for hot invoices
+  SQLite  one file shared by every worker process (WAL), with a TTL and
+          an entry cap; the least recently used entries go first
+
+Lookups, inserts and recency updates are done once per batch.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from invoice_qc import metrics, validator
+
+DEFAULT_MAX_ENTRIES = 1_000_000
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MEMORY_ENTRIES = 8192
+
+# check the entry cap after this many inserts (COUNT(*) scans the table)
+EVICT_EVERY = 1000
+
+# bound parameters per IN (...) query
+CHUNK_SIZE = 500
+
+
+def _canonical(inv):
+    if orjson is not None:
+        return b"o" + orjson.dumps(inv, option=orjson.OPT_SORT_KEYS, default=str)
+    return b"j" + json.dumps(inv, sort_keys=True, separators=(",", ":"),
+                             ensure_ascii=False, default=str).encode("utf-8")
+
+
+class ValidationCache:
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL,
+                 memory_entries=DEFAULT_MEMORY_ENTRIES):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.version = validator.RULES.version.encode("utf-8")
+        self.hits = 0
+        self.misses = 0
+        # canonical JSON -> (expires, errors, warnings), in recency order
+        self._memory = {}
+        self._inserted = 0
+        self.lock = threading.Lock()  # SQLite connection
+        self._counts_lock = threading.Lock()
+
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key BLOB PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)"
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _digest(self, canonical):
+        # SQLite key; the memory layer keys on the canonical bytes and
+        # skips hashing on the fast path
+        return hashlib.blake2b(self.version + canonical, digest_size=16).digest()
+
+    def _remember(self, key, entry):
+        memory = self._memory
+        memory[key] = entry
+        if len(memory) > self.memory_entries:
+            # drop the least recently used eighth
+            for old in list(memory)[:max(1, self.memory_entries // 8)]:
+                memory.pop(old, None)
+
+    def _from_memory(self, keys, now):
+        # no lock: single dict operations are atomic, and a worker thread
+        # busy with SQLite must not hold up the fast path
+        found = {}
+        missing = []
+        memory = self._memory
+        for key in keys:
+            entry = memory.pop(key, None)
+            if entry is not None and entry[0] > now:
+                memory[key] = entry  # most recently used again
+                found[key] = entry
+            elif key not in found:
+                missing.append(key)
+        return found, list(dict.fromkeys(missing))
+
+    def _from_store(self, keys, now):
+        digests = {self._digest(key): key for key in keys}
+        stored = list(digests)
+        found = {}
+        for i in range(0, len(stored), CHUNK_SIZE):
+            chunk = stored[i:i + CHUNK_SIZE]
+            marks = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key, value, expires FROM results WHERE key IN ({marks})"
+                " AND expires > ?", chunk + [now],
+            ).fetchall()
+            for digest, value, expires in rows:
+                errors, warnings = json.loads(value)
+                entry = (expires, tuple(errors), tuple(warnings))
+                found[digests[digest]] = entry
+                self._remember(digests[digest], entry)
+            if rows:
+                self.conn.executemany(
+                    "UPDATE results SET last_used = ? WHERE key = ?",
+                    [(now, row[0]) for row in rows],
+                )
+        return found
+
+    def in_memory(self, invoices):
+        """True when every invoice is answered by the memory layer (no SQLite, no validation)."""
+        if validator.RULES.version.encode("utf-8") != self.version:
+            return False
+        now = time.time()
+        memory = self._memory
+        for inv in invoices:
+            entry = memory.get(_canonical(inv))
+            if entry is None or entry[0] <= now:
+                return False
+        return True
+
+    def validate_many(self, invoices):
+        """validate_single_invoice for every invoice, answered from the cache where possible."""
+        now = time.time()
+        version = validator.RULES.version.encode("utf-8")
+        if version != self.version:
+            # other rules: the memory layer (not keyed on the version) is stale
+            self.version = version
+            self._memory = {}
+        keys = [_canonical(inv) for inv in invoices]
+        found, missing = self._from_memory(keys, now)
+        if missing:
+            with self.lock:
+                found.update(self._from_store(missing, now))
+
+        results = []
+        new = {}
+        for inv, key in zip(invoices, keys):
+            entry = found.get(key)
+            if entry is None:
+                result = validator.validate_single_invoice(inv)
+                entry = (now + self.ttl, tuple(result["errors"]), tuple(result["warnings"]))
+                found[key] = new[key] = entry
+                results.append(result)
+                continue
+            # fresh lists: batch checks append to them
+            results.append({
+                "invoice_id": inv.get("invoice_number"),
+                "is_valid": not entry[1],
+                "errors": list(entry[1]),
+                "warnings": list(entry[2]),
+            })
+
+        # copies inside one batch are validated once, the later ones count as hits
+        misses = len(new)
+        hits = len(invoices) - misses
+        metrics.inc("validation_cache_hits", hits)
+        metrics.inc("validation_cache_misses", misses)
+        with self._counts_lock:
+            self.hits += hits
+            self.misses += misses
+            total = self.hits + self.misses
+            metrics.set_gauge("validation_cache_hit_ratio", self.hits / total if total else 0.0)
+        if new:
+            with self.lock:
+                self._store(new, now)
+        return results
+
+    def _store(self, new, now):
+        for key, entry in new.items():
+            self._remember(key, entry)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO results (key, value, expires, last_used)"
+            " VALUES (?, ?, ?, ?)",
+            [(self._digest(key), json.dumps([entry[1], entry[2]]), entry[0], now)
+             for key, entry in new.items()],
+        )
+        self._inserted += len(new)
+        if self._inserted >= EVICT_EVERY:
+            self._inserted = 0
+            self._evict(now)
+        self.conn.commit()
+
+    def _evict(self, now):
+        self.conn.execute("DELETE FROM results WHERE expires <= ?", (now,))
+        count = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM results WHERE key IN"
+                " (SELECT key FROM results ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def stats(self):
+        with self._counts_lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
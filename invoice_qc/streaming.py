@@ -0,0 +1,183 @@
+# invoice_qc/streaming.py
+"""
+Streaming validation for inputs too big to load at once.
+
+validate_file(input_path, report_path) writes the same report file as
+json.dump(validate_invoices(load_invoices(input_path)), f, indent=2), but
+only ever holds one invoice and one result at a time:
+
+  pass 1  reads the input and counts duplicate keys, kept as 8 byte
+          digests instead of (normalized) strings,
+  pass 2  reads it again, validates each invoice with
+          validate_single_invoice, adds the duplicate_invoice errors the
+          pass 1 counts call for and writes the result straight into the
+          report; the summary counters are updated as results go out.
+
+Two passes are needed because the first copy of a duplicate is flagged
+too, before the later copies have been seen. Memory grows with the number
+of distinct invoices (one digest each during pass 1), not with the size
+of the records or the report.
+
+Pass 1 also counts neardup blocks. If any block has a partner (a second
+member, or one in the next amount bucket; see neardup.shared_blocks), a
+middle pass keeps just those invoices' name fields and works out the
+possible_duplicate warnings before pass 2.
+
+With a dupindex.DuplicateIndex the digests from pass 1 are looked up in
+bulk before pass 2 and recorded after it.
+"""
+from collections import Counter
+import hashlib
+import json
+
+from invoice_qc import metrics, neardup, validator
+from invoice_qc.utils import iter_invoices
+
+
+def duplicate_counts(invoices, seen=None, batch_hash=None, blocks=None):
+    """
+    {digest: number of later copies} for keys seen more than once.
+    The distinct digests end up in seen (if given); batch_hash (a hashlib
+    object) is fed every digest in order, like dupindex.batch_digest;
+    blocks (a Counter) counts neardup block keys.
+    """
+    if seen is None:
+        seen = set()
+    repeats = Counter()
+    for inv in invoices:
+        if blocks is not None:
+            blocks[neardup.block_key(inv)] += 1
+        key = validator.duplicate_digest(inv)
+        if batch_hash is not None:
+            batch_hash.update(key.to_bytes(8, "little", signed=True))
+        if key in seen:
+            repeats[key] += 1
+        else:
+            seen.add(key)
+    return repeats
+
+
+# fields find_pairs looks at (shingles and the exact duplicate key)
+_NEAR_FIELDS = tuple(dict.fromkeys(neardup.FIELDS + ("invoice_number", "seller_name", "invoice_date",
+                                                      "total_amount")))
+
+
+def near_duplicate_warnings(invoices, shared):
+    """{index: possible_duplicate warnings}, for invoices in the shared (neardup.shared_blocks) blocks."""
+    entries = []
+    ids = {}
+    for idx, inv in enumerate(invoices):
+        key = neardup.block_key(inv)
+        if key in shared:
+            entries.append((idx, key, {f: inv.get(f) for f in _NEAR_FIELDS}))
+            ids[idx] = inv.get("invoice_number") or f"#{idx}"
+    return neardup.warnings_for(neardup.find_pairs(entries), ids.__getitem__)
+
+
+def iter_results(invoices, repeats, earlier=frozenset(), near=None):
+    """
+    validate_single_invoice per invoice, plus duplicate_invoice errors,
+    the index error for digests in earlier and the near ({index:
+    warnings}) possible_duplicate warnings.
+    """
+    from invoice_qc.dupindex import DUPLICATE_ERROR
+
+    flagged = set()
+    for idx, inv in enumerate(invoices):
+        result = validator.validate_single_invoice(inv)
+        if near and idx in near:
+            result["warnings"].extend(near[idx])
+        if repeats or earlier:
+            key = validator.duplicate_digest(inv)
+            later = repeats.get(key)
+            if later:
+                # the first copy gets one error per later copy, like
+                # validate_invoices does with its duplicate pairs
+                if key in flagged:
+                    count = 1
+                else:
+                    flagged.add(key)
+                    count = later
+                result["errors"].extend(["duplicate_invoice"] * count)
+                result["is_valid"] = False
+            if key in earlier:
+                result["errors"].append(DUPLICATE_ERROR)
+                result["is_valid"] = False
+        yield result
+
+
+def _indented(obj, prefix):
+    return json.dumps(obj, indent=2, default=str).replace("\n", "\n" + prefix)
+
+
+def write_report(results, f):
+    """
+    Stream results into f as {"per_invoice": [...], "summary": {...}},
+    byte for byte what json.dump(report, f, indent=2) would write.
+    Returns the summary.
+    """
+    total = valid = 0
+    error_counter = Counter()
+
+    f.write('{\n  "per_invoice": [')
+    for result in results:
+        f.write(",\n    " if total else "\n    ")
+        f.write(_indented(result, "    "))
+        total += 1
+        if result["is_valid"]:
+            valid += 1
+        for e in result["errors"]:
+            error_counter[e] += 1
+    f.write("\n  ]" if total else "]")
+
+    summary = {
+        "total_invoices": total,
+        "valid_invoices": valid,
+        "invalid_invoices": total - valid,
+        "error_counts": dict(error_counter)
+    }
+    f.write(',\n  "summary": ' + _indented(summary, "  ") + "\n}")
+    return summary
+
+
+def iter_file_results(input_path, dup_index=None, batch=None, on_count=None):
+    """
+    Per-invoice results for a JSON array / NDJSON file, in input order and
+    exactly as validate_invoices reports them (the passes described at
+    the top). on_count(n) is called with the number of invoices once pass
+    1 is done. With dup_index the batch is recorded after the last result.
+    """
+    keys = set()
+    batch_hash = hashlib.sha256() if dup_index is not None and not batch else None
+    blocks = Counter()
+    with metrics.timer("duplicate_detection_seconds"):
+        repeats = duplicate_counts(iter_invoices(input_path), keys, batch_hash, blocks)
+    if on_count is not None:
+        on_count(len(keys) + sum(repeats.values()))
+
+    near = None
+    shared = neardup.shared_blocks(blocks) if validator.NEAR_DUPLICATES else None
+    del blocks
+    if shared:
+        with metrics.timer("near_duplicate_seconds"):
+            near = near_duplicate_warnings(iter_invoices(input_path), shared)
+
+    earlier = frozenset()
+    if dup_index is not None:
+        batch = batch or batch_hash.hexdigest()
+        with metrics.timer("duplicate_index_seconds"):
+            earlier = dup_index.seen_elsewhere(keys, batch)
+
+    yield from iter_results(iter_invoices(input_path), repeats, earlier, near)
+
+    if dup_index is not None:
+        with metrics.timer("duplicate_index_seconds"):
+            dup_index.add(keys, batch)
+
+
+def validate_file(input_path, report_path, dup_index=None, batch=None):
+    """Validate a JSON array / NDJSON file into report_path; returns the summary."""
+    with open(report_path, "w", encoding="utf-8") as f:
+        summary = write_report(iter_file_results(input_path, dup_index, batch), f)
+    metrics.inc("invoices_validated", summary["total_invoices"])
+    return summary
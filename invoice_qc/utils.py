@@ -1,4 +1,7 @@
-from datetime import datetime
+from datetime import date
+from functools import lru_cache
+from itertools import islice
+import json
 import re
 
 
@@ -9,38 +12,147 @@ DATE_FORMATS = [
     "%d-%m-%Y",
 ]
 
+# every entry of DATE_FORMATS in one pattern; the day/month alternatives
+# are the ones strptime uses for %d/%m, so exactly the same strings match
+_DAY = r"3[01]|[12]\d|0[1-9]|[1-9]| [1-9]"
+_MONTH = r"1[0-2]|0[1-9]|[1-9]"
+_DATE_RE = re.compile(
+    rf"(?P<iso_y>\d{{4}})-(?P<iso_m>{_MONTH})-(?P<iso_d>{_DAY})"
+    rf"|(?P<d>{_DAY})(?P<sep>[./-])(?P<m>{_MONTH})(?P=sep)(?P<y>\d{{4}})"
+)
+
+# memo size for the parsers; real batches repeat dates and amounts a lot
+PARSE_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_date_str(value):
+    m = _DATE_RE.fullmatch(value)
+    if m is None:
+        return None
+    if m.group("iso_y"):
+        y, mo, d = m.group("iso_y", "iso_m", "iso_d")
+    else:
+        y, mo, d = m.group("y", "m", "d")
+    try:
+        return date(int(y), int(mo), int(d))
+    except ValueError:
+        # e.g. 31.02.2024
+        return None
+
+
 def parse_date(value):
     """
     Parse a date string into a Python date object.
+    Accepts the DATE_FORMATS shapes (checked with one regex, no strptime).
     Returns None if not parseable.
     """
     if not value:
         return None
 
-    value = str(value).strip()
+    return _parse_date_str(str(value).strip())
 
-    for fmt in DATE_FORMATS:
-        try:
-            return datetime.strptime(value, fmt).date()
-        except:
-            pass
 
-    
-    return None
+# Shape of an amount: optional junk (currency, spaces) around one number.
+# The number group that matched tells how to read it:
+#   2 eu      1.234,56
+#   3 us      1,234 / 1,234.56
+#   4 comma   64,00 / 0,5              (a single comma is a decimal comma,
+#                                       unless exactly 3 digits follow: us)
+#   5 plain   1234 / 1234.56 / 1.234   (a single dot is a decimal point)
+#   6 eu      1.234.567
+#   7 spaced  1 234,56 / 1'234.56
+# Alternatives never overlap except where the earlier one is meant to win,
+# and the common German shape comes first because it is the slowest to
+# reach otherwise.
+# The sign is a minus next to the number, with at most spaces and
+# currency symbols in between: group 1 before it (-12,50 / EUR -12,50 /
+# -€12,50), group 8 after it (12,50-, SAP style). A hyphen anywhere else
+# is junk like the rest.
+_AMOUNT_RE = re.compile(
+    r"[^\d.,-]*(?:(-)[^\w.,-]*|[^\d.,]*)"
+    r"(?:(\d{1,3}(?:\.\d{3})+,\d+)"
+    r"|(\d{1,3}(?:,\d{3})+(?:\.\d+)?)"
+    r"|(\d*,\d+)"
+    r"|(\d+(?:\.\d*)?|\.\d+)"
+    r"|(\d{1,3}(?:\.\d{3})+)"
+    r"|(\d{1,3}(?:[ \u00a0\u202f']\d{3})+(?:[.,]\d+)?))"
+    r"[^\w.,-]*(?:(-)[^\d.,-]*|[^\d.,]*)"
+)
+_LEADING_MINUS = 1
+_EU, _US, _COMMA, _PLAIN, _EU_INT, _SPACED = range(2, 8)
+_TRAILING_MINUS = 8
+_GROUP_SEP = re.compile(r"[ \u00a0\u202f']")
+
 
+def _trim(memo):
+    """Drop the least recently used eighth of a full memo."""
+    for key in list(islice(memo, max(1, PARSE_CACHE_SIZE // 8))):
+        # another thread may have taken it already
+        memo.pop(key, None)
+
+
+def _classify_amount(s):
+    m = _AMOUNT_RE.fullmatch(s)
+    if m is None:
+        return None
+    kind = m.lastindex
+    negative = kind == _TRAILING_MINUS or m.group(_LEADING_MINUS) is not None
+    if kind == _TRAILING_MINUS:
+        kind = next(k for k in range(_EU, _TRAILING_MINUS) if m.group(k) is not None)
+    number = m.group(kind)
+    if kind == _EU or kind == _EU_INT:
+        number = number.replace(".", "").replace(",", ".")
+    elif kind == _US:
+        number = number.replace(",", "")
+    elif kind == _COMMA:
+        number = number.replace(",", ".")
+    elif kind == _SPACED:
+        number = _GROUP_SEP.sub("", number).replace(",", ".")
 
+    return -float(number) if negative else float(number)
+
+
+# LRU memo for _classify_amount: a dict kept in recency order (hits are
+# moved to the end). functools.lru_cache costs more per miss than the
+# parse itself, and most amounts in a batch are distinct.
+_amount_memo = {}
+_MISS = object()
+
+
+def _parse_amount_str(value):
+    s = value.strip()
+    # plain numbers need neither a regex nor the memo
+    if s.replace(".", "", 1).isdigit():
+        try:
+            return float(s)
+        except ValueError:
+            pass  # digits float() does not take, e.g. superscripts
+
+    amount = _amount_memo.pop(s, _MISS)
+    if amount is _MISS:
+        amount = _classify_amount(s)
+        if len(_amount_memo) >= PARSE_CACHE_SIZE:
+            _trim(_amount_memo)
+    _amount_memo[s] = amount
+    return amount
 
 
 def parse_amount(value):
     """
     Convert value into float.
     Handles:
-        - '1,200.50'
-        - '₹1200'
-        - '$80'
+        - '1,200.50' / '1.200,50'  (US and EU separators)
+        - '64,00'                  (decimal comma)
+        - '₹1200' / '$80' / '12,50 EUR'
         - '1200'
+    The input shape is classified with one precompiled regex; repeated
+    strings are answered from an LRU memo.
     Returns float or None.
     """
+    if type(value) is str:
+        return _parse_amount_str(value)
+
     if value is None:
         return None
 
@@ -49,20 +161,7 @@ def parse_amount(value):
         return float(value)
 
 
-    s = str(value)
-
-    s = re.sub(r"[^\d.\-,]", "", s)
-
-    s = s.replace(",", "")
-
-    s = s.strip()
-    if s == "":
-        return None
-
-    try:
-        return float(s)
-    except:
-        return None
+    return _parse_amount_str(str(value))
 
 
 
@@ -76,3 +175,107 @@ def normalize_text(s):
     if s is None:
         return ""
     return " ".join(str(s).strip().lower().split())
+
+
+
+def _sniff_array(f):
+    """True if the file holds a JSON array (first non-blank char is "[")."""
+    head = f.read(1)
+    while head and head.isspace():
+        head = f.read(1)
+    f.seek(0)
+    return head == "["
+
+
+def load_invoices(path):
+    """
+    Load invoices from either a JSON array or NDJSON (one object per line).
+    The format is sniffed from the first non-blank character, so the
+    extractor's --format ndjson output can be validated directly.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if _sniff_array(f):
+            return json.load(f)
+
+        return [json.loads(line) for line in f if line.strip()]
+
+
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+
+def _iter_json_array(f, chunk_size=1 << 16):
+    """Yield the elements of a JSON array one at a time, reading f in chunks."""
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+
+    def fill(min_size):
+        nonlocal buf, pos, eof
+        chunk = f.read(max(chunk_size, min_size))
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    while True:
+        # skip whitespace and the separator in front of the next element
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            fill(0)
+        if pos >= len(buf):
+            raise ValueError("Unexpected end of JSON array")
+
+        ch = buf[pos]
+        if not started:
+            if ch != "[":
+                raise ValueError("Expecting a JSON array")
+            started = True
+            pos += 1
+            expect_value = None  # either a value or "]"
+            continue
+        if ch == "]" and expect_value is not True:
+            return
+        if expect_value is False:
+            if ch != ",":
+                raise ValueError(f"Expecting ',' or ']' in JSON array, got {ch!r}")
+            pos += 1
+            expect_value = True
+            continue
+
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # element continues in the next chunk; grow the read so one
+            # huge element is not re-parsed once per small chunk
+            fill(len(buf) - pos)
+            continue
+        if not eof and (end == len(buf) or buf[end] in _NUMBER_CHARS):
+            # a number cut by the chunk boundary ("-3." + "5e10") may go on
+            fill(0)
+            continue
+        yield obj
+        pos = end
+        expect_value = False
+
+
+def iter_invoices(path):
+    """
+    Like load_invoices, but yields one invoice at a time: NDJSON line by
+    line, a JSON array element by element, so memory does not grow with
+    the size of the file.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if _sniff_array(f):
+            yield from _iter_json_array(f)
+            return
+
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
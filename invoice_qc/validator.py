@@ -1,60 +1,55 @@
+import hashlib
 import json
+import os
 from collections import Counter
-from invoice_qc.utils import parse_date, parse_amount, normalize_text
+from invoice_qc import metrics, rules
+from invoice_qc.utils import normalize_text, load_invoices
 
 
-REQUIRED_FIELDS = ["invoice_number", "invoice_date", "seller_name", "buyer_name", "total_amount"]
+# defaults of the rule set; a rules file (rules.py) can change them
+REQUIRED_FIELDS = rules.DEFAULTS["required_fields"]
 
-SUPPORTED_CURRENCIES = {"INR", "USD", "EUR"}
+SUPPORTED_CURRENCIES = set(rules.DEFAULTS["currencies"])
 
-TOLERANCE = 0.5 
+TOLERANCE = rules.DEFAULTS["tolerance"]
 
+# batches at least this big go through the columnar engine (columnar.py),
+# which builds the same report much faster
+COLUMNAR_MIN_ROWS = 2000
 
-def validate_single_invoice(inv):
-    errors = []
-    warnings = []
+# possible_duplicate warnings (neardup.py); INVOICE_QC_NEAR_DUPLICATES=0 or
+# --no-near-duplicates turns them off
+NEAR_DUPLICATES = os.environ.get("INVOICE_QC_NEAR_DUPLICATES", "1") not in ("", "0")
 
-  
-    for field in REQUIRED_FIELDS:
-        if not inv.get(field):
-            errors.append(f"missing_field: {field}")
+# the active rule set: INVOICE_QC_RULES=PATH, or use_rules()
+RULES = rules.load(os.environ.get("INVOICE_QC_RULES") or None)
 
-    parsed_date = parse_date(inv.get("invoice_date"))
-    if parsed_date is None:
-        errors.append("invalid_date_format")
 
+def use_rules(source=None):
+    """Switch to the rule set in source (a path or config dict; None: the defaults)."""
+    global RULES
+    RULES = rules.load(source)
+    return RULES
 
-    subtotal = parse_amount(inv.get("subtotal"))
-    tax = parse_amount(inv.get("tax_amount"))
-    total = parse_amount(inv.get("total_amount"))
 
-    if subtotal is None or tax is None or total is None:
-        errors.append("unparseable_amount")
+def validate_single_invoice(inv):
+    return RULES.validate(inv)
 
-    if subtotal is not None and tax is not None and total is not None:
-        if abs((subtotal + tax) - total) > TOLERANCE:
-            errors.append("totals_mismatch")
 
-  
-    line_items = inv.get("line_items", [])
-    if line_items:
-        sum_line = 0
-        for li in line_items:
-            lt = parse_amount(li.get("line_total"))
-            if lt is None:
-                warnings.append("line_item_unparseable")
-            else:
-                sum_line += lt
+def duplicate_key(inv):
+    """Invoices with the same key are reported as duplicate_invoice."""
+    return (
+        normalize_text(inv.get("invoice_number")),
+        normalize_text(inv.get("seller_name")),
+        normalize_text(inv.get("invoice_date")),
+    )
 
-        if subtotal is not None and abs(sum_line - subtotal) > TOLERANCE:
-            errors.append("line_items_total_mismatch")
 
-    return {
-        "invoice_id": inv.get("invoice_number"),
-        "is_valid": len(errors) == 0,
-        "errors": errors,
-        "warnings": warnings
-    }
+def duplicate_digest(inv):
+    """duplicate_key as a stable signed 64 bit int (same in every process)."""
+    # normalize_text splits on whitespace, so "\x1f" cannot occur inside a part
+    key = "\x1f".join(duplicate_key(inv)).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little", signed=True)
 
 
 def detect_duplicates(invoices):
@@ -62,11 +57,7 @@ def detect_duplicates(invoices):
     duplicates = []
 
     for idx, inv in enumerate(invoices):
-        key = (
-            normalize_text(inv.get("invoice_number")),
-            normalize_text(inv.get("seller_name")),
-            normalize_text(inv.get("invoice_date")),
-        )
+        key = duplicate_key(inv)
 
         if key in seen:
             duplicates.append([seen[key], idx])
@@ -75,29 +66,79 @@ def detect_duplicates(invoices):
     return duplicates
 
 
-def validate_invoices(invoices):
-    results = [validate_single_invoice(inv) for inv in invoices]
-
-    dups = detect_duplicates(invoices)
-    for grp in dups:
-        for idx in grp:
-            results[idx]["errors"].append("duplicate_invoice")
-            results[idx]["is_valid"] = False
-
-
+def summarize(results):
     error_counter = Counter()
     for r in results:
         for e in r["errors"]:
             error_counter[e] += 1
 
-    summary = {
+    return {
         "total_invoices": len(results),
         "valid_invoices": sum(1 for r in results if r["is_valid"]),
         "invalid_invoices": sum(1 for r in results if not r["is_valid"]),
         "error_counts": dict(error_counter)
     }
 
-    return {"per_invoice": results, "summary": summary}
+
+def validate_invoices(invoices, dup_index=None, batch=None, result_cache=None):
+    """
+    Validate a batch. Near-duplicates (neardup.py) get a possible_duplicate
+    warning unless NEAR_DUPLICATES is off. With dup_index (dupindex.DuplicateIndex) invoices an
+    earlier batch already had are flagged as well, and this batch is
+    recorded under the name batch (default: a hash of its keys).
+    With result_cache (resultcache.ValidationCache) per-invoice results
+    are reused for invoices seen before; duplicate checks always run.
+    """
+    if len(invoices) >= COLUMNAR_MIN_ROWS:
+        # no result cache here: hashing every invoice costs about as much
+        # as validating it column-wise
+        from invoice_qc import columnar
+        report = columnar.validate_invoices(invoices)
+    else:
+        report = _validate_rows(invoices, result_cache)
+    return _cross_batch(report, invoices, dup_index, batch)
+
+
+def report_for(invoices, results, dup_index=None, batch=None):
+    """
+    validate_invoices' report when results (validate_single_invoice of
+    each invoice, e.g. worked out while the invoices were still being
+    extracted) are already known: only the duplicate checks are left.
+    """
+    metrics.inc("invoices_validated", len(results))
+    return _cross_batch(_with_duplicates(invoices, results), invoices, dup_index, batch)
+
+
+def _cross_batch(report, invoices, dup_index, batch):
+    if NEAR_DUPLICATES:
+        from invoice_qc import neardup
+        with metrics.timer("near_duplicate_seconds"):
+            neardup.apply(report["per_invoice"], invoices)
+
+    if dup_index is not None:
+        with metrics.timer("duplicate_index_seconds"):
+            dup_index.apply(report, invoices, batch)
+    return report
+
+
+def _validate_rows(invoices, result_cache=None):
+    if result_cache is not None:
+        results = result_cache.validate_many(invoices)
+    else:
+        results = [validate_single_invoice(inv) for inv in invoices]
+    metrics.inc("invoices_validated", len(results))
+    return _with_duplicates(invoices, results)
+
+
+def _with_duplicates(invoices, results):
+    with metrics.timer("duplicate_detection_seconds"):
+        dups = detect_duplicates(invoices)
+    for grp in dups:
+        for idx in grp:
+            results[idx]["errors"].append("duplicate_invoice")
+            results[idx]["is_valid"] = False
+
+    return {"per_invoice": results, "summary": summarize(results)}
 
 
 
@@ -106,10 +147,18 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--input", required=True)
     parser.add_argument("--output", required=True)
+    parser.add_argument("--stream", action="store_true",
+                        help="Validate record by record instead of loading the whole input")
     args = parser.parse_args()
 
-    with open(args.input) as f:
-        data = json.load(f)
+    if args.stream:
+        from invoice_qc import streaming
+        summary = streaming.validate_file(args.input, args.output)
+        print("Validation complete.")
+        print(summary)
+        raise SystemExit(0)
+
+    data = load_invoices(args.input)
 
     report = validate_invoices(data)
 
@@ -0,0 +1,133 @@
+# invoice_qc/workpool.py
+"""
+Process pool with a bounded queue, for the API.
+
+ProcessPoolExecutor queues without limit, so under load requests would
+pile up until they time out. BoundedPool admits at most
+workers + max_queue tasks at once (running + waiting). A submit that
+does not fit raises PoolFull with a Retry-After estimate, which the API
+turns into 429, and the current depth is published as gauges
+(extract_queue_depth, extract_in_flight) for /metrics and /health.
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import math
+import multiprocessing
+import os
+import threading
+import time
+
+from invoice_qc import metrics
+
+
+class PoolFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"pool is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _timed_call(fn, args):
+    # runs in the worker; the service time feeds the Retry-After estimate
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+class BoundedPool:
+    def __init__(self, workers=None, max_queue=None, name="extract"):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = self.workers * 4 if max_queue is None else max_queue
+        self.capacity = self.workers + self.max_queue
+        self.name = name
+        self.in_flight = 0
+        # moving average of one task's service time, in seconds
+        self.avg_seconds = 1.0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            # the API process runs threads, so workers are spawned, not forked
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    @property
+    def queued(self):
+        return max(0, self.in_flight - self.workers)
+
+    def retry_after(self, extra=1):
+        """Seconds until roughly `extra` more tasks would fit."""
+        must_finish = max(1, self.in_flight + extra - self.capacity)
+        return max(1, math.ceil(must_finish * self.avg_seconds / self.workers))
+
+    def submit_many(self, fn, arg_tuples):
+        """
+        Submit fn(*args) for every args, all or nothing. Returns futures
+        of the results; raises PoolFull when they do not all fit.
+        """
+        arg_tuples = list(arg_tuples)
+        with self._lock:
+            if self.in_flight + len(arg_tuples) > self.capacity:
+                metrics.inc(f"{self.name}_rejected")
+                raise PoolFull(self.retry_after(len(arg_tuples)))
+            self.in_flight += len(arg_tuples)
+            self._publish()
+            try:
+                pool = self._pool()
+                futures = [pool.submit(_timed_call, fn, args) for args in arg_tuples]
+            except BrokenProcessPool:
+                # a worker died (e.g. killed by the OOM killer); start over
+                self._executor = None
+                pool = self._pool()
+                futures = [pool.submit(_timed_call, fn, args) for args in arg_tuples]
+
+        for future in futures:
+            future.add_done_callback(self._done)
+        return [_Result(future) for future in futures]
+
+    def _done(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            error = None if future.cancelled() else future.exception()
+            if error is None and not future.cancelled():
+                seconds = future.result()[0]
+                self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * seconds
+            elif isinstance(error, BrokenProcessPool):
+                self._executor = None
+            self._publish()
+
+    def _publish(self):
+        metrics.set_gauge(f"{self.name}_queue_depth", self.queued)
+        metrics.set_gauge(f"{self.name}_in_flight", self.in_flight)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "capacity": self.capacity,
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class _Result:
+    """Future-like view of a _timed_call future that yields just the result."""
+
+    def __init__(self, future):
+        self.future = future
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)[1]
+
+    def __await__(self):
+        seconds, result = yield from asyncio.wrap_future(self.future).__await__()
+        return result
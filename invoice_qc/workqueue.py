@@ -0,0 +1,388 @@
+# invoice_qc/workqueue.py
+"""
+PDF work queue shared by any number of worker processes.
+
+One SQLite file is the whole broker. Workers on one machine, or on
+several machines that mount the same store and PDF paths, claim PDFs
+from it, extract and validate them and write the results back:
+
+  items      one row per PDF path: status (queued, leased, done,
+             failed), attempts, the current lease, and once done the
+             extractor records and their validate_single_invoice results
+
+  claim      in one write transaction, takes the oldest queued items, or
+             leased ones whose lease ran out (the worker crashed or lost
+             the store), and leases them to the caller with a fresh
+             token for LEASE_SECONDS; every claim counts as an attempt
+  heartbeat  a thread in every worker extends its leases while it works,
+             so a slow PDF is never handed to a second worker
+  complete   stores the results only while the caller still holds the
+             lease (the token matches), so a worker that lost its item
+             cannot overwrite the result of the one that took it over
+
+After max_attempts claims an item is failed instead of leased again:
+its lease kept running out (it kills or hangs its workers) or its worker
+kept raising. A PDF the extractor cannot read is not retried; its error
+record is the result, as with extract_folder.
+
+Duplicate checks need the whole batch, so they run in export(), which
+writes the records and the report like full-run. Lease times come from
+each worker's clock, so nodes need roughly synchronised clocks (well
+under LEASE_SECONDS apart). SQLite in WAL mode (the default) needs every
+process on one machine; for a store on a network filesystem create it
+with shared=True (rollback journal, locking through the filesystem).
+"""
+from contextlib import contextmanager
+import json
+import os
+from pathlib import Path
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+from invoice_qc import metrics, validator
+
+QUEUED, LEASED, DONE, FAILED = "queued", "leased", "done", "failed"
+STATUSES = (QUEUED, LEASED, DONE, FAILED)
+
+LEASE_SECONDS = 60.0
+MAX_ATTEMPTS = 3
+
+# seconds between looks at an empty queue / inbox
+POLL_INTERVAL = 1.0
+
+# the same while draining and other workers still hold leases (their
+# PDFs come back to the queue if they die), so the run ends right after
+# the last PDF
+DRAIN_POLL_INTERVAL = 0.1
+
+# inbox files modified less than this many seconds ago may still be copied in
+SETTLE = 1.0
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    def __init__(self, path, shared=False, max_attempts=MAX_ATTEMPTS):
+        self.path = str(path)
+        self.max_attempts = max_attempts
+        created = not os.path.exists(self.path)
+        # autocommit; writes take the lock up front with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        if created:
+            self.conn.execute("PRAGMA journal_mode=" + ("DELETE" if shared else "WAL"))
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            " id INTEGER PRIMARY KEY,"
+            " path TEXT NOT NULL UNIQUE,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " lease TEXT,"
+            " worker TEXT,"
+            " lease_until REAL,"
+            " added REAL NOT NULL,"
+            " updated REAL NOT NULL,"
+            " records TEXT,"
+            " results TEXT,"
+            " error TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS items_status ON items (status, id)")
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers
+        # never read the same queued rows and then both lease them
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def add(self, paths):
+        """Queue PDFs by absolute path; paths already in the store are left alone. Returns how many were new."""
+        now = time.time()
+        rows = [(str(Path(p).resolve()), QUEUED, now, now) for p in paths]
+        before = self.conn.total_changes
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO items (path, status, added, updated) VALUES (?, ?, ?, ?)", rows)
+        added = self.conn.total_changes - before
+        metrics.inc("queue_added", added)
+        return added
+
+    def add_folder(self, pdf_dir, settle=0.0):
+        """Queue the PDFs in pdf_dir (skipping ones modified in the last `settle` seconds)."""
+        now = time.time()
+        paths = [p for p in sorted(Path(pdf_dir).glob("*.pdf"))
+                 if not settle or now - p.stat().st_mtime >= settle]
+        return self.add(paths)
+
+    def claim(self, worker, limit=1, lease_seconds=LEASE_SECONDS):
+        """Lease up to `limit` items to worker; returns [(token, path)]."""
+        now = time.time()
+        claimed = []
+        with self._transaction() as conn:
+            # expired leases of items that have had all their attempts: give up on them
+            conn.execute(
+                "UPDATE items SET status = ?, lease = NULL, updated = ?,"
+                " error = 'lease expired ' || attempts || ' times (last worker ' || worker || ')'"
+                " WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, now, LEASED, now, self.max_attempts))
+            rows = conn.execute(
+                "SELECT id, path, status FROM items"
+                " WHERE status = ? OR (status = ? AND lease_until < ?) ORDER BY id LIMIT ?",
+                (QUEUED, LEASED, now, limit)).fetchall()
+            for item_id, path, status in rows:
+                token = uuid.uuid4().hex
+                conn.execute(
+                    "UPDATE items SET status = ?, lease = ?, worker = ?, lease_until = ?,"
+                    " attempts = attempts + 1, updated = ? WHERE id = ?",
+                    (LEASED, token, worker, now + lease_seconds, now, item_id))
+                claimed.append((token, path))
+                if status == LEASED:
+                    metrics.inc("queue_lease_expired")
+        metrics.inc("queue_claimed", len(claimed))
+        return claimed
+
+    def heartbeat(self, tokens, lease_seconds=LEASE_SECONDS):
+        """Extend these leases; returns the tokens no longer held."""
+        until = time.time() + lease_seconds
+        lost = []
+        with self._transaction() as conn:
+            for token in tokens:
+                cur = conn.execute("UPDATE items SET lease_until = ? WHERE lease = ? AND status = ?",
+                                   (until, token, LEASED))
+                if not cur.rowcount:
+                    lost.append(token)
+        return lost
+
+    def complete(self, token, records, results):
+        """Store an item's records and results; False if the lease was lost meanwhile."""
+        now = time.time()
+        with self._transaction() as conn:
+            n = conn.execute(
+                "UPDATE items SET status = ?, records = ?, results = ?, error = NULL, lease = NULL,"
+                " lease_until = NULL, updated = ? WHERE lease = ? AND status = ?",
+                (DONE, json.dumps(records, ensure_ascii=False), json.dumps(results, default=str),
+                 now, token, LEASED)).rowcount
+        metrics.inc("queue_completed" if n else "queue_lease_lost")
+        return bool(n)
+
+    def release(self, token, error):
+        """Give a leased item back after an exception: queued again, failed once out of attempts."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE items SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END,"
+                " error = ?, lease = NULL, lease_until = NULL, updated = ? WHERE lease = ? AND status = ?",
+                (self.max_attempts, FAILED, QUEUED, error, now, token, LEASED))
+        metrics.inc("queue_released")
+
+    def counts(self):
+        """{status: items}, plus "expired" for leases that ran out."""
+        counts = dict.fromkeys(STATUSES, 0)
+        for status, n in self.conn.execute("SELECT status, COUNT(*) FROM items GROUP BY status"):
+            counts[status] = n
+        counts["expired"] = self.conn.execute(
+            "SELECT COUNT(*) FROM items WHERE status = ? AND lease_until < ?",
+            (LEASED, time.time())).fetchone()[0]
+        return counts
+
+    def workers(self):
+        """{worker: leased items} for the leases still running."""
+        rows = self.conn.execute(
+            "SELECT worker, COUNT(*) FROM items WHERE status = ? AND lease_until >= ? GROUP BY worker",
+            (LEASED, time.time()))
+        return dict(rows.fetchall())
+
+    def failed(self):
+        rows = self.conn.execute(
+            "SELECT path, attempts, error FROM items WHERE status = ? ORDER BY path", (FAILED,))
+        return [{"path": p, "attempts": a, "error": e} for p, a, e in rows]
+
+    def iter_done(self):
+        """(records, results) per done item, in path order (extract_folder's file order in one folder)."""
+        rows = self.conn.execute(
+            "SELECT records, results FROM items WHERE status = ? ORDER BY path", (DONE,))
+        for records, results in rows:
+            yield json.loads(records), json.loads(results)
+
+    def close(self):
+        self.conn.close()
+
+
+class _Heartbeat(threading.Thread):
+    """Keeps the worker's current leases alive; SQLite wants its own connection here."""
+
+    def __init__(self, path, lease_seconds):
+        super().__init__(name="queue-heartbeat", daemon=True)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.tokens = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.queue = None
+
+    def hold(self, tokens):
+        with self.lock:
+            self.tokens = list(tokens)
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.lease_seconds / 3):
+                self.tick()
+        finally:
+            if self.queue is not None:
+                self.queue.close()
+
+    def tick(self):
+        """Extend the held leases once."""
+        with self.lock:
+            tokens = list(self.tokens)
+        if not tokens:
+            return
+        try:
+            if self.queue is None:
+                self.queue = WorkQueue(self.path)
+            # a lost lease shows when complete() is refused
+            self.queue.heartbeat(tokens, self.lease_seconds)
+        except sqlite3.Error as e:
+            # store locked or briefly unreachable: the next tick
+            # tries again, well before the lease runs out
+            print(f"{worker_name()}: lease heartbeat failed, retrying: {e}", flush=True)
+
+
+def run_worker(store, worker=None, batch=1, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS,
+               inbox=None, drain=False, poll=POLL_INTERVAL, cache_path=None, cache_max_mb=None,
+               targeted=False, backend=None, split=False, timeout=None, max_memory_mb=None,
+               rules=None):
+    """
+    Claim, extract and validate PDFs from the store until interrupted, or
+    with drain=True until nothing is queued or leased any more. With an
+    inbox folder new PDFs in it are queued whenever the queue runs dry.
+    The extraction options are extract_folder's; rules is a rule set for
+    validator.use_rules. Returns {done, lost, released} counts for this
+    worker.
+    """
+    import multiprocessing
+    from invoiceextractor import extractor
+
+    if rules:
+        validator.use_rules(rules)
+    worker = worker or worker_name()
+    queue = WorkQueue(store, max_attempts=max_attempts)
+    text_options = extractor.text_options_for(targeted, backend, split)
+    limits = extractor.open_limits(timeout, max_memory_mb)
+    cache = extractor.open_cache(cache_path, cache_max_mb)
+    heartbeat = _Heartbeat(store, lease_seconds)
+    heartbeat.start()
+    stats = {"done": 0, "lost": 0, "released": 0}
+    try:
+        while True:
+            if not heartbeat.is_alive():
+                # nothing would keep new leases alive; what this worker
+                # holds goes back to the queue when its leases run out
+                raise RuntimeError("lease heartbeat thread died")
+            claimed = queue.claim(worker, batch, lease_seconds)
+            if not claimed:
+                if inbox and queue.add_folder(inbox, settle=SETTLE):
+                    continue
+                counts = queue.counts()
+                if drain and not counts[QUEUED] and not counts[LEASED]:
+                    break
+                time.sleep(min(poll, DRAIN_POLL_INTERVAL) if drain and counts[LEASED] else poll)
+                continue
+
+            heartbeat.hold(token for token, _ in claimed)
+            try:
+                by_path = {}
+                with metrics.timer("queue_extract_seconds"):
+                    # the heartbeat thread runs: pools are spawned, not forked
+                    for rec in extractor.iter_extract([Path(p) for _, p in claimed], cache=cache,
+                                                      text_options=text_options, limits=limits,
+                                                      mp_context=multiprocessing.get_context("spawn")):
+                        by_path.setdefault(rec["path"], []).append(rec)
+                for token, path in claimed:
+                    records = by_path.get(path, [])
+                    results = [validator.validate_single_invoice(rec) for rec in records]
+                    if queue.complete(token, records, results):
+                        stats["done"] += 1
+                    else:
+                        stats["lost"] += 1
+            except Exception:
+                error = traceback.format_exc()
+                for token, _ in claimed:
+                    queue.release(token, error)
+                stats["released"] += len(claimed)
+            finally:
+                heartbeat.hold([])
+    finally:
+        heartbeat.stopped.set()
+        heartbeat.join()
+        if cache is not None:
+            cache.close()
+        queue.close()
+    return stats
+
+
+def _worker_process(store, options):
+    stats = run_worker(store, **options)
+    print(f"{worker_name()}: {stats['done']} done, {stats['released']} released, "
+          f"{stats['lost']} lost leases", flush=True)
+
+
+def run_workers(store, processes=1, **options):
+    """run_worker in `processes` local processes; returns how many of them failed."""
+    if processes <= 1:
+        _worker_process(store, options)
+        return 0
+    import multiprocessing
+    # spawned, not forked: each worker starts threads (heartbeat) and
+    # pools of its own, and nothing of this process is worth inheriting
+    context = multiprocessing.get_context("spawn")
+    procs = [context.Process(target=_worker_process, args=(store, options)) for _ in range(processes)]
+    for proc in procs:
+        proc.start()
+    try:
+        for proc in procs:
+            proc.join()
+    finally:
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+                proc.join()
+    return sum(proc.exitcode != 0 for proc in procs)
+
+
+def export(store, report_out, output=None, dup_index=None, batch=None):
+    """
+    Report (and, if output is given, the JSON array of records) for every
+    done item, with the duplicate checks over all of them, like full-run.
+    The per-invoice results are the workers' own (their rule set).
+    Returns the report.
+    """
+    queue = WorkQueue(store)
+    invoices = []
+    results = []
+    try:
+        for records, item_results in queue.iter_done():
+            invoices.extend(records)
+            results.extend(item_results)
+    finally:
+        queue.close()
+
+    if output:
+        with metrics.timer("serialize_seconds"), open(output, "w", encoding="utf-8") as f:
+            json.dump(invoices, f, indent=2, ensure_ascii=False)
+    report = validator.report_for(invoices, results, dup_index=dup_index, batch=batch)
+    with metrics.timer("serialize_seconds"), open(report_out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    return report
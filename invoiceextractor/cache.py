@@ -0,0 +1,147 @@
+# invoiceextractor/cache.py
+"""
+On-disk extraction cache.
+
+Maps (PDF content hash, extractor version) to the extracted fields, so
+unchanged PDFs skip pdfplumber completely on re-runs. Entries live in a
+single SQLite file; total size is capped and the least recently used
+entries are evicted first.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# metadata that depends on where the file lives, not on its content
+LOCATION_FIELDS = ("filename", "path")
+
+
+def file_digest(pdf_path, chunk_size=1024 * 1024):
+    """sha256 of the file content, read in chunks."""
+    h = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ExtractionCache:
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)"
+        )
+        self.conn.commit()
+        self.total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def key_for(pdf_path, version):
+        return f"{file_digest(pdf_path)}:{version}"
+
+    def has_many(self, keys):
+        """Return the subset of keys present in the cache (no counters touched)."""
+        found = set()
+        keys = list(keys)
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            found.update(
+                row[0] for row in self.conn.execute(
+                    f"SELECT key FROM entries WHERE key IN ({marks})", chunk
+                )
+            )
+        return found
+
+    def get(self, key):
+        """Return the cached record for key, or None."""
+        row = self.conn.execute(
+            "SELECT value FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.conn.execute(
+            "UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key)
+        )
+        return json.loads(row[0])
+
+    def put(self, key, record):
+        """Store record and enforce the size cap."""
+        # location fields are blanked, not dropped, so a hit keeps key order
+        value = json.dumps(
+            {k: (None if k in LOCATION_FIELDS else v) for k, v in record.items()},
+            ensure_ascii=False,
+        )
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        old = self.conn.execute(
+            "SELECT size FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if old is not None:
+            self.total_bytes -= old[0]
+
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, size, last_used)"
+            " VALUES (?, ?, ?, ?)",
+            (key, value, size, time.time()),
+        )
+        self.total_bytes += size
+        self._evict()
+        self.conn.commit()
+
+    def _evict(self):
+        # drop least recently used entries until we are back under the cap
+        while self.total_bytes > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            for key, size in rows:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self.evictions += 1
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "bytes": self.total_bytes,
+        }
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -109,142 +109,479 @@
 #         "line_items": line_items  # (Empty for now unless needed)
 #     }
 # invoiceextractor/extractor.py
+from functools import partial
 from pathlib import Path
 import json
+import os
+import re
+import time
 import traceback
 
-# --- your extraction functions (pdfplumber) ---
-# If you already have them in another file, you can import instead.
-import pdfplumber
-import re
+# --- your extraction functions ---
+from invoice_qc import metrics
+from invoiceextractor.backends import DEFAULT_BACKEND, open_document
+from invoiceextractor.rules import DEFAULT_RULESET
+from invoiceextractor.tables import LineItemReader
 
-def extract_text(pdf_path):
-    text = ""
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            t = page.extract_text() or ""
-            text += t + "\n"
-    return text
-
-def extract_fields(text):
-    invoice_number = ""
-    invoice_date = ""
-
-    seller_name = ""
-    seller_address = ""
-
-    buyer_name = ""
-    buyer_address = ""
-
-    currency = "EUR"
-
-    subtotal = ""
-    tax_amount = ""
-    total_amount = ""
-
-    line_items = []
-
-    lines = text.split("\n")
-
-    # invoice number
-    for line in lines:
-        match = re.search(r"AUFNR(\d+)", line)
-        if match:
-            invoice_number = "AUFNR" + match.group(1)
-            break
-
-    # invoice date
-    for line in lines:
-        match = re.search(r"(\d{2}\.\d{2}\.\d{4})", line)
-        if match:
-            invoice_date = match.group(1)
-            break
-
-    # buyer block
-    buyer_block = []
-    found = False
-    for line in lines:
-        if "Kundenanschrift" in line:
-            found = True
-            continue
-        if found:
-            if line.strip() == "":
-                break
-            buyer_block.append(line.strip())
-    if buyer_block:
-        buyer_name = buyer_block[0]
-        buyer_address = ", ".join(buyer_block[1:])
-
-    # seller block (heuristic)
-    last_lines = lines[-15:]
-    for idx, line in enumerate(last_lines):
-        if "GmbH" in line or "AG" in line or "KG" in line:
-            seller_name = line.strip()
-            if idx + 1 < len(last_lines):
-                seller_address = last_lines[idx + 1].strip()
-            break
-
-    # totals (heuristic)
-    for line in lines:
-        if "Gesamtwert EUR" in line:
-            subtotal = line.split()[-1]
-        if "MwSt" in line:
-            tax_amount = line.split()[-1]
-        if "inkl. MwSt" in line:
-            total_amount = line.split()[-1]
+# bump whenever extract_text/extract_fields output changes; part of the cache key
+EXTRACTOR_VERSION = "4"
+
+# targeted mode: (top, bottom) of the first page that holds the order
+# number, date and Kundenanschrift box, as fractions of the page height
+HEADER_REGION = (0.0, 0.5)
+
+# split mode: a page starts a new order when it is page 1 of N or names
+# another order number than the pages before it
+PAGE_NUMBER = re.compile(r"Seite\s+(\d+)\s+von\s+\d+")
+ORDER_NUMBER = re.compile(r"AUFNR\d+")
+
+
+def extract_text(pdf_path, targeted=False, backend=None):
+    """
+    Text of every page, one "\n" after each page.
+    pdf_path may also be PDF bytes or a binary file object.
+    targeted=True only lays out what extract_fields needs: the header
+    region of the first page and the whole last page (totals follow the
+    line-item table, so they can sit anywhere on it). Pages in between
+    are never parsed. Single page documents are read in full either way.
+    The header region ends in a blank line, so block fields (the
+    Kundenanschrift address) stop at the region boundary instead of
+    running on into the last page; see parity.check_targeted.
+    backend picks the PDF engine (see backends.py, default DEFAULT_BACKEND).
+    """
+    return _read(pdf_path, targeted, backend, tables=False)[0]
+
+
+def extract_document(pdf_path, targeted=False, backend=None):
+    """
+    (text, line_items): extract_text plus the line-item table (see
+    tables.py), read from the same page layouts. line_items is [] when
+    targeted mode skipped pages of a multi-page document.
+    """
+    return _read(pdf_path, targeted, backend, tables=True)
+
+
+def _read(pdf_path, targeted, backend, tables):
+    parts = []
+    with metrics.timer("pdf_open_seconds"):
+        doc = open_document(pdf_path, backend)
+    with doc:
+        if targeted and doc.page_count > 1:
+            plan = [(0, HEADER_REGION), (doc.page_count - 1, None)]
+            # the table may run over the skipped pages
+            tables = False
+        else:
+            plan = [(index, None) for index in range(doc.page_count)]
+
+        reader = LineItemReader() if tables else None
+        for index, region in plan:
+            with metrics.timer("page_text_seconds"):
+                layout = doc.page_layout(index, region)
+            parts.append(layout.text)
+            # a cut region ends in a blank line: blocks stop at its edge
+            parts.append("\n" if region is None else "\n\n")
+            if reader is not None:
+                with metrics.timer("line_items_seconds"):
+                    reader.feed(layout.lines)
+            # drop the page's cached layout objects before moving on
+            doc.release(index)
+        metrics.inc("pages_parsed", len(plan))
+    return "".join(parts), (reader.items if reader is not None else [])
+
+
+def _starts_document(text, number):
+    page = PAGE_NUMBER.search(text)
+    if page is not None and page.group(1) == "1":
+        return True
+    found = ORDER_NUMBER.search(text)
+    return found is not None and number is not None and found.group(0) != number
+
+
+def iter_documents(pdf_path, backend=None):
+    """
+    Split a PDF holding many orders into its documents, page by page.
+    Yields (text, line_items, first_page, last_page) per order (pages
+    counted from 1) as soon as the page after it shows up, so only the
+    pages of the current order are ever held; every page is released
+    right after its layout. A PDF with one order yields it once.
+    """
+    with metrics.timer("pdf_open_seconds"):
+        doc = open_document(pdf_path, backend)
+    with doc:
+        parts = []
+        reader = number = None
+        first = 0
+        for index in range(doc.page_count):
+            with metrics.timer("page_text_seconds"):
+                layout = doc.page_layout(index)
+            doc.release(index)
+            metrics.inc("pages_parsed")
+
+            if parts and _starts_document(layout.text, number):
+                yield "".join(parts), reader.items, first + 1, index
+                parts = []
+            if not parts:
+                reader = LineItemReader()
+                number = None
+                first = index
+            parts.append(layout.text)
+            parts.append("\n")
+            if number is None:
+                found = ORDER_NUMBER.search(layout.text)
+                number = found.group(0) if found else None
+            with metrics.timer("line_items_seconds"):
+                reader.feed(layout.lines)
+        if parts:
+            yield "".join(parts), reader.items, first + 1, doc.page_count
+
+
+def extract_fields(text, ruleset=None, line_items=None):
+    """
+    Map the raw text onto the invoice schema.
+    Fields come from a compiled RuleSet (see rules.py) evaluated in a
+    single pass; pass your own ruleset to add vendor specific rules.
+    line_items come from the layout (extract_document), not the text.
+    """
+    found = (ruleset or DEFAULT_RULESET).extract(text)
 
     return {
-        "invoice_number": invoice_number,
-        "invoice_date": invoice_date,
-        "seller_name": seller_name,
-        "seller_address": seller_address,
-        "buyer_name": buyer_name,
-        "buyer_address": buyer_address,
-        "currency": currency,
-        "subtotal": subtotal,
-        "tax_amount": tax_amount,
-        "total_amount": total_amount,
-        "line_items": line_items
+        "invoice_number": found.get("invoice_number", ""),
+        "invoice_date": found.get("invoice_date", ""),
+        "seller_name": found.get("seller_name", ""),
+        "seller_address": found.get("seller_address", ""),
+        "buyer_name": found.get("buyer_name", ""),
+        "buyer_address": found.get("buyer_address", ""),
+        "currency": "EUR",
+        "subtotal": found.get("subtotal", ""),
+        "tax_amount": found.get("tax_amount", ""),
+        "total_amount": found.get("total_amount", ""),
+        "line_items": list(line_items or [])
     }
 
 # --- wrapper the CLI expects ---------------------------------
-def extract_folder(pdf_dir, output):
+def _extract_one(pdf_path, text_options=None):
+    """
+    Extract a single PDF into a record.
+    Errors are captured in the record instead of raised, so one bad file
+    never stops a batch (also when running inside a worker process).
+    text_options are passed on to extract_text (e.g. targeted=True).
+    """
+    pdf_path = Path(pdf_path)
+    return _extract_record(str(pdf_path), pdf_path.name, str(pdf_path), text_options)
+
+
+def extract_bytes(data, filename, text_options=None):
+    """_extract_one for an in-memory PDF (e.g. an upload); path is None."""
+    return _extract_record(data, filename, None, text_options)
+
+
+def _record(text, line_items, filename, path):
+    with metrics.timer("extract_fields_seconds"):
+        fields = extract_fields(text, line_items=line_items)
+    metrics.inc("documents_extracted")
+    # attach metadata
+    fields.update({
+        "filename": filename,
+        "path": path,
+        "text_snippet": (text[:1000] if text else "")
+    })
+    return fields
+
+
+def _failed(filename, path):
+    metrics.inc("documents_failed")
+    return {
+        "filename": filename,
+        "path": path,
+        "error": traceback.format_exc()
+    }
+
+
+def _extract_record(source, filename, path, text_options):
+    try:
+        text, line_items = extract_document(source, **(text_options or {}))
+        return _record(text, line_items, filename, path)
+    except Exception:
+        return _failed(filename, path)
+
+
+def iter_split(pdf_path, text_options=None):
+    """
+    One record per order in a multi-order PDF (see iter_documents), with
+    "document" (1, 2, ...) and "pages" ([first, last]) added. A PDF that
+    breaks half way yields the orders before the break, then an error
+    record.
+    """
+    pdf_path = Path(pdf_path)
+    backend = (text_options or {}).get("backend")
+    try:
+        documents = iter_documents(str(pdf_path), backend)
+        for n, (text, line_items, first, last) in enumerate(documents, start=1):
+            rec = _record(text, line_items, pdf_path.name, str(pdf_path))
+            rec.update({"document": n, "pages": [first, last]})
+            yield rec
+    except Exception:
+        yield _failed(pdf_path.name, str(pdf_path))
+
+
+def _split_one(pdf_path, text_options=None):
+    return list(iter_split(pdf_path, text_options))
+
+
+def _iter_records(pdf_files, workers, text_options=None, limits=None, mp_context=None):
+    split = (text_options or {}).get("split")
+    if split:
+        # the page split reads every page in full
+        text_options = {k: v for k, v in text_options.items() if k not in ("split", "targeted")}
+    extract_one = partial(_split_one if split else _extract_one, text_options=text_options)
+    if limits is not None:
+        # every document in a worker that can be killed, even with one worker
+        from invoiceextractor.supervisor import SupervisedPool
+        for result in SupervisedPool(extract_one, workers, limits, mp_context).imap(pdf_files):
+            if isinstance(result, list):
+                yield from result
+            else:
+                yield result
+        return
+    if workers <= 1 or len(pdf_files) <= 1:
+        for pdf_path in pdf_files:
+            if split:
+                # record by record, however many orders the file holds
+                yield from iter_split(pdf_path, text_options)
+            else:
+                yield extract_one(pdf_path)
+        return
+
+    # imported here: single-process runs never pay for multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    # small chunks keep all workers busy while still cutting IPC overhead
+    chunksize = max(1, min(16, len(pdf_files) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+        for result in pool.map(extract_one, pdf_files, chunksize=chunksize):
+            if split:
+                yield from result
+            else:
+                yield result
+
+
+def cache_version(text_options=None):
+    """EXTRACTOR_VERSION plus any text option that changes the output."""
+    opts = "".join(f";{k}={v}" for k, v in sorted((text_options or {}).items()))
+    return EXTRACTOR_VERSION + opts
+
+
+def iter_extract(pdf_files, workers=1, cache=None, text_options=None, limits=None, mp_context=None):
+    """
+    Yield one record per PDF, always in the order of pdf_files.
+    workers > 1 spreads the files over a process pool; workers = 0 uses
+    every available core.
+    With an ExtractionCache, files whose content was extracted before (by
+    the same EXTRACTOR_VERSION) are served from the cache and only the
+    misses are parsed.
+    With supervisor.Limits every document runs under its time/memory
+    budget in supervised workers; files over it get an error record and
+    land in limits.quarantined.
+    mp_context is the multiprocessing context for the worker processes;
+    callers that run threads (the API, the fused full-run, queue
+    workers) pass a "spawn" one, since forking a threaded process can
+    copy held locks into the children.
+    """
+    if workers == 0:
+        workers = os.cpu_count() or 1
+
+    if cache is None or (text_options or {}).get("split"):
+        # split mode: a file's records are not one cache entry
+        yield from _iter_records(pdf_files, workers, text_options, limits, mp_context)
+        return
+
+    version = cache_version(text_options)
+    keys = [cache.key_for(p, version) for p in pdf_files]
+    present = cache.has_many(keys)
+
+    # each distinct missing content is parsed once, in file order
+    queued = set()
+    miss_files = []
+    for pdf_path, key in zip(pdf_files, keys):
+        if key not in present and key not in queued:
+            queued.add(key)
+            miss_files.append(pdf_path)
+    misses = _iter_records(miss_files, workers, text_options, limits, mp_context)
+    # error records by content, so copies of a bad file are not parsed again
+    failed = {}
+
+    for pdf_path, key in zip(pdf_files, keys):
+        rec = cache.get(key)
+        if rec is not None:
+            rec.update({"filename": Path(pdf_path).name, "path": str(pdf_path)})
+            yield rec
+            continue
+
+        if key in queued:
+            queued.discard(key)
+            rec = next(misses)
+        elif key in failed:
+            rec = dict(failed[key], filename=Path(pdf_path).name, path=str(pdf_path))
+        elif limits is not None:
+            # evicted since the lookup
+            rec = next(_iter_records([pdf_path], 1, text_options, limits, mp_context))
+        else:
+            rec = _extract_one(pdf_path, text_options)
+        if "error" in rec:
+            failed[key] = rec
+        else:
+            cache.put(key, rec)
+        yield rec
+
+
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+
+
+def output_format_for(output):
+    """Guess the output format from the file name (json unless .ndjson/.jsonl)."""
+    return "ndjson" if str(output).lower().endswith(NDJSON_SUFFIXES) else "json"
+
+
+def write_ndjson(records, output):
+    """
+    Write records one JSON object per line, flushing after each so the
+    file is usable (and survives a crash) while the run is still going.
+    Returns the number of records written.
+    """
+    count = 0
+    with open(output, "w", encoding="utf-8") as f:
+        for rec in records:
+            with metrics.timer("serialize_seconds"):
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                f.flush()
+            count += 1
+    return count
+
+
+def text_options_for(targeted=False, backend=None, split=False):
+    """extract_text kwargs that differ from the defaults (None if none do); split is for iter_split."""
+    options = {}
+    if targeted:
+        options["targeted"] = True
+    if backend and backend != DEFAULT_BACKEND:
+        options["backend"] = backend
+    if split:
+        options["split"] = True
+    return options or None
+
+
+def open_limits(timeout=None, max_memory_mb=None):
+    """supervisor.Limits for the per-document budget, or None when there is none."""
+    if not timeout and not max_memory_mb:
+        return None
+    from invoiceextractor.supervisor import Limits
+    return Limits(timeout, max_memory_mb)
+
+
+def quarantine_path_for(output):
+    return str(output) + ".quarantine.json"
+
+
+def report_limits(limits, output, quarantine_path=None):
+    """Print the latency/quarantine summary and write the quarantine list."""
+    if limits is None:
+        return
+    quarantine_path = quarantine_path or quarantine_path_for(output)
+    with open(quarantine_path, "w", encoding="utf-8") as f:
+        json.dump(limits.quarantined, f, indent=2, ensure_ascii=False)
+    print(limits.summary() + (f" -> {quarantine_path}" if limits.quarantined else ""))
+
+
+def open_cache(cache_path, cache_max_mb=None):
+    """ExtractionCache for cache_path, or None when caching is off."""
+    if not cache_path:
+        return None
+    from invoiceextractor.cache import DEFAULT_MAX_BYTES, ExtractionCache
+    max_bytes = int(cache_max_mb * 1024 * 1024) if cache_max_mb else DEFAULT_MAX_BYTES
+    return ExtractionCache(cache_path, max_bytes=max_bytes)
+
+
+def extract_folder(pdf_dir, output, workers=1, output_format=None,
+                   cache_path=None, cache_max_mb=None,
+                   incremental=False, manifest_path=None, targeted=False,
+                   backend=None, split=False, timeout=None, max_memory_mb=None,
+                   quarantine_path=None):
     """
     Called by invoice_qc CLI.
     Reads all PDFs in pdf_dir, extracts text+fields using above functions,
     and writes a JSON array to output.
+    workers > 1 runs extraction in a process pool (see iter_extract).
+    output_format="ndjson" streams records to output instead of keeping
+    them in memory; the default is picked from the output file name.
+    cache_path enables the on-disk extraction cache (see cache.py).
+    incremental=True only extracts new/modified PDFs and merges them into
+    the existing output (see incremental.py).
+    targeted=True skips layout of pages/regions the fields never come
+    from (see extract_text).
+    backend overrides the PDF engine (see backends.py).
+    split=True writes one record per order for PDFs that hold many (see
+    iter_split); the extraction cache is not used then.
+    timeout (seconds) / max_memory_mb give each document a budget in
+    supervised workers (see supervisor.py); files over it are listed with
+    the reason in quarantine_path (default: <output>.quarantine.json) and
+    per-document latency percentiles are printed.
+    Returns the list of records (json) or the record count (ndjson).
     """
+    text_options = text_options_for(targeted, backend, split)
+    limits = open_limits(timeout, max_memory_mb)
+
+    if incremental:
+        from invoiceextractor.incremental import extract_incremental
+        stats = extract_incremental(
+            pdf_dir, output, manifest_path=manifest_path, workers=workers,
+            output_format=output_format, cache_path=cache_path,
+            cache_max_mb=cache_max_mb, text_options=text_options, limits=limits,
+        )
+        report_limits(limits, output, quarantine_path)
+        return stats
+
     pdf_dir = Path(pdf_dir)
-    results = []
 
     if not pdf_dir.exists():
         raise FileNotFoundError(f"PDF dir not found: {pdf_dir}")
 
     pdf_files = sorted(pdf_dir.glob("*.pdf"))
-    for pdf_path in pdf_files:
-        try:
-            text = extract_text(str(pdf_path))
-            fields = extract_fields(text)
-            # attach metadata
-            fields.update({
-                "filename": pdf_path.name,
-                "path": str(pdf_path),
-                "text_snippet": (text[:1000] if text else "")
-            })
-            results.append(fields)
-        except Exception:
-            # keep processing remaining PDFs even on error
-            results.append({
-                "filename": pdf_path.name,
-                "path": str(pdf_path),
-                "error": traceback.format_exc()
-            })
+    output_format = output_format or output_format_for(output)
+
+    cache = open_cache(cache_path, cache_max_mb)
+
+    try:
+        start = time.perf_counter()
+        records = iter_extract(pdf_files, workers=workers, cache=cache,
+                               text_options=text_options, limits=limits)
+        if output_format == "ndjson":
+            results = count = write_ndjson(records, output)
+        else:
+            results = list(records)
+            with metrics.timer("serialize_seconds"), open(output, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2, ensure_ascii=False)
+            count = len(results)
+        elapsed = time.perf_counter() - start
+    finally:
+        if cache is not None:
+            cache.close()
+
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"Saved {count} records to {output} ({rate:.1f} files/sec)")
+    if cache is not None:
+        st = cache.stats()
+        print(f"Cache: {st['hits']} hits, {st['misses']} misses, {st['evictions']} evictions")
+    report_limits(limits, output, quarantine_path)
+    return results
 
-    with open(output, "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+def watch_folder(pdf_dir, output, interval=5.0, targeted=False, backend=None, split=False,
+                 timeout=None, max_memory_mb=None, quarantine_path=None, **options):
+    """Keep extracting new PDFs from pdf_dir into output until interrupted."""
+    from invoiceextractor.incremental import watch_folder as _watch
+    text_options = text_options_for(targeted, backend, split)
+    limits = open_limits(timeout, max_memory_mb)
+    _watch(pdf_dir, output, interval=interval, text_options=text_options, limits=limits, **options)
 
-    print(f"Saved {len(results)} records to {output}")
-    return results
 
 # aliases CLI checks for
 extract_pdfs = extract_folder
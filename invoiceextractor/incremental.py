@@ -0,0 +1,173 @@
+# invoiceextractor/incremental.py
+"""
+Incremental extraction.
+
+A manifest next to the output remembers mtime/size/sha256 of every PDF
+that was extracted. Later runs only parse new or modified files and merge
+their records into the existing output; watch_folder repeats that on a
+timer so PDFs are picked up as they land in an inbox folder.
+"""
+from pathlib import Path
+import json
+import os
+import time
+
+from invoiceextractor.cache import file_digest
+from invoiceextractor.extractor import (
+    iter_extract,
+    open_cache,
+    output_format_for,
+)
+from invoice_qc.utils import load_invoices
+
+
+def manifest_path_for(output):
+    return str(output) + ".manifest.json"
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_atomic(path, write):
+    tmp = str(path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def save_manifest(path, manifest):
+    _write_atomic(path, lambda f: json.dump(manifest, f, indent=2, sort_keys=True))
+
+
+def scan_changes(pdf_dir, manifest, settle=0.0):
+    """
+    Compare pdf_dir with the manifest.
+    Returns (changed_paths, removed_names, new_manifest). The hash is only
+    computed when mtime or size moved, so an unchanged archive costs one
+    stat() per file. Files modified less than `settle` seconds ago are
+    left for the next scan (they may still be being copied in).
+    """
+    changed = []
+    new_manifest = {}
+    now = time.time()
+
+    for pdf_path in sorted(Path(pdf_dir).glob("*.pdf")):
+        st = pdf_path.stat()
+        prev = manifest.get(pdf_path.name)
+
+        if prev and prev["mtime"] == st.st_mtime and prev["size"] == st.st_size:
+            new_manifest[pdf_path.name] = prev
+            continue
+        if settle and now - st.st_mtime < settle:
+            # not settled yet: keep the old entry (if any) and look again later
+            if prev:
+                new_manifest[pdf_path.name] = prev
+            continue
+
+        digest = file_digest(pdf_path)
+        entry = {"mtime": st.st_mtime, "size": st.st_size, "sha256": digest}
+        new_manifest[pdf_path.name] = entry
+        if not prev or prev["sha256"] != digest:
+            changed.append(pdf_path)
+
+    removed = [name for name in manifest if name not in new_manifest]
+    return changed, removed, new_manifest
+
+
+def _write_records(f, records, output_format):
+    if output_format == "ndjson":
+        for rec in records:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    else:
+        json.dump(records, f, indent=2, ensure_ascii=False)
+
+
+def extract_incremental(pdf_dir, output, manifest_path=None, workers=1,
+                        output_format=None, cache_path=None, cache_max_mb=None,
+                        settle=0.0, quiet=False, text_options=None, limits=None):
+    """
+    Extract only new/modified PDFs and merge them into output.
+    limits (supervisor.Limits) puts each PDF under a time/memory budget.
+    Records of deleted PDFs are dropped. When the output itself is gone
+    the manifest is ignored and everything is extracted again.
+    Returns a dict with changed/removed/unchanged counts.
+    """
+    pdf_dir = Path(pdf_dir)
+    if not pdf_dir.exists():
+        raise FileNotFoundError(f"PDF dir not found: {pdf_dir}")
+
+    output_format = output_format or output_format_for(output)
+    manifest_path = manifest_path or manifest_path_for(output)
+    manifest = load_manifest(manifest_path) if os.path.exists(output) else {}
+
+    changed, removed, new_manifest = scan_changes(pdf_dir, manifest, settle=settle)
+    stats = {
+        "changed": len(changed),
+        "removed": len(removed),
+        "unchanged": len(new_manifest) - len(changed),
+    }
+    start = time.perf_counter()
+    if not changed and not removed:
+        save_manifest(manifest_path, new_manifest)
+        if not quiet:
+            print(f"Incremental: nothing changed ({stats['unchanged']} files) in {pdf_dir}")
+        return stats
+
+    cache = open_cache(cache_path, cache_max_mb)
+    try:
+        fresh = list(iter_extract(changed, workers=workers, cache=cache,
+                                  text_options=text_options, limits=limits))
+    finally:
+        if cache is not None:
+            cache.close()
+
+    replaced = {rec["filename"] for rec in fresh}
+
+    if output_format == "ndjson" and not removed and not (replaced & set(manifest)):
+        # only brand-new files: append instead of rewriting the archive
+        with open(output, "a", encoding="utf-8") as f:
+            _write_records(f, fresh, output_format)
+    else:
+        existing = load_invoices(output) if os.path.exists(output) else []
+        dropped = replaced | set(removed)
+        merged = [rec for rec in existing if rec.get("filename") not in dropped]
+        merged.extend(fresh)
+        merged.sort(key=lambda rec: rec.get("filename", ""))
+        _write_atomic(output, lambda f: _write_records(f, merged, output_format))
+
+    # the manifest is only advanced once the output is safely written
+    save_manifest(manifest_path, new_manifest)
+
+    if not quiet:
+        elapsed = time.perf_counter() - start
+        print(f"Incremental: {stats['changed']} new/changed, {stats['removed']} removed, "
+              f"{stats['unchanged']} unchanged -> {output} ({elapsed:.2f}s)")
+    return stats
+
+
+def watch_folder(pdf_dir, output, interval=5.0, settle=1.0, **options):
+    """
+    Long-running inbox mode: run extract_incremental every `interval`
+    seconds until interrupted.
+    """
+    print(f"Watching {pdf_dir} every {interval:g}s (Ctrl+C to stop)")
+    limits = options.get("limits")
+    reported = 0
+    try:
+        while True:
+            stats = extract_incremental(pdf_dir, output, settle=settle, quiet=True, **options)
+            if stats["changed"] or stats["removed"]:
+                print(f"{time.strftime('%H:%M:%S')} {stats['changed']} new/changed, "
+                      f"{stats['removed']} removed -> {output}")
+            if limits is not None:
+                for entry in limits.quarantined[reported:]:
+                    print(f"{time.strftime('%H:%M:%S')} quarantined {entry['filename']}: "
+                          f"{entry['reason']} ({entry['detail']})")
+                reported = len(limits.quarantined)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
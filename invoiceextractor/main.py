@@ -1,9 +1,9 @@
-from extractor import extract_text, extract_fields
+from invoiceextractor.extractor import extract_text, extract_fields
 import sys
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python main.py <pdf_path>")
+        print("Usage: python -m invoiceextractor.main <pdf_path>")
         return
 
     pdf_path = sys.argv[1]
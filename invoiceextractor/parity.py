@@ -0,0 +1,118 @@
+# invoiceextractor/parity.py
+"""
+Backend parity check.
+
+Runs extract_text + extract_fields with every installed backend over a
+folder of PDFs and reports, per backend, the time per file and whether the
+extracted fields are identical to the reference backend (pdfplumber).
+
+    python -m invoiceextractor.parity --pdf-dir samplespdf
+
+Exit code is 1 if the default backend does not match the reference.
+
+--targeted-vs-full instead compares targeted mode with a full read on
+the default backend. Every field must match, except that buyer_address
+stops at the header region in targeted mode, so there it only has to be
+the start of the full-mode value (which runs on to the next blank line).
+"""
+from pathlib import Path
+import argparse
+import sys
+import time
+
+from invoiceextractor.backends import DEFAULT_BACKEND, available_backends
+from invoiceextractor.extractor import extract_fields, extract_text
+
+REFERENCE = "pdfplumber"
+
+
+def _fields(pdf_path, backend, targeted):
+    try:
+        return extract_fields(extract_text(str(pdf_path), targeted=targeted, backend=backend))
+    except Exception as e:
+        # unreadable files must fail the same way on every backend
+        return {"error": type(e).__name__}
+
+
+def check(pdf_files, backends=None, repeat=1, targeted=False):
+    """
+    Returns {backend: {"seconds_per_file", "mismatches": [filename, ...]}}.
+    Files every backend fails on count as matching.
+    """
+    backends = backends or available_backends()
+    if REFERENCE not in backends:
+        backends = [REFERENCE] + list(backends)
+
+    expected = {p.name: _fields(p, REFERENCE, targeted) for p in pdf_files}
+    report = {}
+    for backend in backends:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            got = {p.name: _fields(p, backend, targeted) for p in pdf_files}
+        elapsed = time.perf_counter() - start
+
+        mismatches = []
+        for name, fields in got.items():
+            ref = expected[name]
+            if "error" in ref and "error" in fields:
+                continue
+            if fields != ref:
+                mismatches.append(name)
+        report[backend] = {
+            "seconds_per_file": elapsed / max(1, repeat * len(pdf_files)),
+            "mismatches": mismatches,
+        }
+    return report
+
+
+def check_targeted(pdf_files, backend=None):
+    """[filename, ...] whose targeted fields disagree with a full read."""
+    mismatches = []
+    for p in pdf_files:
+        full = _fields(p, backend, False)
+        targeted = _fields(p, backend, True)
+        if "error" in full or "error" in targeted:
+            if full.keys() != targeted.keys():
+                mismatches.append(p.name)
+            continue
+        address = targeted.pop("buyer_address")
+        if not full.pop("buyer_address").startswith(address) or full != targeted:
+            mismatches.append(p.name)
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare PDF backends for speed and field parity")
+    parser.add_argument("--pdf-dir", default="samplespdf")
+    parser.add_argument("--backend", action="append", help="Backend to check (repeatable)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--targeted", action="store_true")
+    parser.add_argument("--targeted-vs-full", action="store_true",
+                        help="Compare targeted mode with a full read instead of backends")
+    args = parser.parse_args()
+
+    pdf_files = sorted(Path(args.pdf_dir).glob("*.pdf"))
+    if not pdf_files:
+        print("No PDFs found in", args.pdf_dir)
+        return 2
+
+    if args.targeted_vs_full:
+        mismatches = check_targeted(pdf_files)
+        print("targeted vs full:", "DIFF: " + ", ".join(mismatches) if mismatches else "OK")
+        return 1 if mismatches else 0
+
+    report = check(pdf_files, args.backend, repeat=args.repeat, targeted=args.targeted)
+
+    ok = [name for name, r in report.items() if not r["mismatches"]]
+    fastest = min(ok, key=lambda n: report[n]["seconds_per_file"]) if ok else None
+    for name, r in sorted(report.items(), key=lambda kv: kv[1]["seconds_per_file"]):
+        status = "OK" if not r["mismatches"] else "DIFF: " + ", ".join(r["mismatches"])
+        marks = (" (default)" if name == DEFAULT_BACKEND else "") + (" <- fastest correct" if name == fastest else "")
+        print(f"{name:12s} {r['seconds_per_file'] * 1000:8.1f} ms/file  {status}{marks}")
+
+    default = report.get(DEFAULT_BACKEND)
+    return 0 if default is None or not default["mismatches"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+# invoiceextractor/rules.py
+"""
+Declarative field-extraction rules.
+
+Each field is described by a FieldRule (anchor regex, what to capture,
+take first/last, optional tail region). A RuleSet compiles all anchors
+into one combined pattern and evaluates every rule while walking the
+lines once:
+
+  - a forward cursor resolves the "first" rules (and block captures),
+  - as soon as those are done, a backward cursor starts at the end of the
+    text and resolves the "last"/tail rules, stopping where the forward
+    cursor stopped.
+
+Every line is looked at by at most one cursor, and lines that match no
+anchor at all are skipped with a single regex call.
+"""
+import re
+
+FIRST = "first"
+LAST = "last"
+
+
+class FieldRule:
+    """
+    capture:
+      "match"         - regex match, expanded with template (default: whole match)
+      "last_token"    - last whitespace separated token of the line
+      "line_and_next" - the stripped line and the line after it (two fields)
+      "block"         - lines after the anchor up to the next blank line;
+                        first line -> fields[0], rest joined -> fields[1]
+    tail: only look at the last `tail` lines of the text.
+    """
+
+    def __init__(self, name, anchor, capture="match", template=None,
+                 take=FIRST, tail=None, fields=None):
+        if capture == "block" and take != FIRST:
+            raise ValueError("block rules can only take the first block")
+        self.name = name
+        self.anchor = anchor
+        self.regex = re.compile(anchor)
+        self.capture = capture
+        self.template = template
+        self.take = take
+        self.tail = tail
+        self.fields = tuple(fields or (name,))
+
+    @property
+    def backward(self):
+        """Resolved by the backward cursor (take-last or tail-region rules)."""
+        return self.take == LAST or self.tail is not None
+
+    def value(self, match, lines, idx):
+        line = lines[idx]
+        if self.capture == "last_token":
+            return (line.split()[-1],)
+        if self.capture == "line_and_next":
+            nxt = lines[idx + 1].strip() if idx + 1 < len(lines) else ""
+            return (line.strip(), nxt)
+        if self.template:
+            return (match.expand(self.template),)
+        return (match.group(0),)
+
+
+class RuleSet:
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.combined = re.compile("|".join(f"(?:{r.anchor})" for r in self.rules))
+        self.by_name = {r.name: r for r in self.rules}
+        self.forward_rules = [r for r in self.rules if not r.backward]
+        self.backward_rules = [r for r in self.rules if r.backward]
+
+    def extract(self, text):
+        """Return {field: value} for every field a rule resolved."""
+        lines = text.split("\n")
+        n = len(lines)
+        combined = self.combined.search
+
+        found = {}          # rule name -> (line index, values)
+        open_blocks = []    # [rule, captured lines] of blocks being captured
+        pending = list(self.forward_rules)
+        # backward rules see the forward lines too, as a fallback
+        watching = [(r, n - r.tail if r.tail is not None else 0)
+                    for r in self.backward_rules]
+
+        # ---- forward cursor ----
+        i = 0
+        while i < n and (pending or open_blocks):
+            line = lines[i]
+            hit = combined(line)
+
+            for entry in tuple(open_blocks):
+                rule, block = entry
+                if hit and rule.regex.search(line):
+                    continue
+                stripped = line.strip()
+                if stripped:
+                    block.append(stripped)
+                else:
+                    found[rule.name] = (i, block)
+                    open_blocks.remove(entry)
+
+            if hit:
+                for rule in tuple(pending):
+                    m = rule.regex.search(line)
+                    if m is None:
+                        continue
+                    pending.remove(rule)
+                    if rule.capture == "block":
+                        open_blocks.append([rule, []])
+                    else:
+                        found[rule.name] = (i, rule.value(m, lines, i))
+                for rule, start in watching:
+                    if i < start or (rule.take != LAST and rule.name in found):
+                        continue
+                    m = rule.regex.search(line)
+                    if m is not None:
+                        found[rule.name] = (i, rule.value(m, lines, i))
+            i += 1
+
+        # blocks still open at the end of the text keep what they captured
+        for rule, block in open_blocks:
+            found[rule.name] = (n, block)
+
+        # ---- backward cursor, from the end down to where forward stopped ----
+        remaining = list(self.backward_rules)
+        j = n - 1
+        while j >= i and remaining:
+            line = lines[j]
+            if combined(line):
+                for rule in list(remaining):
+                    m = rule.regex.search(line)
+                    if m is None:
+                        continue
+                    if rule.tail is None:
+                        # take-last: the first hit from the end wins
+                        found[rule.name] = (j, rule.value(m, lines, j))
+                        remaining.remove(rule)
+                    elif j >= n - rule.tail:
+                        prev = found.get(rule.name)
+                        if prev is None or prev[0] > j:
+                            found[rule.name] = (j, rule.value(m, lines, j))
+            j -= 1
+            # tail rules are done once the cursor leaves their region
+            remaining = [r for r in remaining if r.tail is None or j >= n - r.tail]
+
+        return self._fields(found)
+
+    def _fields(self, found):
+        out = {}
+        for rule in self.rules:
+            if rule.name not in found:
+                continue
+            values = found[rule.name][1]
+            if rule.capture == "block":
+                if values:
+                    out[rule.fields[0]] = values[0]
+                    out[rule.fields[1]] = ", ".join(values[1:])
+            else:
+                out.update(zip(rule.fields, values))
+        return out
+
+
+# layout of the German purchase orders in samplespdf/
+DEFAULT_RULES = [
+    FieldRule("invoice_number", r"AUFNR\d+"),
+    FieldRule("invoice_date", r"\d{2}\.\d{2}\.\d{4}"),
+    FieldRule("buyer", r"Kundenanschrift", capture="block",
+              fields=("buyer_name", "buyer_address")),
+    # seller usually sits in the footer
+    FieldRule("seller", r"GmbH|AG|KG", capture="line_and_next", tail=15,
+              fields=("seller_name", "seller_address")),
+    FieldRule("subtotal", r"Gesamtwert EUR", capture="last_token", take=LAST),
+    FieldRule("tax_amount", r"MwSt", capture="last_token", take=LAST),
+    FieldRule("total_amount", r"inkl\. MwSt", capture="last_token", take=LAST),
+]
+
+DEFAULT_RULESET = RuleSet(DEFAULT_RULES)
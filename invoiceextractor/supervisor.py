@@ -0,0 +1,272 @@
+# invoiceextractor/supervisor.py
+"""
+Supervised extraction workers with per-document limits.
+
+The try/except around each document cannot stop a PDF that makes pdfminer
+spin for minutes or grows memory without end; in a ProcessPoolExecutor
+such a file holds up the batch, and a worker killed from outside breaks
+the whole pool. SupervisedPool gives every worker process one document
+at a time and watches it:
+
+  timeout      wall-clock seconds per document, then the worker is killed
+  memory       resident size of the worker over the budget (read from
+               /proc, so Linux only), or a MemoryError in the extractor
+  crashed      the worker died on its own (segfault, kernel OOM killer)
+  parse_error  the extractor raised; the record carries the traceback
+
+Killed and dead workers are replaced by fresh ones, and every worker is
+recycled after MAX_DOCUMENTS documents so slow leaks do not pile up.
+A batch therefore takes at most about documents * budget / workers, not
+however long the worst file would run.
+
+Offending files end up in Limits.quarantined with the reason, and every
+document's time in Limits.seconds for the tail-latency summary.
+"""
+from collections import deque
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import time
+import traceback
+
+from invoice_qc import metrics
+
+# replace a worker after this many documents
+MAX_DOCUMENTS = 500
+
+# how often worker memory is checked, in seconds
+POLL_INTERVAL = 0.05
+
+# results kept for reordering, per worker
+WINDOW = 64
+
+try:
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = 4096
+
+
+def _rss(pid):
+    """Resident bytes of a process, None where /proc is not available."""
+    try:
+        with open(f"/proc/{pid}/statm", "rb") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class Limits:
+    """
+    Per-document budget (seconds, megabytes; None = unlimited), plus what
+    a run under it collected: quarantined files and document times.
+    """
+
+    def __init__(self, timeout=None, max_memory_mb=None):
+        self.timeout = timeout
+        self.max_memory = int(max_memory_mb * 1024 * 1024) if max_memory_mb else None
+        self.quarantined = []
+        self.seconds = []
+
+    def quarantine(self, pdf_path, reason, seconds, detail):
+        metrics.inc("documents_quarantined", reason=reason)
+        self.quarantined.append({
+            "filename": os.path.basename(str(pdf_path)),
+            "path": str(pdf_path),
+            "reason": reason,
+            "seconds": round(seconds, 3),
+            "detail": detail,
+        })
+
+    def latency(self):
+        """{p50, p95, p99, max} document seconds (empty before any document)."""
+        if not self.seconds:
+            return {}
+        ordered = sorted(self.seconds)
+        return {
+            "p50": _percentile(ordered, 0.50),
+            "p95": _percentile(ordered, 0.95),
+            "p99": _percentile(ordered, 0.99),
+            "max": ordered[-1],
+        }
+
+    def summary(self):
+        """One line for the run summary."""
+        lat = self.latency()
+        parts = ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in lat.items()) or "no documents"
+        reasons = {}
+        for entry in self.quarantined:
+            reasons[entry["reason"]] = reasons.get(entry["reason"], 0) + 1
+        detail = ", ".join(f"{r} {n}" for r, n in sorted(reasons.items()))
+        return (f"Per document: {parts}; {len(self.quarantined)} quarantined"
+                + (f" ({detail})" if detail else ""))
+
+
+def _work(conn, fn):
+    # worker loop: (index, pdf_path) in, (index, seconds, result) out
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        index, pdf_path = task
+        start = time.perf_counter()
+        result = fn(pdf_path)
+        conn.send((index, time.perf_counter() - start, result))
+
+
+def _errors(result):
+    records = result if isinstance(result, list) else [result]
+    return [rec["error"] for rec in records if "error" in rec]
+
+
+class _Worker:
+    def __init__(self, context, fn):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_work, args=(child, fn), daemon=True)
+        self.process.start()
+        child.close()
+        self.task = None
+        self.started = 0.0
+        self.documents = 0
+
+    def give(self, index, pdf_path):
+        self.task = (index, pdf_path)
+        self.started = time.perf_counter()
+        self.documents += 1
+        self.conn.send(self.task)
+
+    def stop(self, kill=False):
+        if kill or self.task is not None:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except OSError:
+                self.process.kill()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class SupervisedPool:
+    """
+    fn(pdf_path) -> record (or list of records) in supervised worker
+    processes; fn must be picklable. mp_context: multiprocessing context
+    for the workers (default: the platform's). imap yields the results in input
+    order, a failure record in place of each document that was stopped.
+    """
+
+    def __init__(self, fn, workers, limits, mp_context=None):
+        self.fn = fn
+        self.size = max(1, workers)
+        self.limits = limits
+        self.context = mp_context or multiprocessing.get_context()
+
+    def _failed(self, pdf_path, reason, seconds, detail):
+        self.limits.quarantine(pdf_path, reason, seconds, detail)
+        return {
+            "filename": os.path.basename(str(pdf_path)),
+            "path": str(pdf_path),
+            "error": f"{reason}: {detail}",
+        }
+
+    def _finish(self, worker, result, seconds):
+        """
+        Book a finished document; a parse error keeps the extractor's
+        record and quarantines the file. Returns the reason, if any.
+        """
+        pdf_path = worker.task[1]
+        worker.task = None
+        self.limits.seconds.append(seconds)
+        errors = _errors(result)
+        if not errors:
+            return None
+        reason = "memory" if any("MemoryError" in e for e in errors) else "parse_error"
+        lines = errors[-1].strip().splitlines()
+        self.limits.quarantine(pdf_path, reason, seconds, lines[-1] if lines else "")
+        return reason
+
+    def _stop(self, worker, reason, detail):
+        """Kill the worker over its document; returns (index, failure record)."""
+        index, pdf_path = worker.task
+        seconds = time.perf_counter() - worker.started
+        self.limits.seconds.append(seconds)
+        worker.stop(kill=True)
+        worker.task = None
+        return index, self._failed(pdf_path, reason, seconds, detail)
+
+    def imap(self, pdf_files):
+        pdf_files = list(pdf_files)
+        limits = self.limits
+        pending = deque(enumerate(pdf_files))
+        done = {}
+        next_out = 0
+        workers = []
+        window = self.size * WINDOW
+        try:
+            while next_out < len(pdf_files):
+                # hand out work, replacing workers that are gone or worn out
+                workers = [w for w in workers if w.process.is_alive() or w.task is not None]
+                for w in [w for w in workers if w.task is None and w.documents >= MAX_DOCUMENTS]:
+                    w.stop()
+                    workers.remove(w)
+                while len(workers) < min(self.size, len(pending) + sum(w.task is not None for w in workers)):
+                    workers.append(_Worker(self.context, self.fn))
+                for w in workers:
+                    if w.task is None and pending and pending[0][0] < next_out + window:
+                        w.give(*pending.popleft())
+
+                busy = [w for w in workers if w.task is not None]
+                now = time.perf_counter()
+                timeout = None
+                if limits.timeout is not None and busy:
+                    timeout = max(0.0, min(w.started + limits.timeout for w in busy) - now)
+                if limits.max_memory is not None:
+                    timeout = POLL_INTERVAL if timeout is None else min(timeout, POLL_INTERVAL)
+                ready = set(wait([w.conn for w in busy] + [w.process.sentinel for w in busy], timeout))
+
+                now = time.perf_counter()
+                for w in busy:
+                    stopped = None
+                    if w.conn in ready:
+                        try:
+                            index, seconds, result = w.conn.recv()
+                        except (EOFError, OSError):
+                            w.process.join(1)
+                            stopped = self._stop(w, "crashed", f"worker exited ({w.process.exitcode})")
+                        else:
+                            done[index] = result
+                            if self._finish(w, result, seconds) == "memory":
+                                # start over with a clean heap
+                                w.stop()
+                    elif w.process.sentinel in ready:
+                        w.process.join(1)
+                        stopped = self._stop(w, "crashed", f"worker exited ({w.process.exitcode})")
+                    elif limits.timeout is not None and now - w.started > limits.timeout:
+                        stopped = self._stop(w, "timeout", f"over {limits.timeout:g}s")
+                    elif limits.max_memory is not None:
+                        rss = _rss(w.process.pid)
+                        if rss is not None and rss > limits.max_memory:
+                            stopped = self._stop(w, "memory", f"{rss / 1048576:.0f} MB, budget "
+                                                              f"{limits.max_memory / 1048576:.0f} MB")
+                    if stopped is not None:
+                        index, result = stopped
+                        done[index] = result
+
+                while next_out in done:
+                    yield done.pop(next_out)
+                    next_out += 1
+        finally:
+            for w in workers:
+                try:
+                    w.stop()
+                except Exception:
+                    traceback.print_exc()
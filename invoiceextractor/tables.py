@@ -0,0 +1,142 @@
+# invoiceextractor/tables.py
+"""
+Line-item table of an order.
+
+The table starts at a header row (Pos., Artikelbeschreibung, Preis in,
+Menge, Einheit, Umrechnung, Bestellwert), repeats that header on every
+page it continues on, and ends at the "Gesamtwert" row. Each item is a
+row with the position and the line total, followed by detail lines
+(Lief.Art.Nr:, Interne Mat.Nr: ... <unit price> pro 1 VE, Kostenstelle:)
+and sometimes the rest of a long description.
+
+LineItemReader is fed the word lines of PageLayout (backends.py), page
+after page, so the table comes out of the same layout pass as the text.
+Words are put into the column whose header they overlap most. A word
+between two headers stays with the word before it when only a space
+apart (same phrase), else goes right when it is a number (amounts are
+right aligned) and left otherwise (descriptions run on).
+"""
+import re
+
+from invoice_qc.utils import parse_amount
+
+# header word -> item field; other header words ("in") widen the column before them
+HEADER_LABELS = {
+    "Pos.": "position",
+    "Artikelbeschreibung": "description",
+    "Preis": "unit_price",
+    "Menge": "quantity",
+    "Einheit": "unit",
+    "Umrechnung": "conversion",
+    "Bestellwert": "line_total",
+}
+ITEM_FIELDS = ("position", "description", "quantity", "unit", "conversion", "unit_price", "line_total")
+TABLE_END = "Gesamtwert"
+
+# widest gap between two words of one phrase, in font heights
+SPACE = 0.6
+
+_NUMBER = re.compile(r"^-?[\d.,]+$")
+
+
+def _is_number(text):
+    return bool(_NUMBER.match(text)) and any(c.isdigit() for c in text)
+
+
+def _columns(line):
+    """[field, x0, x1] per header label, left to right."""
+    columns = []
+    for word in line:
+        field = HEADER_LABELS.get(word["text"])
+        if field is not None:
+            columns.append([field, word["x0"], word["x1"]])
+        elif columns:
+            columns[-1][2] = word["x1"]
+    return columns
+
+
+class LineItemReader:
+    def __init__(self):
+        self.items = []
+        self.columns = None
+        self.current = None
+        self.done = False
+
+    def feed(self, lines):
+        """Read one page's word lines; returns self.items so far."""
+        for line in lines:
+            if self.done:
+                break
+            if line:
+                self._line(line)
+        return self.items
+
+    def _column(self, word, previous):
+        best, overlap = None, 0
+        left = right = None
+        for field, x0, x1 in self.columns:
+            common = min(x1, word["x1"]) - max(x0, word["x0"])
+            if common > overlap:
+                best, overlap = field, common
+            if x1 <= word["x0"]:
+                left = field
+            elif right is None and x0 >= word["x1"]:
+                right = field
+        if best is not None:
+            return best
+        if previous is not None and word["x0"] - previous[0]["x1"] < SPACE * (word["bottom"] - word["top"]):
+            return previous[1]
+        if _is_number(word["text"]):
+            return right or left
+        return left or right
+
+    def _cells(self, line):
+        cells = {}
+        previous = None
+        for word in line:
+            field = self._column(word, previous)
+            cells.setdefault(field, []).append(word["text"])
+            previous = word, field
+        return {field: " ".join(words) for field, words in cells.items()}
+
+    def _line(self, line):
+        first = line[0]["text"]
+        if first == "Pos." and len(_columns(line)) > 2:
+            # (repeated) table header; the units row below it is no item
+            self.columns = _columns(line)
+            self.current = None
+            return
+        if self.columns is None:
+            return
+        if first == TABLE_END:
+            self.done = True
+            self.current = None
+            return
+
+        cells = self._cells(line)
+        position = cells.get("position", "")
+        total = cells.get("line_total", "")
+        if position.isdigit() and parse_amount(total) is not None:
+            self.current = {field: cells.get(field, "") for field in ITEM_FIELDS}
+            self.items.append(self.current)
+            return
+
+        item = self.current
+        if item is None:
+            return
+        if any(word["text"].endswith(":") for word in line):
+            # detail line; the unit price sits in the Preis column or before "pro"
+            if not item["unit_price"]:
+                price = cells.get("unit_price", "")
+                if not _is_number(price):
+                    texts = [word["text"] for word in line]
+                    price = next((a for a, b in zip(texts, texts[1:]) if b == "pro" and _is_number(a)), "")
+                item["unit_price"] = price
+        elif not any(item[field] for field in cells):
+            # the rest of the item row, laid out as a line of its own
+            item.update(cells)
+        elif set(cells) == {"description"}:
+            item["description"] = (item["description"] + " " + cells["description"]).strip()
+        else:
+            # something else (footer, page number): the item is over
+            self.current = None
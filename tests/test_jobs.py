@@ -0,0 +1,43 @@
+import asyncio
+
+from invoice_qc import jobs
+
+
+class Store:
+    """The two JobStore methods iter_result_lines uses."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.status = "running"
+
+    def path(self, job_id, name):
+        return self.folder / name
+
+    def get(self, job_id):
+        return {"status": self.status}
+
+
+def test_result_lines_are_sent_whole(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "RESULT_CHUNK_BYTES", 10)
+    store = Store(tmp_path)
+    lines = [b'{"n": %d}\n' % i for i in range(5)] + [b'{"long": "' + b"x" * 40 + b'"}\n']
+
+    async def write():
+        with open(store.path("job", "results.ndjson"), "wb") as f:
+            for line in lines:
+                # every line arrives in two writes
+                for part in (line[:3], line[3:]):
+                    f.write(part)
+                    f.flush()
+                    await asyncio.sleep(0.01)
+        store.status = "done"
+
+    async def read():
+        writer = asyncio.create_task(write())
+        chunks = [chunk async for chunk in jobs.iter_result_lines(store, "job", poll=0.005)]
+        await writer
+        return chunks
+
+    chunks = asyncio.run(read())
+    assert b"".join(chunks) == b"".join(lines)
+    assert all(chunk.endswith(b"\n") for chunk in chunks)
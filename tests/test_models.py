@@ -0,0 +1,26 @@
+import pytest
+from pydantic import ValidationError
+
+from invoice_qc import models
+
+NDJSON = "application/x-ndjson"
+
+
+def locations(body):
+    with pytest.raises(ValidationError) as e:
+        models.parse_invoices(body, NDJSON)
+    return [error["loc"] for error in e.value.errors()]
+
+
+def test_ndjson_lines():
+    body = b'{"invoice_number": 1}\n\n{"total_amount": "1.234,56"}\r\n'
+    assert models.parse_invoices(body, NDJSON) == [{"invoice_number": "1"}, {"total_amount": "1.234,56"}]
+
+
+def test_two_objects_on_one_line_are_rejected():
+    assert locations(b'{"a": 1},{"b": 2}') == [("line", 1)]
+
+
+def test_errors_name_the_line():
+    body = b'{"a": 1}\n\n{"line_items": 5}\n[1]\n'
+    assert locations(body) == [("line", 3, "line_items"), ("line", 4)]
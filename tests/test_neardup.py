@@ -0,0 +1,70 @@
+import json
+import time
+
+import pytest
+
+from invoice_qc import neardup, streaming, validator
+
+
+def invoice(number, total="76,16", seller="MedEquip Deutschland GmbH", buyer="Freiburg Gesundheitszentrum"):
+    return {"invoice_number": number, "seller_name": seller, "buyer_name": buyer,
+            "invoice_date": "02.05.2022", "total_amount": total}
+
+
+@pytest.mark.parametrize("a, b", [
+    ("12345", "123456"),
+    ("INV-7", "INV-7x"),
+    ("INV-7", "INV 7"),
+])
+def test_stray_character_is_flagged(a, b):
+    assert [(i, j) for i, j, _ in neardup.near_duplicates([invoice(a), invoice(b)])] == [(0, 1)]
+
+
+@pytest.mark.parametrize("a, b", [
+    # a substituted digit: two orders
+    ("AUFNR100001", "AUFNR100002"),
+    ("12345", "1234567"),
+    ("AUFNR34343", "AUFNR99999"),
+])
+def test_different_numbers_are_not_flagged(a, b):
+    assert neardup.near_duplicates([invoice(a), invoice(b)]) == []
+
+
+def test_neighbouring_amount_bucket():
+    assert len(neardup.near_duplicates([invoice("12345", "76,99"), invoice("123456", "77,01")])) == 1
+    assert neardup.near_duplicates([invoice("12345", "76,00"), invoice("123456", "77,50")]) == []
+
+
+def test_other_seller_is_not_flagged():
+    assert neardup.near_duplicates([invoice("12345"), invoice("123456", seller="Other Supplies Ltd")]) == []
+
+
+def test_one_seller_many_orders_is_fast():
+    invoices = [invoice(f"AUFNR{100000 + i}") for i in range(4000)]
+    started = time.perf_counter()
+    assert neardup.near_duplicates(invoices) == []
+    assert time.perf_counter() - started < 5
+
+
+@pytest.fixture
+def batch(tmp_path):
+    invoices = [invoice(f"AUFNR{100000 + i}") for i in range(50)]
+    invoices += [invoice("12345"), invoice("123456", "76,90"), invoice("55")]
+    path = tmp_path / "invoices.json"
+    path.write_text(json.dumps(invoices), encoding="utf-8")
+    return invoices, path
+
+
+def test_streaming_matches_in_memory(batch):
+    invoices, path = batch
+    expected = validator.validate_invoices(invoices)["per_invoice"]
+    assert list(streaming.iter_file_results(path)) == expected
+    assert any(neardup.WARNING in w for r in expected for w in r["warnings"])
+
+
+def test_opt_out(batch, monkeypatch):
+    invoices, path = batch
+    monkeypatch.setattr(validator, "NEAR_DUPLICATES", False)
+    results = validator.validate_invoices(invoices)["per_invoice"]
+    assert not any(neardup.WARNING in w for r in results for w in r["warnings"])
+    assert list(streaming.iter_file_results(path)) == results
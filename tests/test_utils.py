@@ -0,0 +1,81 @@
+import pytest
+
+from invoice_qc import utils
+from invoice_qc.utils import parse_amount
+
+
+@pytest.mark.parametrize("value, expected", [
+    # the number shapes
+    ("1.234,56", 1234.56),
+    ("1,234", 1234.0),
+    ("1,234.56", 1234.56),
+    ("64,00", 64.0),
+    ("0,5", 0.5),
+    ("1234", 1234.0),
+    ("1234.56", 1234.56),
+    (".5", 0.5),
+    ("1.234.567", 1234567.0),
+    ("1 234,56", 1234.56),
+    ("1'234.56", 1234.56),
+    ("1 234,56", 1234.56),
+    # currency and other junk around the number
+    ("₹1200", 1200.0),
+    ("$80", 80.0),
+    ("12,50 EUR", 12.5),
+    ("EUR 1.234,56", 1234.56),
+    (1200, 1200.0),
+])
+def test_shapes(value, expected):
+    assert parse_amount(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("-12,50", -12.5),
+    ("- 12,50", -12.5),
+    ("EUR -12,50", -12.5),
+    ("-€12,50", -12.5),
+    ("€-12,50", -12.5),
+    ("-1,234.56", -1234.56),
+    ("-1'234.56", -1234.56),
+    # trailing minus, SAP style
+    ("12,50-", -12.5),
+    ("1.234,56 -", -1234.56),
+])
+def test_sign_next_to_the_number(value, expected):
+    assert parse_amount(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("Re-Nr 12", 12.0),
+    ("12,50 EUR - netto", 12.5),
+    ("EUR-Betrag 12,50", 12.5),
+])
+def test_hyphens_elsewhere_do_not_negate(value, expected):
+    assert parse_amount(value) == expected
+
+
+@pytest.mark.parametrize("value", ["", None, "abc", "12-5", "1.2.3,4,5", "12,50 / 13,00"])
+def test_unparseable(value):
+    assert parse_amount(value) is None
+
+
+def test_memo_gives_the_same_answers():
+    values = ["EUR -12,50", "12,50-", "1.234,56", "Re-Nr 12"]
+    first = [parse_amount(v) for v in values]
+    assert [parse_amount(v) for v in values] == first
+
+
+def test_trim_tolerates_keys_already_gone(monkeypatch):
+    monkeypatch.setattr(utils, "PARSE_CACHE_SIZE", 8)
+    memo = {str(i): i for i in range(8)}
+    keys = list(memo)
+
+    class Racing(dict):
+        # another thread takes every key just before this one pops it
+        def pop(self, key, *default):
+            dict.pop(self, key, None)
+            return dict.pop(self, key, *default)
+
+    memo = Racing(memo)
+    utils._trim(memo)
+    assert list(memo) == keys[1:]
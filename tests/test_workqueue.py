@@ -0,0 +1,103 @@
+import sqlite3
+
+import pytest
+
+from invoice_qc import workqueue
+from invoice_qc.workqueue import WorkQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = WorkQueue(tmp_path / "queue.sqlite", max_attempts=2)
+    q.add([tmp_path / "a.pdf"])
+    yield q
+    q.close()
+
+
+def attempts(q):
+    return q.conn.execute("SELECT attempts FROM items").fetchone()[0]
+
+
+def test_live_lease_is_not_claimed_again(queue):
+    assert len(queue.claim("a")) == 1
+    assert queue.claim("b") == []
+    assert queue.workers() == {"a": 1}
+
+
+def test_expired_lease_is_claimed_again(queue):
+    # a negative lease is over as soon as it is taken: the worker "died"
+    (first, path), = queue.claim("a", lease_seconds=-1)
+    assert queue.counts()["expired"] == 1
+    (second, again), = queue.claim("b")
+    assert again == path
+    assert second != first
+    assert attempts(queue) == 2
+    assert queue.workers() == {"b": 1}
+
+
+def test_heartbeat_extends_the_lease(queue):
+    (token, _), = queue.claim("a", lease_seconds=-1)
+    assert queue.heartbeat([token], lease_seconds=60) == []
+    assert queue.claim("b") == []
+
+
+def test_complete_is_refused_after_the_lease_was_lost(queue):
+    (slow, _), = queue.claim("slow", lease_seconds=-1)
+    (fast, _), = queue.claim("fast")
+    assert queue.heartbeat([slow]) == [slow]
+    assert not queue.complete(slow, [{"who": "slow"}], [{"is_valid": True}])
+    assert queue.complete(fast, [{"who": "fast"}], [{"is_valid": True}])
+    # the late worker cannot overwrite the result either
+    assert not queue.complete(slow, [{"who": "slow"}], [{"is_valid": True}])
+    assert list(queue.iter_done()) == [([{"who": "fast"}], [{"is_valid": True}])]
+
+
+def test_expired_leases_fail_after_max_attempts(queue):
+    queue.claim("a", lease_seconds=-1)
+    queue.claim("b", lease_seconds=-1)
+    assert queue.claim("c") == []
+    counts = queue.counts()
+    assert counts["failed"] == 1 and counts["leased"] == 0
+    failed, = queue.failed()
+    assert failed["attempts"] == 2
+    assert "lease expired 2 times" in failed["error"]
+
+
+def test_released_items_fail_after_max_attempts(queue):
+    (token, _), = queue.claim("a")
+    queue.release(token, "boom 1")
+    assert queue.counts()["queued"] == 1
+    (token, _), = queue.claim("a")
+    queue.release(token, "boom 2")
+    assert queue.claim("a") == []
+    failed, = queue.failed()
+    assert failed["error"] == "boom 2"
+
+
+def test_heartbeat_survives_store_errors(queue, monkeypatch):
+    calls = []
+    heartbeat = WorkQueue.heartbeat
+
+    def flaky(self, tokens, lease_seconds=workqueue.LEASE_SECONDS):
+        calls.append(tokens)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return heartbeat(self, tokens, lease_seconds)
+
+    monkeypatch.setattr(WorkQueue, "heartbeat", flaky)
+    (token, _), = queue.claim("a", lease_seconds=-1)
+    # driven tick by tick instead of from the thread's timer
+    beat = workqueue._Heartbeat(queue.path, 60)
+    beat.hold([token])
+    try:
+        beat.tick()
+        # the failed tick did not extend the lease
+        assert queue.counts()["expired"] == 1
+        beat.tick()
+        assert len(calls) == 2
+        assert queue.claim("b") == []
+    finally:
+        # run() returns at once when stopped and closes the connection
+        beat.stopped.set()
+        beat.run()
+    assert queue.complete(token, [], [])